@@ -1,11 +1,14 @@
 """API for accessing earthquake data."""
+from atexit import register
 from logging import getLogger, basicConfig
 
 from dotenv import load_dotenv
-from flask import Flask, current_app, request
+from flask import Flask, Response, current_app, request, url_for, stream_with_context
 
 from app_functions import (validate_api_query_argument_names, prepare_query_arguments,
-                           get_connection, get_query_template, query_database)
+                           get_query_template, query_database, close_pool, get_page,
+                           get_export_template, stream_query, generate_export)
+from result_cache import normalise_query_arguments, get_cached_result, get_cache_stats
 
 
 logger = getLogger(__name__)
@@ -17,6 +20,8 @@ basicConfig(
 
 load_dotenv()
 app = Flask(__name__)
+# Return pooled connections to the server when the process exits.
+register(close_pool)
 
 @app.get("/")
 @app.get("/index")
@@ -30,7 +35,8 @@ def index():
 def get_earthquakes():
     """
     Main endpoint for the API.
-    Currently allows for filtering by magnitude and time.
+    Currently allows for filtering by magnitude, time and distance from a point,
+    returning a page of results with a link to the next.
     See documentation.html for more information.
     """
 
@@ -50,18 +56,22 @@ def get_earthquakes():
         return {"error": True,
                 "content": str(e)}, 400
 
-    q = get_query_template()
-    sql_args = prepare_query_arguments(args)
+    sql_args = normalise_query_arguments(prepare_query_arguments(args), args)
+    q = get_query_template(sql_args)
 
-    # Connection made here so that it does not stay open for an
-    # obscenely long time / when not in use.
-    conn = get_connection()
-    res = query_database(conn, q, sql_args)
-    conn.close()
+    # The connection is borrowed from the pool only for the query,
+    # which is skipped if the same query was answered since the last load.
+    res = get_cached_result(sql_args, lambda: query_database(q, sql_args))
 
     if res:
+        page, cursor = get_page(res, sql_args["limit"])
+        next_link = None
+        if cursor:
+            next_link = url_for("get_earthquakes", _external=True,
+                                **{**request.args.to_dict(), "cursor": cursor})
         return {"error": False,
-            "content": res}, 200
+            "content": page,
+            "next": next_link}, 200
 
     # 204 could do with better user feedback.
     # Can it redirect to a page describing what has happened?
@@ -69,6 +79,41 @@ def get_earthquakes():
         "content": []}, 204
 
 
+@app.get("/cache")
+def get_cache():
+    """Returns the result cache's hit rate and counters."""
+    return {"error": False,
+            "content": get_cache_stats()}, 200
+
+
+@app.get("/earthquakes/export")
+def export_earthquakes():
+    """
+    Streams every earthquake matching the same filters as /earthquakes,
+    as newline-delimited JSON or with format=geojson a GeoJSON FeatureCollection.
+    See documentation.html for more information.
+    """
+
+    logger.info("Export requested.")
+    args = request.args.to_dict()
+
+    try:
+        validate_api_query_argument_names(args, "export")
+
+    except (ValueError, TypeError) as e:
+        logger.error("Invalid export: %s", str(e))
+        return {"error": True,
+                "content": str(e)}, 400
+
+    export_format = args.get("format", "ndjson")
+    sql_args = prepare_query_arguments(args)
+    rows = stream_query(get_export_template(sql_args), sql_args)
+
+    # Sent in chunks as rows are read, so the export is never held in memory.
+    return Response(stream_with_context(generate_export(rows, export_format)),
+                    mimetype=("application/geo+json" if export_format == "geojson"
+                              else "application/x-ndjson"))
+
 
 if __name__ == "__main__":
 
@@ -3,10 +3,17 @@
 from os import environ as ENV
 from logging import getLogger, basicConfig
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from json import dumps, loads
+from decimal import Decimal
+from math import radians, degrees, asin, sin, cos
+from threading import Lock
 
 import pandas as pd
 from dotenv import load_dotenv
 from psycopg import Connection, connect, rows
+from psycopg_pool import ConnectionPool
 
 
 logger = getLogger(__name__)
@@ -17,6 +24,22 @@ basicConfig(
     datefmt="%Y-%m-%dT%H:%M:%S"
 )
 
+# The process-wide connection pool, opened on first use.
+connection_pools = {}
+pool_lock = Lock()
+
+EXPORT_FORMATS = ("ndjson", "geojson")
+FILTER_ARGUMENTS = {"lat", "long", "dist", "mag", "start_time", "end_time"}
+# The arguments each endpoint accepts, as paging only applies to /earthquakes
+# and formats only to /earthquakes/export.
+ENDPOINT_ARGUMENTS = {
+    "earthquakes": FILTER_ARGUMENTS | {"limit", "cursor"},
+    "export": FILTER_ARGUMENTS | {"format"}
+}
+EARTH_RADIUS_KM = 6371.0
+# Widens the bounding box so rounding can never exclude an earthquake on its edge.
+BOUNDING_BOX_MARGIN_DEGREES = 0.0001
+
 
 def can_be_converted_to_float(string: str) -> bool:
     """Checks if a string can be converted to a float."""
@@ -56,9 +79,97 @@ def validate_time(time: str) -> bool:
     return True
 
 
-def validate_api_query_argument_names(arguments: dict) -> bool:
+def get_page_settings() -> dict:
+    """Returns the page size settings, which can be overridden in the environment."""
+    return {
+        "default_size": int(ENV.get("API_PAGE_SIZE", 100)),
+        "max_size": int(ENV.get("API_MAX_PAGE_SIZE", 1000))
+    }
+
+
+def validate_limit(limit: int) -> bool:
+    """Checks if something is a valid page size."""
+    logger.debug("Validating limit: %s", limit)
+    max_size = get_page_settings()["max_size"]
+
+    if not isinstance(limit, int) or isinstance(limit, bool):
+        raise TypeError(
+            f"Limit requires an int. Received type {type(limit)}.")
+
+    if not 0 < limit <= max_size:
+        raise ValueError(
+            f"Limit outside of range (1 to {max_size}). Received {limit}.")
+    return True
+
+
+def make_cursor(time: datetime, earthquake_id: int) -> str:
+    """Returns an opaque cursor for the page after the given earthquake."""
+    position = dumps({"time": time.isoformat(), "earthquake_id": int(earthquake_id)})
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def read_cursor(cursor: str) -> dict:
+    """Returns the time and id of the earthquake a cursor continues from, which is older."""
+    try:
+        position = loads(urlsafe_b64decode(cursor.encode()))
+        return {"before_time": datetime.fromisoformat(position["time"]),
+                "before_id": int(position["earthquake_id"])}
+    except Exception:
+        raise ValueError(
+            f"Cursor should be taken from the previous page's next link. Received {cursor}")
+
+
+def validate_cursor(cursor: str) -> bool:
+    """Checks if something is a valid cursor."""
+    logger.debug("Validating cursor: %s", cursor)
+    if not isinstance(cursor, str):
+        raise TypeError(
+            f"Cursor expected a string. Received type {type(cursor)}.")
+    read_cursor(cursor)
+    return True
+
+
+def validate_export_format(export_format: str) -> bool:
+    """Checks if something is a format earthquakes can be exported in."""
+    logger.debug("Validating format: %s", export_format)
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Format should be one of {", ".join(EXPORT_FORMATS)}. Received {export_format}")
+    return True
+
+
+def validate_coordinate(value: float, name: str, limit: float) -> bool:
+    """Checks if something is a valid latitude or longitude within plus or minus the limit."""
+    logger.debug("Validating %s: %s", name, value)
+
+    if not isinstance(value, (float, int)) or isinstance(value, bool):
+        raise TypeError(
+            f"{name.capitalize()} requires a float or int. Received type {type(value)}.")
+
+    if not -limit <= value <= limit:
+        raise ValueError(
+            f"{name.capitalize()} outside of range (-{limit} to {limit}). Received {value}.")
+    return True
+
+
+def validate_distance(distance: float) -> bool:
+    """Checks if something is a valid search radius in km."""
+    logger.debug("Validating distance: %s", distance)
+
+    if not isinstance(distance, (float, int)) or isinstance(distance, bool):
+        raise TypeError(
+            f"Distance requires a float or int. Received type {type(distance)}.")
+
+    if not distance > 0:
+        raise ValueError(
+            f"Distance must be more than 0km. Received {distance}.")
+    return True
+
+
+def validate_api_query_argument_names(arguments: dict,
+                                      endpoint: str = "earthquakes") -> bool:
     """
-    Are they all valid arguments?
+    Are they all valid arguments for the endpoint?
         List of valid arguments, are all the key in there?
         If they have lat, do they have long, vice versa
 
@@ -67,17 +178,30 @@ def validate_api_query_argument_names(arguments: dict) -> bool:
     """
     logger.info("Validating arguments: %s", arguments)
     provided_arguments = set(arguments.keys())
-    acceptable_arguments = {"lat", "long",
-                            "dist", "mag", "start_time", "end_time"}
+    acceptable_arguments = ENDPOINT_ARGUMENTS[endpoint]
 
     if not provided_arguments.issubset(acceptable_arguments):
         logger.error("Unexpected argument. Provided arguments: %s", provided_arguments)
-        return False
-    if any(provided_arguments) in {"lat", "long", "dist"}:
+        raise ValueError(
+            "Unexpected arguments for this endpoint: "
+            f"{", ".join(sorted(provided_arguments - acceptable_arguments))}.")
+    radius_arguments = {"lat", "long", "dist"}
+    if provided_arguments & radius_arguments \
+    and not radius_arguments.issubset(provided_arguments):
         logger.error(
-            "Searching by lat/long/dist not implemented. Provided arguments: %s",
+            "Incomplete lat/long/dist search. Provided arguments: %s",
             provided_arguments)
-        raise NotImplementedError("Searching by lat/long/dist not implemented.")
+        raise ValueError("Searching by distance requires all of lat, long and dist.")
+
+    for name in radius_arguments & provided_arguments:
+        if isinstance(arguments[name], str) \
+        and can_be_converted_to_float(arguments[name]):
+            arguments[name] = float(arguments[name])
+
+    if "lat" in provided_arguments:
+        validate_coordinate(arguments["lat"], "latitude", 90)
+        validate_coordinate(arguments["long"], "longitude", 180)
+        validate_distance(arguments["dist"])
 
     if "mag" in provided_arguments:
         if isinstance(arguments["mag"], str) \
@@ -97,18 +221,96 @@ def validate_api_query_argument_names(arguments: dict) -> bool:
                 "Start date cannot be after end date."
                 f"{arguments["start_time"]}, {arguments["end_time"]}).",)
 
+    if "limit" in provided_arguments:
+        if isinstance(arguments["limit"], str) and arguments["limit"].isdigit():
+            arguments["limit"] = int(arguments["limit"])
+        validate_limit(arguments["limit"])
+
+    if "cursor" in provided_arguments:
+        validate_cursor(arguments["cursor"])
+
+    if "format" in provided_arguments:
+        validate_export_format(arguments["format"])
+
     return True
 
 
-def get_query_template() -> str:
-    """Returns a query to be formatted with %s formatting."""
-    return """
+def get_bounding_box(latitude: float, longitude: float, distance: float) -> dict:
+    """
+    Returns latitude and longitude ranges containing every point within distance km.
+    A circle crossing the antimeridian gets a second longitude range on the far side,
+    otherwise the second range is empty. A circle containing a pole covers every
+    longitude.
+    """
+    angle = distance / EARTH_RADIUS_KM
+    min_latitude = latitude - degrees(angle) - BOUNDING_BOX_MARGIN_DEGREES
+    max_latitude = latitude + degrees(angle) + BOUNDING_BOX_MARGIN_DEGREES
+    box = {"min_latitude": max(min_latitude, -90.0),
+           "max_latitude": min(max_latitude, 90.0),
+           "min_longitude": -180.0, "max_longitude": 180.0,
+           "min_longitude_wrapped": 1.0, "max_longitude_wrapped": 0.0}
+
+    if min_latitude <= -90 or max_latitude >= 90 or sin(angle) >= cos(radians(latitude)):
+        return box
+
+    spread = degrees(asin(sin(angle) / cos(radians(latitude)))) + BOUNDING_BOX_MARGIN_DEGREES
+    min_longitude = longitude - spread
+    max_longitude = longitude + spread
+    if min_longitude < -180:
+        box.update({"min_longitude": -180.0, "max_longitude": max_longitude,
+                    "min_longitude_wrapped": min_longitude + 360,
+                    "max_longitude_wrapped": 180.0})
+    elif max_longitude > 180:
+        box.update({"min_longitude": min_longitude, "max_longitude": 180.0,
+                    "min_longitude_wrapped": -180.0,
+                    "max_longitude_wrapped": max_longitude - 360})
+    else:
+        box.update({"min_longitude": min_longitude, "max_longitude": max_longitude})
+    return box
+
+
+def get_radius_condition(arguments: dict) -> str:
+    """
+    Returns the conditions for earthquakes within the search radius, if there is one.
+    The bounding box narrows the search down on the latitude and longitude index,
+    then the haversine distance is checked exactly for what is left.
+    """
+    if not arguments or "latitude" not in arguments:
+        return ""
+    return f"""
+        AND latitude BETWEEN %(min_latitude)s::NUMERIC AND %(max_latitude)s::NUMERIC
+        AND (longitude BETWEEN %(min_longitude)s::NUMERIC AND %(max_longitude)s::NUMERIC
+            OR longitude BETWEEN %(min_longitude_wrapped)s::NUMERIC
+            AND %(max_longitude_wrapped)s::NUMERIC)
+        AND 2 * {EARTH_RADIUS_KM} * ASIN(LEAST(1, SQRT(
+            POWER(SIN(RADIANS(latitude - %(latitude)s) / 2), 2)
+            + COS(RADIANS(%(latitude)s)) * COS(RADIANS(latitude))
+            * POWER(SIN(RADIANS(longitude - %(longitude)s) / 2), 2)))) <= %(distance)s"""
+
+
+def get_query_template(arguments: dict = None) -> str:
+    """
+    Returns a query to be formatted with %s formatting.
+    A page of earthquakes is read newest first in (time, earthquake_id) order,
+    before the cursor's earthquake if there is one, so clients polling the
+    defaults see new earthquakes on the first page and later pages use the index
+    as cheaply as the first. One row more than the page is read to tell
+    whether there is a next page.
+    """
+    before_cursor = ""
+    if arguments and "before_time" in arguments:
+        before_cursor = "AND (time, earthquake_id) < (%(before_time)s, %(before_id)s)"
+    return f"""
         SELECT * FROM earthquake
         JOIN "state_region_interaction" USING(state_region_interaction_id)
         JOIN "state" USING (state_id)
         JOIN "region" USING (region_id)
         WHERE magnitude > %(magnitude)s
-        AND time BETWEEN %(start_time)s AND %(end_time)s;
+        AND time BETWEEN %(start_time)s AND %(end_time)s
+        {get_radius_condition(arguments)}
+        {before_cursor}
+        ORDER BY time DESC, earthquake_id DESC
+        LIMIT %(limit)s + 1;
         """
 
 
@@ -139,27 +341,147 @@ def prepare_query_arguments(arguments: dict) -> str:
     else:
         prepared_arguments["end_time"] = datetime.now()
 
+    if "lat" in provided_arguments:
+        prepared_arguments["latitude"] = float(arguments["lat"])
+        prepared_arguments["longitude"] = float(arguments["long"])
+        prepared_arguments["distance"] = float(arguments["dist"])
+        prepared_arguments.update(get_bounding_box(
+            prepared_arguments["latitude"], prepared_arguments["longitude"],
+            prepared_arguments["distance"]))
+
+    if "limit" in provided_arguments:
+        prepared_arguments["limit"] = int(arguments["limit"])
+    else:
+        prepared_arguments["limit"] = get_page_settings()["default_size"]
+
+    if "cursor" in provided_arguments:
+        prepared_arguments.update(read_cursor(arguments["cursor"]))
+
     return prepared_arguments
 
 
+def get_export_template(arguments: dict = None) -> str:
+    """
+    Returns a query for every earthquake matching the filters,
+    in time order and without the join ids, to be formatted with %s formatting.
+    """
+    return f"""
+        SELECT earthquake_id, magnitude, latitude, longitude, time, updated, depth,
+        url, felt, tsunami, cdi, mmi, nst, sig, net, dmin, alert, location_source,
+        magnitude_type, state_name, region_name
+        FROM earthquake
+        JOIN "state_region_interaction" USING(state_region_interaction_id)
+        JOIN "state" USING (state_id)
+        JOIN "region" USING (region_id)
+        WHERE magnitude > %(magnitude)s
+        AND time BETWEEN %(start_time)s AND %(end_time)s
+        {get_radius_condition(arguments)}
+        ORDER BY time, earthquake_id;
+        """
+
+
+def get_page(results: list[dict], limit: int) -> tuple[list[dict], str]:
+    """
+    Returns the first limit results, and the cursor for the next page
+    if there were more results, otherwise None.
+    """
+    if len(results) <= limit:
+        return results, None
+    page = results[:limit]
+    return page, make_cursor(page[-1]["time"], page[-1]["earthquake_id"])
+
+
+def get_connection_arguments() -> dict:
+    """
+    Return the arguments for connecting to the database.
+    Queries are planned for their own values even once psycopg prepares them,
+    as a generic plan cannot tell a small radius search from one over a pole.
+    """
+    return {
+        "host": ENV["DB_HOST"],
+        "user": ENV["DB_USER"],
+        "dbname": ENV["DB_NAME"],
+        "port": ENV["DB_PORT"],
+        "password": ENV["DB_PASSWORD"],
+        "options": "-c plan_cache_mode=force_custom_plan",
+        "row_factory": rows.dict_row
+    }
+
+
 def get_connection() -> Connection:
     """Return connection to database."""
     logger.info("Connecting to the database.")
-    return connect(
-        host=ENV["DB_HOST"],
-        user=ENV["DB_USER"],
-        dbname=ENV["DB_NAME"],
-        port=ENV["DB_PORT"],
-        password=ENV["DB_PASSWORD"],
-        row_factory=rows.dict_row
-    )
-
-
-def query_database(connection: Connection, query: str, parameters: dict) -> pd.DataFrame:
-    """Sends a query to the database."""
-    with connection.cursor() as curs:
-        curs.execute(query, parameters)
-        quakes = pd.DataFrame(curs.fetchall())
+    return connect(**get_connection_arguments())
+
+
+def get_pool_settings() -> dict:
+    """Returns the connection pool settings, which can be overridden in the environment."""
+    return {
+        "enabled": ENV.get("DB_POOL", "true") != "false",
+        "min_size": int(ENV.get("DB_POOL_MIN", 1)),
+        "max_size": int(ENV.get("DB_POOL_MAX", 10)),
+        "timeout": float(ENV.get("DB_POOL_TIMEOUT", 10)),
+        "max_idle": float(ENV.get("DB_POOL_MAX_IDLE", 300)),
+        "max_lifetime": float(ENV.get("DB_POOL_MAX_LIFETIME", 3600))
+    }
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Return the process-wide connection pool, opening it on first use.
+    Connections are checked before they are lent out, so ones the server
+    has dropped are replaced rather than failing the request.
+    """
+    with pool_lock:
+        if "api" not in connection_pools:
+            settings = get_pool_settings()
+            logger.info("Opening connection pool of %s to %s connections.",
+                        settings["min_size"], settings["max_size"])
+            connection_pools["api"] = ConnectionPool(
+                kwargs=get_connection_arguments(),
+                min_size=settings["min_size"],
+                max_size=settings["max_size"],
+                timeout=settings["timeout"],
+                max_idle=settings["max_idle"],
+                max_lifetime=settings["max_lifetime"],
+                check=ConnectionPool.check_connection,
+                name="api",
+                open=True)
+        return connection_pools["api"]
+
+
+def close_pool():
+    """Close the connection pool, if it is open, waiting for borrowed connections."""
+    with pool_lock:
+        pool = connection_pools.pop("api", None)
+    if pool is not None:
+        logger.info("Closing connection pool.")
+        pool.close()
+
+
+@contextmanager
+def borrow_connection():
+    """
+    Lend a connection from the pool, or with DB_POOL=false
+    a new connection that is closed afterwards.
+    """
+    if get_pool_settings()["enabled"]:
+        with get_pool().connection() as connection:
+            yield connection
+    else:
+        connection = get_connection()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+
+def query_database(query: str, parameters: dict) -> pd.DataFrame:
+    """Sends a query to the database on a borrowed connection."""
+    with borrow_connection() as connection:
+        with connection.cursor() as curs:
+            curs.execute(query, parameters)
+            quakes = pd.DataFrame(curs.fetchall())
     if quakes.empty:
         return None
 
@@ -168,6 +490,66 @@ def query_database(connection: Connection, query: str, parameters: dict) -> pd.D
         quakes.drop(columns=["state_id", "region_id", "state_region_interaction_id"]))
 
 
+def get_export_chunk_size() -> int:
+    """Returns how many rows to fetch and send at a time when exporting."""
+    return int(ENV.get("EXPORT_CHUNK_SIZE", 2000))
+
+
+def stream_query(query: str, parameters: dict):
+    """
+    Yields lists of rows from a query through a named server-side cursor,
+    so only one chunk is held in memory however many rows match.
+    The connection is borrowed until the rows run out or the generator is closed.
+    """
+    chunk_size = get_export_chunk_size()
+    with borrow_connection() as connection:
+        with connection.cursor(name="earthquake_export") as curs:
+            curs.itersize = chunk_size
+            curs.execute(query, parameters)
+            while rows_chunk := curs.fetchmany(chunk_size):
+                yield rows_chunk
+
+
+def convert_json_value(value):
+    """Converts values json cannot serialise, with NaN as null."""
+    if isinstance(value, Decimal):
+        return None if value.is_nan() else float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot convert {type(value)} to JSON.")
+
+
+def format_ndjson_line(row: dict) -> str:
+    """Formats a row as a line of newline-delimited JSON."""
+    return dumps(row, default=convert_json_value) + "\n"
+
+
+def format_geojson_feature(row: dict) -> str:
+    """Formats a row as a GeoJSON point feature, with depth as the third coordinate."""
+    properties = {key: value for key, value in row.items()
+                  if key not in ("latitude", "longitude", "depth")}
+    return dumps({"type": "Feature",
+                  "geometry": {"type": "Point",
+                               "coordinates": [row["longitude"], row["latitude"],
+                                               row["depth"]]},
+                  "properties": properties}, default=convert_json_value)
+
+
+def generate_export(row_chunks, export_format: str):
+    """Yields the text of an export one chunk of rows at a time."""
+    if export_format == "ndjson":
+        for row_chunk in row_chunks:
+            yield "".join(format_ndjson_line(row) for row in row_chunk)
+        return
+
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = "\n"
+    for row_chunk in row_chunks:
+        yield separator + ",\n".join(format_geojson_feature(row) for row in row_chunk)
+        separator = ",\n"
+    yield "\n]}\n"
+
+
 def format_sql_response_as_json(sql_response: pd.DataFrame) -> str:
     """Format the SQL response as the desired JSON."""
     return sql_response.to_dict(orient="records")
@@ -175,8 +557,8 @@ def format_sql_response_as_json(sql_response: pd.DataFrame) -> str:
 
 if __name__ == "__main__":
     load_dotenv()
-    conn = get_connection()
     received_args = {"start_time": "2025-06-17T01:00:00","end_time":"2025-06-17T03:00:00"}
-    q = get_query_template()
     sql_args = prepare_query_arguments(received_args)
-    print(query_database(conn, q, sql_args))
+    q = get_query_template(sql_args)
+    print(query_database(q, sql_args))
+    close_pool()
@@ -0,0 +1,130 @@
+"""
+Script for load testing the API against the database in .env,
+comparing pooled connections with a new connection per request.
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger, WARNING
+from os import environ as ENV
+from threading import Thread
+from time import perf_counter
+from urllib.request import urlopen
+
+from dotenv import load_dotenv
+from psycopg import Connection
+from werkzeug.serving import make_server
+
+from app import app
+from app_functions import get_connection, close_pool
+
+
+BENCHMARK_URL = "https://benchmark.example/earthquake/"
+# The real looking prefix earlier runs seeded with, so their rows are deleted too.
+LEGACY_BENCHMARK_URL = "https://earthquake.usgs.gov/earthquakes/eventpage/benchmark"
+
+
+def seed_earthquakes(conn: Connection, size: int) -> int:
+    """
+    Make sure there are at least size synthetic earthquakes from the last week,
+    returning how many were added. They are marked by an obviously fake url,
+    and should be removed with delete_seeded_earthquakes once the benchmark is done.
+    """
+    with conn.cursor() as curs:
+        curs.execute("SELECT COUNT(*) AS count FROM earthquake WHERE url LIKE %s;",
+                     (f"{BENCHMARK_URL}%",))
+        existing = curs.fetchone()["count"]
+        curs.execute("""INSERT INTO earthquake
+                     (magnitude, latitude, longitude, time, updated, depth, url,
+                     felt, tsunami, nst, sig, net, magnitude_type,
+                     state_region_interaction_id)
+                     SELECT ROUND((1 + RANDOM() * 6)::NUMERIC, 1),
+                     ROUND((RANDOM() * 180 - 90)::NUMERIC, 4),
+                     ROUND((RANDOM() * 360 - 180)::NUMERIC, 4),
+                     NOW() - RANDOM() * INTERVAL '7 days',
+                     NOW(),
+                     ROUND((RANDOM() * 600)::NUMERIC, 3),
+                     %(url)s || n,
+                     0, FALSE, 30, 300, 'us', 'Mb',
+                     1 + n %% 55
+                     FROM GENERATE_SERIES(%(start)s::INTEGER, %(end)s::INTEGER) AS n;""",
+                     {"url": BENCHMARK_URL, "start": existing + 1, "end": size})
+        added = curs.rowcount
+    conn.commit()
+    return max(added, 0)
+
+
+def delete_seeded_earthquakes(conn: Connection) -> int:
+    """Removes the synthetic earthquakes seed_earthquakes added, returning how many."""
+    with conn.cursor() as curs:
+        curs.execute("DELETE FROM earthquake WHERE url LIKE %s OR url LIKE %s;",
+                     (f"{BENCHMARK_URL}%", f"{LEGACY_BENCHMARK_URL}%"))
+        deleted = curs.rowcount
+    conn.commit()
+    return deleted
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+    """Returns the nearest rank percentile of the values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+def time_request(url: str) -> float:
+    """Returns the seconds taken to fetch a url."""
+    start = perf_counter()
+    with urlopen(url) as response:
+        response.read()
+    return perf_counter() - start
+
+
+def run_load(urls: list[str], clients: int) -> list[float]:
+    """Returns the latencies of requests for each url made by concurrent clients."""
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        return list(executor.map(time_request, urls))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+    getLogger("werkzeug").setLevel(WARNING)
+
+    parser = ArgumentParser(
+        description="Load test the API with and without a connection pool.")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="Number of requests to make in each mode")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50],
+                        help="Numbers of concurrent clients to compare")
+    parser.add_argument("--seed", type=int, default=1000,
+                        help="Number of synthetic earthquakes to make sure exist")
+    parser.add_argument("--query", default="mag=6.5",
+                        help="Query string to request /earthquakes with")
+    args = parser.parse_args()
+
+    with get_connection() as seed_conn:
+        print(f"Seeded {seed_earthquakes(seed_conn, args.seed)} earthquakes.")
+
+    try:
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{server.server_port}/earthquakes?{args.query}"
+
+        for clients in args.clients:
+            for mode in ("false", "true"):
+                ENV["DB_POOL"] = mode
+                ENV["DB_POOL_MAX"] = str(max(clients, 1))
+                close_pool()
+                run_load([endpoint] * clients, clients)
+                start = perf_counter()
+                latencies = run_load([endpoint] * args.requests, clients)
+                seconds = perf_counter() - start
+                print(f"{clients} clients, {'pooled' if mode == 'true' else 'per-request'}: "
+                      f"{args.requests / seconds:.0f} requests/s, "
+                      f"p50 {get_percentile(latencies, 50) * 1000:.1f}ms "
+                      f"p99 {get_percentile(latencies, 99) * 1000:.1f}ms")
+
+        server.shutdown()
+        close_pool()
+    finally:
+        with get_connection() as seed_conn:
+            print(f"Deleted {delete_seeded_earthquakes(seed_conn)} seeded earthquakes.")
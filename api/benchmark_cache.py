@@ -0,0 +1,73 @@
+"""
+Script for load testing clients polling the API with a few
+common queries, with and without the result cache.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from os import environ as ENV
+from random import Random
+from threading import Thread
+from time import perf_counter
+from json import loads
+from urllib.request import urlopen
+
+from dotenv import load_dotenv
+from werkzeug.serving import make_server
+
+from app import app
+from app_functions import get_connection, close_pool
+from benchmark_api import (seed_earthquakes, delete_seeded_earthquakes, get_percentile,
+                           run_load)
+from result_cache import result_cache
+
+
+POLLED_QUERIES = ["", "mag=5.0", "mag=6.0", "mag=4.5&limit=500",
+                  "lat=36.7&long=-119.4&dist=500"]
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+    getLogger("werkzeug").setLevel(WARNING)
+
+    parser = ArgumentParser(description="Load test polling the API with and without the cache.")
+    parser.add_argument("--requests", type=int, default=1000,
+                        help="Number of requests to make in each mode")
+    parser.add_argument("--clients", type=int, default=10,
+                        help="Number of concurrent clients")
+    parser.add_argument("--seed", type=int, default=1000,
+                        help="Number of synthetic earthquakes to make sure exist")
+    args = parser.parse_args()
+
+    with get_connection() as seed_conn:
+        print(f"Seeded {seed_earthquakes(seed_conn, args.seed)} earthquakes.")
+
+    try:
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        Thread(target=server.serve_forever, daemon=True).start()
+        host = f"http://127.0.0.1:{server.server_port}"
+        random = Random(0)
+        urls = [f"{host}/earthquakes?{random.choice(POLLED_QUERIES)}"
+                for _ in range(args.requests)]
+
+        ENV["DB_POOL_MAX"] = str(args.clients)
+        for mode in ("false", "true"):
+            ENV["API_CACHE"] = mode
+            result_cache.clear()
+            start = perf_counter()
+            latencies = run_load(urls, args.clients)
+            seconds = perf_counter() - start
+            with urlopen(f"{host}/cache") as response:
+                stats = loads(response.read())["content"]
+            print(f"{'cached' if mode == 'true' else 'uncached'}: "
+                  f"{args.requests / seconds:.0f} requests/s, "
+                  f"p50 {get_percentile(latencies, 50) * 1000:.1f}ms "
+                  f"p99 {get_percentile(latencies, 99) * 1000:.1f}ms, "
+                  f"hit rate {stats['hit_rate']:.1%}")
+
+        server.shutdown()
+        close_pool()
+    finally:
+        with get_connection() as seed_conn:
+            print(f"Deleted {delete_seeded_earthquakes(seed_conn)} seeded earthquakes.")
@@ -0,0 +1,75 @@
+"""
+Script for measuring the peak memory of exporting earthquakes from the
+database in .env, streaming against building one paged response.
+Each way is ran in a fresh process so their peaks do not mix.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from os import environ as ENV
+from resource import getrusage, RUSAGE_SELF
+from subprocess import run
+from sys import executable
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from app import app
+from app_functions import get_connection, close_pool
+from benchmark_api import seed_earthquakes, delete_seeded_earthquakes
+
+
+QUERY = "mag=0.1&start_time=2000-01-01T00:00:00"
+
+
+def get_peak_rss() -> float:
+    """Returns the peak resident memory of this process in MiB."""
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_export(mode: str, rows: int):
+    """Requests every earthquake in one way, printing the peak memory it took."""
+    client = app.test_client()
+    baseline = get_peak_rss()
+    start = perf_counter()
+    if mode == "buffered":
+        ENV["API_MAX_PAGE_SIZE"] = str(rows)
+        response = client.get(f"/earthquakes?{QUERY}&limit={rows}")
+        size = len(response.data)
+    else:
+        response = client.get(f"/earthquakes/export?{QUERY}&format={mode}",
+                              buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+    seconds = perf_counter() - start
+    close_pool()
+    print(f"{mode}: {size / 2 ** 20:.0f}MiB sent in {seconds:.1f}s, "
+          f"peak RSS {get_peak_rss():.0f}MiB ({baseline:.0f}MiB before the request)")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark the peak memory of exporting earthquakes.")
+    parser.add_argument("--rows", type=int, default=1_000_000,
+                        help="Number of synthetic earthquakes to make sure exist")
+    parser.add_argument("--modes", nargs="+", default=["ndjson", "geojson", "buffered"],
+                        choices=["ndjson", "geojson", "buffered"],
+                        help="Ways of exporting to compare")
+    parser.add_argument("--measure", choices=["ndjson", "geojson", "buffered"],
+                        help="Measure one way in this process")
+    args = parser.parse_args()
+
+    if args.measure:
+        measure_export(args.measure, args.rows)
+    else:
+        with get_connection() as conn:
+            print(f"Seeded {seed_earthquakes(conn, args.rows)} earthquakes.")
+        try:
+            for export_mode in args.modes:
+                run([executable, __file__, "--rows", str(args.rows), "--measure", export_mode],
+                    check=True)
+        finally:
+            with get_connection() as conn:
+                print(f"Deleted {delete_seeded_earthquakes(conn)} seeded earthquakes.")
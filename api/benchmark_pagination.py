@@ -0,0 +1,75 @@
+"""
+Script for benchmarking keyset pagination of /earthquakes against
+OFFSET pagination at increasing depths, on the database in .env.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from time import perf_counter
+
+from dotenv import load_dotenv
+from psycopg import Connection
+
+from app_functions import (get_connection, get_query_template, prepare_query_arguments,
+                           make_cursor, read_cursor)
+from benchmark_api import seed_earthquakes, delete_seeded_earthquakes
+
+
+def time_query(conn: Connection, query: str, parameters: dict, repeats: int) -> tuple[float, list]:
+    """Returns the average seconds to run a query and its rows."""
+    start = perf_counter()
+    for _ in range(repeats):
+        with conn.cursor() as curs:
+            curs.execute(query, parameters)
+            results = curs.fetchall()
+    return (perf_counter() - start) / repeats, results
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark keyset and OFFSET pagination.")
+    parser.add_argument("--seed", type=int, default=200_000,
+                        help="Number of synthetic earthquakes to make sure exist")
+    parser.add_argument("--limit", type=int, default=100,
+                        help="Page size")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="Page numbers to fetch")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Times to run each query")
+    args = parser.parse_args()
+
+    with get_connection() as conn:
+        print(f"Seeded {seed_earthquakes(conn, args.seed)} earthquakes.")
+
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as curs:
+                curs.execute("ANALYZE earthquake;")
+
+            arguments = prepare_query_arguments({"mag": 1.0, "limit": args.limit})
+            offset_query = get_query_template(arguments).replace(
+                "LIMIT %(limit)s + 1", "LIMIT %(limit)s + 1 OFFSET %(offset)s")
+
+            for page in args.pages:
+                offset = (page - 1) * args.limit
+                offset_time, offset_rows = time_query(
+                    conn, offset_query, {**arguments, "offset": offset}, args.repeats)
+
+                keyset_arguments = dict(arguments)
+                if offset:
+                    # The cursor a client holds after reading the previous page.
+                    _, previous = time_query(conn, offset_query,
+                                             {**arguments, "limit": 0, "offset": offset - 1}, 1)
+                    cursor = make_cursor(previous[0]["time"], previous[0]["earthquake_id"])
+                    keyset_arguments.update(read_cursor(cursor))
+                keyset_time, keyset_rows = time_query(
+                    conn, get_query_template(keyset_arguments), keyset_arguments, args.repeats)
+
+                assert offset_rows == keyset_rows, "Keyset and OFFSET pages differ"
+                print(f"Page {page}: OFFSET {offset_time * 1000:.1f}ms, "
+                      f"keyset {keyset_time * 1000:.1f}ms")
+    finally:
+        with get_connection() as conn:
+            print(f"Deleted {delete_seeded_earthquakes(conn)} seeded earthquakes.")
@@ -0,0 +1,82 @@
+"""
+Script for benchmarking radius searches on the database in .env,
+with the bounding box on the latitude and longitude index against
+checking the distance of every earthquake, and that they agree.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from time import perf_counter
+
+from dotenv import load_dotenv
+from psycopg import Connection
+
+from app_functions import (get_connection, get_query_template, prepare_query_arguments,
+                           get_radius_condition)
+from benchmark_api import seed_earthquakes, delete_seeded_earthquakes
+
+
+SEARCHES = {"California": (36.7, -119.4), "Fiji, across the antimeridian": (-17.7, 179.9),
+            "North Pole": (89.5, 0.0)}
+
+
+def get_full_scan_template(arguments: dict) -> str:
+    """Returns the radius search without the bounding box, checking every distance."""
+    full_scan = get_query_template(arguments)
+    radius_condition = get_radius_condition(arguments)
+    distance = radius_condition[radius_condition.index("AND 2 *"):]
+    return full_scan.replace(radius_condition, f"\n        {distance}")
+
+
+def time_query(conn: Connection, query: str, parameters: dict,
+               repeats: int) -> tuple[float, list]:
+    """Returns the average seconds to run a query after a warm up run, and its rows."""
+    with conn.cursor() as curs:
+        curs.execute(query, parameters)
+    start = perf_counter()
+    for _ in range(repeats):
+        with conn.cursor() as curs:
+            curs.execute(query, parameters)
+            results = curs.fetchall()
+    return (perf_counter() - start) / repeats, results
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark indexed and full scan radius searches.")
+    parser.add_argument("--seed", type=int, default=3_000_000,
+                        help="Number of synthetic earthquakes to make sure exist")
+    parser.add_argument("--distances", type=float, nargs="+", default=[50, 500],
+                        help="Search radii in km")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Times to run each query")
+    args = parser.parse_args()
+
+    with get_connection() as conn:
+        print(f"Seeded {seed_earthquakes(conn, args.seed)} earthquakes.")
+
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as curs:
+                curs.execute("ANALYZE earthquake;")
+
+            for name, (latitude, longitude) in SEARCHES.items():
+                for distance in args.distances:
+                    arguments = prepare_query_arguments(
+                        {"mag": 1.0, "start_time": "2000-01-01T00:00:00", "limit": 1000,
+                         "lat": latitude, "long": longitude, "dist": distance})
+                    indexed_time, indexed_rows = time_query(
+                        conn, get_query_template(arguments), arguments, args.repeats)
+                    full_scan_time, full_scan_rows = time_query(
+                        conn, get_full_scan_template(arguments), arguments, args.repeats)
+
+                    assert indexed_rows == full_scan_rows, "Indexed and full scan results differ"
+                    print(f"{name}, {distance:.0f}km: {len(indexed_rows)} earthquakes, "
+                          f"full scan {full_scan_time * 1000:.0f}ms, "
+                          f"indexed {indexed_time * 1000:.1f}ms "
+                          f"({full_scan_time / indexed_time:.0f}x)")
+    finally:
+        with get_connection() as conn:
+            print(f"Deleted {delete_seeded_earthquakes(conn)} seeded earthquakes.")
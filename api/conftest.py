@@ -5,6 +5,18 @@ from pytest import fixture
 from pandas import Timestamp
 
 from app import app
+from result_cache import result_cache, cache_stats, cache_state
+
+
+@fixture(autouse=True)
+def empty_result_cache(monkeypatch):
+    """Starts each test with an empty result cache, turned off unless a test turns it on."""
+    monkeypatch.setenv("API_CACHE", "false")
+    result_cache.clear()
+    cache_stats.update({"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0})
+    cache_state.update({"version": None, "checked": None, "generation": 0})
+    yield
+    result_cache.clear()
 
 
 @fixture(scope="module")
@@ -0,0 +1,151 @@
+"""
+In-process cache of /earthquakes results, so clients polling the same
+filters do not re-run the query until the pipeline loads new data.
+"""
+
+from os import environ as ENV
+from logging import getLogger, basicConfig
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from time import monotonic
+
+from app_functions import borrow_connection
+
+
+logger = getLogger(__name__)
+
+basicConfig(
+    level="DEBUG",
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S"
+)
+
+# Results keyed by query arguments, least recently used first.
+result_cache = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+# The latest updated time and number of earthquakes when last checked, and a generation
+# counting invalidations so results read before one are not cached after it.
+cache_state = {"version": None, "checked": None, "generation": 0}
+cache_lock = Lock()
+
+
+def get_cache_settings() -> dict:
+    """Returns the result cache settings, which can be overridden in the environment."""
+    return {
+        "enabled": ENV.get("API_CACHE", "true") != "false",
+        "ttl": float(ENV.get("API_CACHE_TTL", 60)),
+        "size": int(ENV.get("API_CACHE_SIZE", 256)),
+        "granularity": int(ENV.get("API_CACHE_GRANULARITY", 60)),
+        "check_interval": float(ENV.get("API_CACHE_CHECK_INTERVAL", 5))
+    }
+
+
+def round_time(time: datetime, granularity: int, up: bool = False) -> datetime:
+    """Rounds a time down, or up, to a whole number of seconds of granularity."""
+    step = timedelta(seconds=granularity)
+    remainder = (time - datetime.min.replace(tzinfo=time.tzinfo)) % step
+    if not remainder:
+        return time
+    return time - remainder + step if up else time - remainder
+
+
+def normalise_query_arguments(arguments: dict, provided: dict = None) -> dict:
+    """
+    Widens the time bounds prepare_query_arguments defaulted from the current time
+    out to the cache granularity, so polls with the default bounds a few seconds apart
+    share a result. Bounds in the provided request arguments are kept as they were,
+    as they are already the same between polls and must not let in other earthquakes.
+    """
+    settings = get_cache_settings()
+    if not settings["enabled"] or settings["granularity"] <= 0:
+        return arguments
+    provided = provided or {}
+    normalised = dict(arguments)
+    if "start_time" not in provided:
+        normalised["start_time"] = round_time(arguments["start_time"], settings["granularity"])
+    if "end_time" not in provided:
+        normalised["end_time"] = round_time(arguments["end_time"], settings["granularity"],
+                                            up=True)
+    return normalised
+
+
+def get_cache_key(arguments: dict) -> tuple:
+    """Returns a hashable key for normalised query arguments."""
+    return tuple(sorted(arguments.items()))
+
+
+def get_data_version() -> tuple:
+    """
+    Returns the latest updated time and number of earthquakes, which change whenever
+    the pipeline loads. The count catches backfilled earthquakes and loads committed
+    out of order, whose updated times are below the latest.
+    """
+    with borrow_connection() as connection:
+        with connection.cursor() as curs:
+            curs.execute("SELECT MAX(updated) AS updated, COUNT(*) AS count FROM earthquake;")
+            row = curs.fetchone()
+            return (row["updated"], row["count"])
+
+
+def check_for_new_data(settings: dict):
+    """Empties the cache if the pipeline has loaded since it was last checked."""
+    now = monotonic()
+    with cache_lock:
+        if cache_state["checked"] is not None \
+        and now - cache_state["checked"] < settings["check_interval"]:
+            return
+        cache_state["checked"] = now
+
+    version = get_data_version()
+    with cache_lock:
+        if version != cache_state["version"]:
+            if cache_state["version"] is not None:
+                logger.info("New data loaded, %s earthquakes updated up to %s, "
+                            "emptying result cache.", version[1], version[0])
+                cache_stats["invalidations"] += 1
+            cache_state["version"] = version
+            cache_state["generation"] += 1
+            result_cache.clear()
+
+
+def get_cached_result(arguments: dict, fetch):
+    """
+    Returns the cached result for the query arguments, if it is fresh,
+    otherwise the result of calling fetch, which is then cached.
+    """
+    settings = get_cache_settings()
+    if not settings["enabled"]:
+        return fetch()
+
+    check_for_new_data(settings)
+    key = get_cache_key(arguments)
+    with cache_lock:
+        cached = result_cache.get(key)
+        if cached is not None and monotonic() - cached["stored"] < settings["ttl"]:
+            result_cache.move_to_end(key)
+            cache_stats["hits"] += 1
+            return cached["result"]
+        cache_stats["misses"] += 1
+        generation = cache_state["generation"]
+
+    result = fetch()
+    with cache_lock:
+        if generation == cache_state["generation"]:
+            result_cache[key] = {"result": result, "stored": monotonic()}
+            result_cache.move_to_end(key)
+            while len(result_cache) > settings["size"]:
+                result_cache.popitem(last=False)
+                cache_stats["evictions"] += 1
+    return result
+
+
+def get_cache_stats() -> dict:
+    """Return the cache's counters since the process started."""
+    with cache_lock:
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        return {
+            **cache_stats,
+            "size": len(result_cache),
+            "hit_rate": cache_stats["hits"] / lookups if lookups else 0.0
+        }
@@ -1,14 +1,12 @@
 # pylint: skip-file
 """Unit tests for app.py."""
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 from app import app
 
 
-@patch("app.get_connection")
 @patch("app.query_database")
-def test_site_index_success(fake_query_database, fake_get_connection,
-                            get_test_client):
+def test_site_index_success(fake_query_database, get_test_client):
     """Checks the index returns a documentation page."""
 
     testing_client = get_test_client
@@ -18,14 +16,11 @@ def test_site_index_success(fake_query_database, fake_get_connection,
     assert b"Documentation" in response.data
 
 
-@patch("app.get_connection")
 @patch("app.query_database")
-def test_site_earthquake_blank(fake_query_database, fake_get_connection,
-                               get_test_client):
+def test_site_earthquake_blank(fake_query_database, get_test_client):
     """Checks the earthquake endpoint returns 204 if data is empty."""
 
     fake_query_database.return_value = {}
-    fake_get_connection.return_value = MagicMock()
 
     testing_client = get_test_client
     response = testing_client.get('/earthquakes')
@@ -33,16 +28,153 @@ def test_site_earthquake_blank(fake_query_database, fake_get_connection,
     assert response.status_code == 204
 
 
-@patch("app.get_connection")
 @patch("app.query_database")
-def test_site_earthquake_returns_json(fake_query_database, fake_get_connection,
-                                      get_test_client, example_response):
+def test_site_earthquake_returns_json(fake_query_database, get_test_client,
+                                      example_response):
     """Checks the earthquake endpoint returns 200."""
 
     fake_query_database.return_value = example_response
-    fake_get_connection.return_value = MagicMock()
 
     testing_client = get_test_client
     response = testing_client.get('/earthquakes')
 
     assert response.status_code == 200
+
+
+@patch("app.query_database")
+def test_site_earthquake_next_link(fake_query_database, get_test_client,
+                                   example_response):
+    """Checks a page is cut to the limit with a link to the next page."""
+
+    fake_query_database.return_value = example_response
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes?mag=4.1&limit=2')
+
+    assert response.status_code == 200
+    assert len(response.json["content"]) == 2
+    assert "mag=4.1" in response.json["next"]
+    assert "cursor=" in response.json["next"]
+
+
+@patch("app.query_database")
+def test_site_earthquake_last_page(fake_query_database, get_test_client,
+                                   example_response):
+    """Checks the last page has no next link."""
+
+    fake_query_database.return_value = example_response
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes?limit=5')
+
+    assert response.json["next"] is None
+
+
+def test_site_earthquake_incomplete_radius(get_test_client):
+    """Checks the earthquake endpoint returns 400 for lat without long and dist."""
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes?lat=10')
+
+    assert response.status_code == 400
+
+
+@patch("app.query_database")
+def test_site_earthquake_radius(fake_query_database, get_test_client, example_response):
+    """Checks a radius search is passed to the query."""
+
+    fake_query_database.return_value = example_response
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes?lat=10&long=179&dist=500')
+
+    assert response.status_code == 200
+    query, parameters = fake_query_database.call_args.args
+    assert "%(distance)s" in query
+    assert parameters["distance"] == 500
+
+
+def test_site_earthquake_bad_cursor(get_test_client):
+    """Checks the earthquake endpoint returns 400 for a made up cursor."""
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes?cursor=abc')
+
+    assert response.status_code == 400
+
+
+def test_site_earthquake_limit_too_large(get_test_client, monkeypatch):
+    """Checks the earthquake endpoint returns 400 beyond the maximum page size."""
+
+    monkeypatch.setenv("API_MAX_PAGE_SIZE", "10")
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes?limit=11')
+
+    assert response.status_code == 400
+
+
+@patch("app.stream_query")
+def test_site_export_ndjson(fake_stream_query, get_test_client):
+    """Checks the export endpoint streams newline-delimited JSON."""
+
+    fake_stream_query.return_value = iter([[{"earthquake_id": 1}], [{"earthquake_id": 2}]])
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes/export?mag=5')
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.data == b'{"earthquake_id": 1}\n{"earthquake_id": 2}\n'
+
+
+@patch("app.stream_query")
+def test_site_export_geojson(fake_stream_query, get_test_client):
+    """Checks the export endpoint streams a GeoJSON FeatureCollection."""
+
+    fake_stream_query.return_value = iter(
+        [[{"earthquake_id": 1, "latitude": 1, "longitude": 2, "depth": 3}]])
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes/export?format=geojson')
+
+    assert response.mimetype == "application/geo+json"
+    assert response.json["features"][0]["geometry"]["coordinates"] == [2, 1, 3]
+
+
+def test_site_export_bad_format(get_test_client):
+    """Checks the export endpoint returns 400 for an unknown format."""
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes/export?format=csv')
+
+    assert response.status_code == 400
+
+
+def test_site_earthquake_refuses_format(get_test_client):
+    """Checks the earthquake endpoint returns 400 for the export's format argument."""
+
+    testing_client = get_test_client
+    response = testing_client.get('/earthquakes?format=geojson')
+
+    assert response.status_code == 400
+
+
+@patch("app.stream_query")
+def test_site_export_refuses_paging(fake_stream_query, get_test_client):
+    """Checks the export endpoint returns 400 for paging arguments rather than ignoring them."""
+
+    testing_client = get_test_client
+    for query in ("limit=10", "cursor=abc"):
+        response = testing_client.get(f'/earthquakes/export?{query}')
+        assert response.status_code == 400
+    fake_stream_query.assert_not_called()
+
+
+def test_site_cache_stats(get_test_client):
+    """Checks the cache endpoint returns the hit rate."""
+
+    testing_client = get_test_client
+    response = testing_client.get('/cache')
+
+    assert response.status_code == 200
+    assert response.json["content"]["hit_rate"] == 0.0
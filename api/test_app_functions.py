@@ -3,10 +3,20 @@
 """Unit tests for app_functions.py."""
 
 from app_functions import (can_be_converted_to_float, validate_magnitude,
-                           validate_time, prepare_query_arguments)
+                           validate_time, prepare_query_arguments, get_pool_settings,
+                           borrow_connection, close_pool, query_database,
+                           connection_pools, validate_limit, make_cursor, read_cursor,
+                           get_query_template, get_page,
+                           validate_api_query_argument_names, validate_export_format,
+                           convert_json_value, format_ndjson_line, format_geojson_feature,
+                           generate_export, stream_query, get_bounding_box,
+                           validate_coordinate, validate_distance)
+from decimal import Decimal
+from json import loads
 from datetime import datetime
+from unittest.mock import patch, MagicMock
 
-from pytest import raises
+from pytest import raises, fixture
 
 
 class TestCanBeConvertedToFloat:
@@ -121,13 +131,145 @@ class TestValidateTime:
             validate_time(20120472161700)
 
 
+class TestValidateLimit:
+
+    def test_validate_limit_pos(self):
+        assert validate_limit(50)
+
+    def test_validate_limit_zero(self):
+        with raises(ValueError):
+            validate_limit(0)
+
+    def test_validate_limit_over_max(self, monkeypatch):
+        monkeypatch.setenv("API_MAX_PAGE_SIZE", "100")
+        with raises(ValueError):
+            validate_limit(101)
+
+    def test_validate_limit_type(self):
+        with raises(TypeError):
+            validate_limit("ten")
+
+
+class TestCursor:
+
+    def test_cursor_round_trip(self):
+        time = datetime.fromisoformat("2025-06-17T01:24:35.190000+00:00")
+        assert read_cursor(make_cursor(time, 501)) == {"before_time": time,
+                                                       "before_id": 501}
+
+    def test_read_cursor_invalid(self):
+        with raises(ValueError):
+            read_cursor("not a cursor")
+
+
+class TestValidateRadius:
+
+    def test_validate_coordinate_pos(self):
+        assert validate_coordinate(-90, "latitude", 90)
+
+    def test_validate_coordinate_out_of_range(self):
+        with raises(ValueError):
+            validate_coordinate(180.5, "longitude", 180)
+
+    def test_validate_coordinate_type(self):
+        with raises(TypeError):
+            validate_coordinate("north", "latitude", 90)
+
+    def test_validate_distance_zero(self):
+        with raises(ValueError):
+            validate_distance(0)
+
+
+class TestGetBoundingBox:
+
+    def test_get_bounding_box_contains_circle(self):
+        box = get_bounding_box(36.7, -119.4, 111.2)
+        assert 35.69 < box["min_latitude"] < 35.7
+        assert 37.7 < box["max_latitude"] < 37.71
+        assert box["min_longitude"] < -120.6 and box["max_longitude"] > -118.2
+        assert box["min_longitude_wrapped"] > box["max_longitude_wrapped"]
+
+    def test_get_bounding_box_east_of_antimeridian(self):
+        box = get_bounding_box(-17.7, 179.9, 50)
+        assert box["max_longitude"] == 180
+        assert box["min_longitude_wrapped"] == -180
+        assert -179.7 < box["max_longitude_wrapped"] < -179.5
+
+    def test_get_bounding_box_west_of_antimeridian(self):
+        box = get_bounding_box(-17.7, -179.9, 50)
+        assert box["min_longitude"] == -180
+        assert box["max_longitude_wrapped"] == 180
+        assert 179.5 < box["min_longitude_wrapped"] < 179.7
+
+    def test_get_bounding_box_over_pole(self):
+        box = get_bounding_box(89.5, 0, 100)
+        assert box["max_latitude"] == 90
+        assert (box["min_longitude"], box["max_longitude"]) == (-180, 180)
+
+    def test_get_bounding_box_whole_earth(self):
+        box = get_bounding_box(0, 0, 30000)
+        assert (box["min_latitude"], box["max_latitude"]) == (-90, 90)
+        assert (box["min_longitude"], box["max_longitude"]) == (-180, 180)
+
+
 class TestValidateApiQueryArgumentNames:
-    # def test_validate_api_query_argument_names_1(self):
-    pass
+
+    def test_validate_api_query_argument_names_radius(self):
+        arguments = {"lat": "51.5", "long": "-0.1", "dist": "100"}
+        assert validate_api_query_argument_names(arguments)
+        assert arguments == {"lat": 51.5, "long": -0.1, "dist": 100.0}
+
+    def test_validate_api_query_argument_names_incomplete_radius(self):
+        with raises(ValueError):
+            validate_api_query_argument_names({"lat": "51.5", "long": "-0.1"})
+
+    def test_validate_api_query_argument_names_bad_latitude(self):
+        with raises(ValueError):
+            validate_api_query_argument_names({"lat": "91", "long": "0", "dist": "10"})
+
+    def test_validate_api_query_argument_names_converts_limit(self):
+        arguments = {"limit": "20"}
+        assert validate_api_query_argument_names(arguments)
+        assert arguments["limit"] == 20
+
+    def test_validate_api_query_argument_names_bad_cursor(self):
+        with raises(ValueError):
+            validate_api_query_argument_names({"cursor": "abc"})
+
+    def test_validate_api_query_argument_names_unexpected(self):
+        with raises(ValueError):
+            validate_api_query_argument_names({"magnitude": "5"})
+
+    def test_validate_api_query_argument_names_format_only_for_export(self):
+        assert validate_api_query_argument_names({"format": "geojson"}, "export")
+        with raises(ValueError):
+            validate_api_query_argument_names({"format": "geojson"})
+
+    def test_validate_api_query_argument_names_no_paging_for_export(self):
+        with raises(ValueError):
+            validate_api_query_argument_names({"limit": "20"}, "export")
 
 
 class TestGetQueryTemplate:
-    pass
+
+    def test_get_query_template_first_page(self):
+        query = get_query_template({"limit": 10})
+        assert "before_time" not in query
+        assert "ORDER BY time DESC, earthquake_id DESC" in query
+
+    def test_get_query_template_before_cursor(self):
+        query = get_query_template({"limit": 10, "before_time": datetime.now(),
+                                    "before_id": 1})
+        assert "(time, earthquake_id) < (%(before_time)s, %(before_id)s)" in query
+
+    def test_get_query_template_radius(self):
+        query = get_query_template(prepare_query_arguments(
+            {"lat": 51.5, "long": -0.1, "dist": 100}))
+        assert "latitude BETWEEN %(min_latitude)s" in query
+        assert "<= %(distance)s" in query
+
+    def test_get_query_template_no_radius(self):
+        assert "distance" not in get_query_template(prepare_query_arguments({}))
 
 
 class TestPrepareQueryArguments:
@@ -140,9 +282,175 @@ class TestPrepareQueryArguments:
         prepared_arguments = prepare_query_arguments({"mag": "5.1"})
         assert prepared_arguments["magnitude"] == "5.1"
 
+    def test_prepare_query_arguments_default_limit(self, monkeypatch):
+        monkeypatch.setenv("API_PAGE_SIZE", "25")
+        assert prepare_query_arguments({})["limit"] == 25
+
+    def test_prepare_query_arguments_cursor(self):
+        time = datetime.fromisoformat("2025-06-17T01:24:35+00:00")
+        prepared_arguments = prepare_query_arguments({"cursor": make_cursor(time, 7)})
+        assert prepared_arguments["before_time"] == time
+        assert prepared_arguments["before_id"] == 7
+
+
+    def test_prepare_query_arguments_radius(self):
+        prepared_arguments = prepare_query_arguments({"lat": 51.5, "long": -0.1, "dist": 100})
+        assert prepared_arguments["latitude"] == 51.5
+        assert prepared_arguments["distance"] == 100
+        assert prepared_arguments["min_latitude"] < 51.5 < prepared_arguments["max_latitude"]
+
+
+class TestGetPage:
+
+    def test_get_page_last_page(self):
+        assert get_page([{"earthquake_id": 1}], 1) == ([{"earthquake_id": 1}], None)
+
+    def test_get_page_more_results(self):
+        time = datetime.fromisoformat("2025-06-17T01:24:35+00:00")
+        results = [{"earthquake_id": 1, "time": time},
+                   {"earthquake_id": 2, "time": time}]
+        page, cursor = get_page(results, 1)
+        assert page == results[:1]
+        assert read_cursor(cursor) == {"before_time": time, "before_id": 1}
+
+
+@fixture
+def empty_pools():
+    connection_pools.clear()
+    yield
+    connection_pools.clear()
+
+
+class TestGetPoolSettings:
+
+    def test_get_pool_settings_defaults(self, monkeypatch):
+        monkeypatch.delenv("DB_POOL", raising=False)
+        monkeypatch.delenv("DB_POOL_MAX", raising=False)
+        settings = get_pool_settings()
+        assert settings["enabled"]
+        assert settings["max_size"] == 10
+
+    def test_get_pool_settings_disabled(self, monkeypatch):
+        monkeypatch.setenv("DB_POOL", "false")
+        assert not get_pool_settings()["enabled"]
+
+
+class TestBorrowConnection:
+
+    @patch("app_functions.get_pool")
+    def test_borrow_connection_uses_pool(self, fake_get_pool, monkeypatch):
+        monkeypatch.setenv("DB_POOL", "true")
+        with borrow_connection() as conn:
+            pass
+        assert conn == fake_get_pool().connection().__enter__()
+
+    @patch("app_functions.get_connection")
+    def test_borrow_connection_without_pool_closes(self, fake_get_connection,
+                                                   monkeypatch):
+        monkeypatch.setenv("DB_POOL", "false")
+        with borrow_connection() as conn:
+            assert conn == fake_get_connection.return_value
+        fake_get_connection.return_value.close.assert_called_once()
+
+    @patch("app_functions.get_connection")
+    def test_borrow_connection_without_pool_closes_on_error(self, fake_get_connection,
+                                                            monkeypatch):
+        monkeypatch.setenv("DB_POOL", "false")
+        with raises(ValueError):
+            with borrow_connection():
+                raise ValueError
+        fake_get_connection.return_value.close.assert_called_once()
+
+
+class TestClosePool:
+
+    def test_close_pool_closes_open_pool(self, empty_pools):
+        pool = MagicMock()
+        connection_pools["api"] = pool
+        close_pool()
+        pool.close.assert_called_once()
+        assert "api" not in connection_pools
+
+    def test_close_pool_without_pool(self, empty_pools):
+        close_pool()
+        assert connection_pools == {}
+
 
 class TestQueryDatabase:
-    pass
+
+    @patch("app_functions.borrow_connection")
+    def test_query_database_empty_returns_none(self, fake_borrow_connection):
+        conn = fake_borrow_connection.return_value.__enter__.return_value
+        conn.cursor.return_value.__enter__.return_value.fetchall.return_value = []
+        assert query_database("SELECT 1;", {}) is None
+
+    @patch("app_functions.borrow_connection")
+    def test_query_database_drops_ids(self, fake_borrow_connection):
+        conn = fake_borrow_connection.return_value.__enter__.return_value
+        conn.cursor.return_value.__enter__.return_value.fetchall.return_value = [
+            {"earthquake_id": 1, "state_id": 2, "region_id": 3,
+             "state_region_interaction_id": 4}]
+        assert query_database("SELECT 1;", {}) == [{"earthquake_id": 1}]
+
+
+class TestValidateExportFormat:
+
+    def test_validate_export_format_pos(self):
+        assert validate_export_format("geojson")
+
+    def test_validate_export_format_neg(self):
+        with raises(ValueError):
+            validate_export_format("csv")
+
+
+class TestStreamQuery:
+
+    @patch("app_functions.borrow_connection")
+    def test_stream_query_uses_named_cursor(self, fake_borrow_connection, monkeypatch):
+        monkeypatch.setenv("EXPORT_CHUNK_SIZE", "2")
+        conn = fake_borrow_connection.return_value.__enter__.return_value
+        curs = conn.cursor.return_value.__enter__.return_value
+        curs.fetchmany.side_effect = [[{"a": 1}, {"a": 2}], [{"a": 3}], []]
+        assert list(stream_query("SELECT 1;", {})) == [[{"a": 1}, {"a": 2}], [{"a": 3}]]
+        assert conn.cursor.call_args.kwargs["name"]
+        curs.fetchmany.assert_called_with(2)
+
+
+class TestFormatExport:
+
+    def test_convert_json_value_nan(self):
+        assert convert_json_value(Decimal("NaN")) is None
+
+    def test_convert_json_value_decimal(self):
+        assert convert_json_value(Decimal("4.4")) == 4.4
+
+    def test_convert_json_value_time(self):
+        time = datetime.fromisoformat("2025-06-17T01:24:35+00:00")
+        assert convert_json_value(time) == "2025-06-17T01:24:35+00:00"
+
+    def test_format_ndjson_line(self):
+        assert format_ndjson_line({"magnitude": Decimal("4.4")}) == '{"magnitude": 4.4}\n'
+
+    def test_format_geojson_feature(self):
+        feature = loads(format_geojson_feature(
+            {"earthquake_id": 1, "latitude": Decimal("34.5"),
+             "longitude": Decimal("140.2"), "depth": Decimal("10")}))
+        assert feature["geometry"]["coordinates"] == [140.2, 34.5, 10]
+        assert feature["properties"] == {"earthquake_id": 1}
+
+    def test_generate_export_ndjson(self):
+        chunks = [[{"earthquake_id": 1}, {"earthquake_id": 2}], [{"earthquake_id": 3}]]
+        lines = "".join(generate_export(chunks, "ndjson")).splitlines()
+        assert [loads(line) for line in lines] == [{"earthquake_id": i} for i in (1, 2, 3)]
+
+    def test_generate_export_geojson(self):
+        chunks = [[{"earthquake_id": i, "latitude": 1, "longitude": 2, "depth": 3}]
+                  for i in (1, 2)]
+        collection = loads("".join(generate_export(chunks, "geojson")))
+        assert [f["properties"]["earthquake_id"] for f in collection["features"]] == [1, 2]
+
+    def test_generate_export_geojson_empty(self):
+        assert loads("".join(generate_export([], "geojson")))["features"] == []
 
 
 class TestFormatSQLResponseAsJSON:
@@ -0,0 +1,137 @@
+# pylint: skip-file
+
+"""Unit tests for result_cache.py."""
+
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from pytest import fixture
+
+from result_cache import (round_time, normalise_query_arguments, get_cache_key,
+                          get_cached_result, get_cache_stats, check_for_new_data,
+                          get_cache_settings, get_data_version, result_cache)
+
+
+@fixture
+def cache_on(monkeypatch):
+    monkeypatch.setenv("API_CACHE", "true")
+    monkeypatch.setenv("API_CACHE_CHECK_INTERVAL", "0")
+    with patch("result_cache.get_data_version") as fake_get_data_version:
+        fake_get_data_version.return_value = (datetime(2025, 6, 17), 100)
+        yield fake_get_data_version
+
+
+class TestRoundTime:
+
+    def test_round_time_down(self):
+        assert round_time(datetime(2025, 6, 17, 1, 2, 59), 60) == datetime(2025, 6, 17, 1, 2)
+
+    def test_round_time_up(self):
+        assert round_time(datetime(2025, 6, 17, 1, 2, 1), 60, up=True) \
+            == datetime(2025, 6, 17, 1, 3)
+
+    def test_round_time_whole(self):
+        assert round_time(datetime(2025, 6, 17, 1, 0), 3600, up=True) \
+            == datetime(2025, 6, 17, 1, 0)
+
+
+class TestNormaliseQueryArguments:
+
+    def test_normalise_query_arguments_shares_key(self, cache_on):
+        first = normalise_query_arguments({"magnitude": 4.0,
+                                           "start_time": datetime(2025, 6, 10, 1, 2, 3),
+                                           "end_time": datetime(2025, 6, 17, 1, 2, 3)})
+        second = normalise_query_arguments({"magnitude": 4.0,
+                                            "start_time": datetime(2025, 6, 10, 1, 2, 40),
+                                            "end_time": datetime(2025, 6, 17, 1, 2, 40)})
+        assert get_cache_key(first) == get_cache_key(second)
+        assert first["end_time"] == datetime(2025, 6, 17, 1, 3)
+
+    def test_normalise_query_arguments_keeps_provided_bounds(self, cache_on):
+        arguments = {"magnitude": 4.0,
+                     "start_time": datetime(2025, 6, 10, 1, 0, 30),
+                     "end_time": datetime(2025, 6, 17, 1, 2, 3)}
+        result = normalise_query_arguments(arguments,
+                                           {"start_time": "2025-06-10T01:00:30"})
+        assert result["start_time"] == datetime(2025, 6, 10, 1, 0, 30)
+        assert result["end_time"] == datetime(2025, 6, 17, 1, 3)
+
+    def test_normalise_query_arguments_disabled(self):
+        arguments = {"start_time": datetime(2025, 6, 10, 1, 2, 3)}
+        assert normalise_query_arguments(arguments) is arguments
+
+
+class TestGetCachedResult:
+
+    def test_get_cached_result_hit(self, cache_on):
+        fetch = MagicMock(return_value=[{"earthquake_id": 1}])
+        assert get_cached_result({"magnitude": 4.0}, fetch) == [{"earthquake_id": 1}]
+        assert get_cached_result({"magnitude": 4.0}, fetch) == [{"earthquake_id": 1}]
+        fetch.assert_called_once()
+        assert get_cache_stats()["hit_rate"] == 0.5
+
+    def test_get_cached_result_disabled(self):
+        fetch = MagicMock(return_value=[])
+        get_cached_result({"magnitude": 4.0}, fetch)
+        get_cached_result({"magnitude": 4.0}, fetch)
+        assert fetch.call_count == 2
+
+    def test_get_cached_result_expires(self, cache_on, monkeypatch):
+        monkeypatch.setenv("API_CACHE_TTL", "0")
+        fetch = MagicMock(return_value=[])
+        get_cached_result({"magnitude": 4.0}, fetch)
+        get_cached_result({"magnitude": 4.0}, fetch)
+        assert fetch.call_count == 2
+
+    def test_get_cached_result_evicts_least_recent(self, cache_on, monkeypatch):
+        monkeypatch.setenv("API_CACHE_SIZE", "2")
+        fetch = MagicMock(return_value=[])
+        for magnitude in (4.0, 5.0, 4.0, 6.0):
+            get_cached_result({"magnitude": magnitude}, fetch)
+        assert list(result_cache) == [get_cache_key({"magnitude": 4.0}),
+                                      get_cache_key({"magnitude": 6.0})]
+        assert get_cache_stats()["evictions"] == 1
+
+    def test_get_cached_result_invalidated_by_load(self, cache_on):
+        fetch = MagicMock(return_value=[])
+        get_cached_result({"magnitude": 4.0}, fetch)
+        cache_on.return_value = (datetime(2025, 6, 18), 101)
+        get_cached_result({"magnitude": 4.0}, fetch)
+        assert fetch.call_count == 2
+        assert get_cache_stats()["invalidations"] == 1
+
+    def test_get_cached_result_invalidated_by_backfill(self, cache_on):
+        fetch = MagicMock(return_value=[])
+        get_cached_result({"magnitude": 4.0}, fetch)
+        cache_on.return_value = (datetime(2025, 6, 17), 101)
+        get_cached_result({"magnitude": 4.0}, fetch)
+        assert fetch.call_count == 2
+        assert get_cache_stats()["invalidations"] == 1
+
+    def test_get_cached_result_not_stored_across_load(self, cache_on):
+        def fetch_during_load():
+            cache_on.return_value = (datetime(2025, 6, 18), 101)
+            check_for_new_data(get_cache_settings())
+            return []
+
+        get_cached_result({"magnitude": 4.0}, fetch_during_load)
+        assert len(result_cache) == 0
+
+
+class TestCheckForNewData:
+
+    def test_check_for_new_data_waits_for_interval(self, cache_on, monkeypatch):
+        monkeypatch.setenv("API_CACHE_CHECK_INTERVAL", "60")
+        check_for_new_data(get_cache_settings())
+        check_for_new_data(get_cache_settings())
+        cache_on.assert_called_once()
+
+    def test_get_data_version_counts_earthquakes(self):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = {"updated": datetime(2025, 6, 17), "count": 100}
+        connection = MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+        with patch("result_cache.borrow_connection") as fake_borrow_connection:
+            fake_borrow_connection.return_value.__enter__.return_value = connection
+            assert get_data_version() == (datetime(2025, 6, 17), 100)
+        assert "COUNT(*)" in cursor.execute.call_args[0][0]
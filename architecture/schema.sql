@@ -1,3 +1,5 @@
+DROP TABLE IF EXISTS subscription_topic;
+DROP TABLE IF EXISTS pipeline_state;
 DROP TABLE IF EXISTS earthquake;
 DROP TABLE IF EXISTS state;
 DROP TABLE IF EXISTS region;
@@ -35,7 +37,7 @@ CREATE TABLE earthquake (
     time TIMESTAMPTZ NOT NULL,
     updated TIMESTAMPTZ,
     depth DECIMAL,
-    url VARCHAR(255),
+    url VARCHAR(255) CONSTRAINT earthquake_url_key UNIQUE,
     felt INTEGER,
     tsunami BOOLEAN,
     cdi DECIMAL,
@@ -48,4 +50,26 @@ CREATE TABLE earthquake (
     location_source location_source,
     magnitude_type magnitude_type,
     state_region_interaction_id SMALLINT REFERENCES state_region_interaction(state_region_interaction_id)
-);
\ No newline at end of file
+);
+
+-- Lets the API read a page of earthquakes in time order from any cursor.
+CREATE INDEX earthquake_time_id_idx ON earthquake (time, earthquake_id);
+
+-- Lets the API narrow a radius search down to a bounding box.
+CREATE INDEX earthquake_latitude_longitude_idx ON earthquake (latitude, longitude);
+
+-- Lets the API check for newly loaded earthquakes without scanning the table.
+CREATE INDEX earthquake_updated_idx ON earthquake (updated);
+
+CREATE TABLE pipeline_state (
+    state_key VARCHAR(100) PRIMARY KEY,
+    updated TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE subscription_topic (
+    topic_arn VARCHAR(256) PRIMARY KEY,
+    magnitude DECIMAL(3, 1) NOT NULL,
+    latitude DECIMAL(7, 4) NOT NULL,
+    longitude DECIMAL(8, 4) NOT NULL,
+    radius INTEGER NOT NULL
+);
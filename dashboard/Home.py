@@ -4,7 +4,8 @@ from dotenv import load_dotenv
 import streamlit as st
 
 from data import (get_counts_by_region, get_data, get_counts_by_state,
-                  get_international_data)
+                  get_international_data, get_data_mode, get_data_version,
+                  get_state_counts, get_region_counts)
 from charts import get_state_choropleth, get_region_treemap
 
 
@@ -46,17 +47,21 @@ def serve_dash():
             """
         )
     try:
-        earthquakes = get_data()
-        if not earthquakes.empty:
-            st.markdown("# Earthquake Quantity by State")
+        if get_data_mode() == "server":
+            version = get_data_version()
+            state_counts = get_state_counts(version)
+            region_counts = get_region_counts(version)
+        else:
+            earthquakes = get_data()
             state_counts = get_counts_by_state(earthquakes)
+            region_counts = get_counts_by_region(get_international_data(earthquakes))
+        if not state_counts.empty:
+            st.markdown("# Earthquake Quantity by State")
             fig = get_state_choropleth(state_counts)
             st.plotly_chart(fig)
 
             st.markdown("# Earthquake Quantity by Country")
-            international_quakes = get_international_data(earthquakes)
-            state_counts = get_counts_by_region(international_quakes)
-            fig = get_region_treemap(state_counts)
+            fig = get_region_treemap(region_counts)
             st.plotly_chart(fig, theme="streamlit")
     except Exception as err:
         st.error(f"Cannot return data from database: {err}")
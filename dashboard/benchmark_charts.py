@@ -0,0 +1,124 @@
+"""
+Script for measuring the size of the Vega-Lite specs the dashboard's charts
+send to the browser, built from every earthquake against their counts,
+and checking both render the same.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from logging import getLogger, WARNING
+from random import Random
+from time import perf_counter
+
+from altair import Chart, X, Y, Color, Tooltip, data_transformers
+from pandas import DataFrame
+from PIL import Image, ImageChops
+from vl_convert import vegalite_to_png
+
+from data import CHART_COLUMNS, get_daily_counts, get_magnitude_counts
+from charts import get_earthquakes_over_time, get_earthquake_count_by_magnitude
+
+
+def make_sample_data(rng: Random, size: int, days: int, groups: int) -> DataFrame:
+    """Return earthquakes spread over the days, in the given number of regions."""
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    rows = [(i, round(min(9.0, rng.expovariate(1.0) + 0.5), 2),
+             rng.uniform(-70, 80), rng.uniform(-180, 180),
+             start + timedelta(seconds=rng.uniform(0, days * 86400)),
+             "Not in the USA", f"Region {rng.randrange(groups)}") for i in range(size)]
+    return DataFrame(rows, columns=CHART_COLUMNS)
+
+
+def get_raw_earthquakes_over_time(data: DataFrame, group_by: str = "region") -> Chart:
+    """Return the earthquakes over time chart counted in the browser, as it was."""
+    group_field = f"{group_by}_name:N"
+    group_title = group_by.capitalize()
+    line = Chart(data).mark_line().encode(
+        x=X("yearmonthdate(time):T", title="Date"),
+        y=Y("count():Q", title="Number of Earthquakes"),
+        color=Color(group_field, title=group_title))
+    points = Chart(data).mark_circle(size=30).encode(
+        x="yearmonthdate(time):T", y="count():Q", color=group_field,
+        tooltip=[Tooltip("yearmonthdate(time):T", title="Date"),
+                 Tooltip(group_field, title=group_title),
+                 Tooltip("count():Q", title="Number of Earthquakes")])
+    return (line + points).properties(title="Earthquakes Over Time", width=800, height=600)
+
+
+def get_raw_earthquake_count_by_magnitude(data: DataFrame) -> Chart:
+    """Return the magnitude chart counted in the browser, as it was."""
+    data = data.assign(rounded_mag=data["magnitude"].astype(float).round(1))
+    return Chart(data).mark_bar().encode(
+        x=X("rounded_mag:Q", title="Magnitude").scale(
+            domain=[data["rounded_mag"].min(), data["rounded_mag"].max()]),
+        y=Y("count():Q", title="Number of Earthquakes"),
+        tooltip=[Tooltip("rounded_mag", title="Magnitude"),
+                 Tooltip("count()", title="Number of Earthquakes")]
+    ).properties(title="Earthquake Count by Magnitude")
+
+
+def render(chart: Chart) -> Image.Image:
+    """Return the image the chart renders to."""
+    return Image.open(BytesIO(vegalite_to_png(chart.to_dict()))).convert("RGB")
+
+
+def renders_identically(first: Chart, second: Chart, tolerance: int = 2) -> bool:
+    """
+    Return whether two charts render to the same image, allowing colours
+    to differ by the tolerance where edges are anti-aliased slightly differently.
+    """
+    first_image, second_image = render(first), render(second)
+    if first_image.size != second_image.size:
+        return False
+    return all(high <= tolerance
+               for _, high in ImageChops.difference(first_image, second_image).getextrema())
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+    data_transformers.disable_max_rows()
+
+    parser = ArgumentParser(description="Measure chart spec sizes before and after counting.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000],
+                        help="Numbers of earthquakes to chart")
+    parser.add_argument("--days", type=int, default=90,
+                        help="Number of days the earthquakes are spread over")
+    parser.add_argument("--groups", type=int, default=50,
+                        help="Number of regions")
+    parser.add_argument("--render-rows", type=int, default=5000,
+                        help="Number of earthquakes to check the charts render the same for")
+    args = parser.parse_args()
+
+    random = Random(0)
+    # Sorted by region, as the order lines are drawn in follows the order of the rows.
+    render_data = make_sample_data(random, args.render_rows, args.days, args.groups) \
+        .sort_values(["region_name", "time"])
+    assert renders_identically(get_raw_earthquakes_over_time(render_data),
+                               get_earthquakes_over_time(get_daily_counts(render_data))), \
+        "Earthquakes over time charts render differently"
+    assert renders_identically(get_raw_earthquake_count_by_magnitude(render_data),
+                               get_earthquake_count_by_magnitude(
+                                   get_magnitude_counts(render_data))), \
+        "Earthquake count by magnitude charts render differently"
+    print(f"Charts of {args.render_rows} earthquakes render identically from their counts.")
+
+    for size in args.rows:
+        sample_data = make_sample_data(random, size, args.days, args.groups)
+        charts = {
+            "over time": (get_raw_earthquakes_over_time(sample_data),
+                          lambda: get_earthquakes_over_time(get_daily_counts(sample_data))),
+            "by magnitude": (get_raw_earthquake_count_by_magnitude(sample_data),
+                             lambda: get_earthquake_count_by_magnitude(
+                                 get_magnitude_counts(sample_data)))
+        }
+        print(f"{size} earthquakes over {args.days} days:")
+        for name, (raw_chart, make_counted_chart) in charts.items():
+            start = perf_counter()
+            counted_chart = make_counted_chart()
+            counting_time = perf_counter() - start
+            raw_size = len(raw_chart.to_json(indent=None))
+            counted_size = len(counted_chart.to_json(indent=None))
+            print(f"  {name}: {raw_size / 1024:.0f}KiB before, {counted_size / 1024:.1f}KiB "
+                  f"after ({raw_size / counted_size:.0f}x smaller), "
+                  f"counted in {counting_time * 1000:.0f}ms")
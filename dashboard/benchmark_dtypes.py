@@ -0,0 +1,122 @@
+"""
+Script for measuring the memory a Streamlit process holds for the dashboard's
+earthquakes, loaded from rows as the database returns them into a frame of
+Decimals and strings as they were, against read in chunks with compact dtypes.
+Each load runs in its own process, so its peak memory is measured alone.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from logging import getLogger, WARNING
+from multiprocessing import get_context
+from random import Random
+from resource import getrusage, RUSAGE_SELF
+from time import perf_counter
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+
+from data import set_column_dtypes, concat_earthquakes, FETCH_CHUNK_SIZE
+
+
+NETS = ["us", "ak", "ci", "nc", "hv", "nn", "uw", "pr", "tx", "ok"]
+ALERTS = [None, None, None, None, None, None, None, "green", "yellow", "orange", "red"]
+MAGNITUDE_TYPES = ["md", "ml", "mb", "mw", "mww", "mwr", "ms"]
+STATES = ["Not in the USA", "California", "Alaska", "Nevada", "Hawaii", "Texas"]
+
+
+def make_rows(rng: Random, start: int, count: int, number: type) -> list[dict]:
+    """
+    Return earthquake rows shaped like the dashboard's query returns them,
+    with DECIMAL columns as the given number type.
+    """
+    first_time = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for earthquake_id in range(start, start + count):
+        time = first_time + timedelta(seconds=rng.uniform(0, 5 * 365 * 86400))
+        state = rng.randrange(len(STATES))
+        region = rng.randrange(200) if state == 0 else state
+        rows.append({
+            "region_id": region, "state_id": state + 1,
+            "state_region_interaction_id": state * 200 + region,
+            "earthquake_id": earthquake_id,
+            "magnitude": number(f"{rng.expovariate(1.0) + 0.5:.2f}"),
+            "latitude": number(f"{rng.uniform(-70, 80):.4f}"),
+            "longitude": number(f"{rng.uniform(-180, 180):.4f}"),
+            "time": time, "updated": time + timedelta(minutes=5),
+            "depth": number(f"{rng.uniform(0, 700):.3f}"),
+            "url": f"https://earthquake.usgs.gov/earthquakes/eventpage/us{earthquake_id:010d}",
+            "felt": rng.randrange(500) if rng.random() < 0.2 else None,
+            "tsunami": rng.random() < 0.01,
+            "cdi": number(f"{rng.uniform(1, 9):.1f}") if rng.random() < 0.2 else None,
+            "mmi": number(f"{rng.uniform(1, 9):.3f}") if rng.random() < 0.1 else None,
+            "nst": rng.randrange(400) if rng.random() < 0.7 else None,
+            "sig": rng.randrange(1500),
+            "net": rng.choice(NETS),
+            "dmin": number(f"{rng.uniform(0, 20):.5f}") if rng.random() < 0.7 else None,
+            "alert": rng.choice(ALERTS),
+            "location_source": rng.choice(NETS),
+            "magnitude_type": rng.choice(MAGNITUDE_TYPES),
+            "state_name": STATES[state],
+            "region_name": f"Region {region}" if state == 0 else "United States"
+        })
+    return rows
+
+
+def load_untyped(size: int) -> DataFrame:
+    """Return earthquakes fetched all at once with DECIMAL columns as Decimals, as they were."""
+    return DataFrame.from_dict(make_rows(Random(0), 0, size, Decimal))
+
+
+def load_typed(size: int) -> DataFrame:
+    """Return earthquakes fetched in chunks with DECIMAL columns as floats and compact dtypes."""
+    rng = Random(0)
+    return concat_earthquakes([
+        set_column_dtypes(DataFrame.from_dict(
+            make_rows(rng, start, min(FETCH_CHUNK_SIZE, size - start), float)))
+        for start in range(0, size, FETCH_CHUNK_SIZE)])
+
+
+def measure_load(loader: str, size: int) -> tuple[float, float, float]:
+    """
+    Return the seconds a load takes, the MiB its frame holds, and the MiB
+    its process's peak memory rose by while loading.
+    """
+    baseline = getrusage(RUSAGE_SELF).ru_maxrss
+    start = perf_counter()
+    data = LOADERS[loader](size)
+    load_time = perf_counter() - start
+    peak = getrusage(RUSAGE_SELF).ru_maxrss
+    return (load_time, data.memory_usage(deep=True).sum() / 2**20, (peak - baseline) / 1024)
+
+
+LOADERS = {"untyped": load_untyped, "typed": load_typed}
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Measure the memory of untyped against typed earthquakes.")
+    parser.add_argument("--rows", type=int, default=1_000_000,
+                        help="Number of earthquakes to load")
+    parser.add_argument("--check-rows", type=int, default=20_000,
+                        help="Number of earthquakes to check load the same")
+    args = parser.parse_args()
+
+    check_untyped = set_column_dtypes(load_untyped(args.check_rows))
+    check_typed = load_typed(args.check_rows)
+    # Categories are ordered as each chunk first saw them, so only their values are compared.
+    assert_frame_equal(check_untyped, check_typed, check_categorical=False)
+    print(f"{args.check_rows} earthquakes load the same untyped and typed.")
+
+    # A fresh process for each load, so neither is measured against the other's peak.
+    context = get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        results = {name: pool.apply(measure_load, (name, args.rows)) for name in LOADERS}
+    print(f"{args.rows} earthquakes:")
+    for name, (seconds, frame_size, peak_rise) in results.items():
+        print(f"  {name}: frame {frame_size:.0f}MiB, process peak rose {peak_rise:.0f}MiB, "
+              f"loaded in {seconds:.1f}s")
+    print(f"  {results['untyped'][1] / results['typed'][1]:.1f}x smaller frame, "
+          f"{results['untyped'][2] / results['typed'][2]:.1f}x lower peak")
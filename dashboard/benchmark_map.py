@@ -0,0 +1,66 @@
+"""
+Script for measuring the size and render time of the map of events' earthquake
+points, with a mark for every earthquake against clustered into grid cells.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from random import Random
+from time import perf_counter
+
+from altair import Chart, Color, Scale, data_transformers
+from pandas import DataFrame
+from vl_convert import vegalite_to_png
+
+from data import get_map_points, get_map_settings
+from charts import get_map_of_events
+from benchmark_charts import make_sample_data
+
+
+def get_raw_points(data: DataFrame, zoom: float) -> Chart:
+    """Return the map's points layer with a mark for every earthquake, as it was."""
+    data = data.astype({"latitude": float, "longitude": float, "magnitude": float})
+    return Chart(data).mark_circle(size=30).encode(
+        longitude='longitude:Q',
+        latitude='latitude:Q',
+        color=Color('magnitude:Q', scale=Scale(scheme='yelloworangered'), title="Magnitude"),
+        tooltip=['time:T', 'latitude:Q', 'longitude:Q', 'magnitude:Q']
+    ).project(type='naturalEarth1', center=[0, 0], scale=200 * zoom
+    ).properties(width=900, height=600)
+
+
+def measure(chart: Chart) -> tuple[int, float]:
+    """Return the compact spec size of a chart and the seconds it takes to render."""
+    spec = chart.to_dict()
+    start = perf_counter()
+    vegalite_to_png(spec)
+    return len(chart.to_json(indent=None)), perf_counter() - start
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+    data_transformers.disable_max_rows()
+
+    parser = ArgumentParser(description="Measure the map's points before and after clustering.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000],
+                        help="Numbers of earthquakes to map")
+    parser.add_argument("--zooms", type=float, nargs="+", default=[1, 5],
+                        help="Zoom levels of the global map")
+    args = parser.parse_args()
+
+    random = Random(0)
+    print(f"Settings: {get_map_settings()}")
+    for size in args.rows:
+        sample_data = make_sample_data(random, size, 90, 50)
+        raw_size, raw_time = measure(get_raw_points(sample_data, 1))
+        print(f"{size} earthquakes, every point: {raw_size / 1024:.0f}KiB, "
+              f"rendered in {raw_time:.2f}s")
+        for zoom in args.zooms:
+            start = perf_counter()
+            map_points = get_map_points(sample_data, zoom)
+            clustering_time = perf_counter() - start
+            points = get_map_of_events(map_points, zoom, "global").layer[-1]
+            clustered_size, clustered_time = measure(points)
+            print(f"  zoom {zoom:g}: {len(map_points)} marks, {clustered_size / 1024:.0f}KiB, "
+                  f"rendered in {clustered_time:.2f}s, clustered in "
+                  f"{clustering_time * 1000:.0f}ms ({raw_time / clustered_time:.0f}x faster)")
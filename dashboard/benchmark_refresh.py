@@ -0,0 +1,106 @@
+"""
+Script for benchmarking refreshing the dashboard's earthquakes from the database
+in .env, fetching only those updated since the last refresh against reloading
+all of them, and checking both give the same earthquakes.
+A copy of some earthquakes is made in its own schema, so updates to it are thrown away.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from os import environ as ENV
+from time import perf_counter
+
+from dotenv import load_dotenv
+from pandas.testing import assert_frame_equal
+
+from data import get_connection, get_earthquakes, get_data, refresh_data, data_cache
+
+
+SCHEMA = "dashboard_refresh_benchmark"
+COPIED_COLUMNS = """earthquake_id, magnitude, latitude, longitude, time, {updated},
+                    depth, url, felt, tsunami, cdi, mmi, nst, sig, net, dmin,
+                    alert, location_source, magnitude_type, state_region_interaction_id"""
+
+
+def copy_earthquakes(rows: int):
+    """
+    Copy the first earthquakes into the benchmark schema, leaving the rest to add later.
+    Each is updated shortly after it happened, as the synthetic ones were all updated at once.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+            curs.execute(f"CREATE SCHEMA {SCHEMA};")
+            curs.execute(f"""CREATE TABLE {SCHEMA}.earthquake
+                         (LIKE public.earthquake INCLUDING ALL);""")
+            curs.execute(f"""INSERT INTO {SCHEMA}.earthquake OVERRIDING SYSTEM VALUE
+                         SELECT {COPIED_COLUMNS.format(updated="time + INTERVAL '5 minutes'")}
+                         FROM public.earthquake
+                         ORDER BY earthquake_id LIMIT %(rows)s;""", {"rows": rows})
+            curs.execute(f"ANALYZE {SCHEMA}.earthquake;")
+
+
+def change_earthquakes(revised: int, added: int):
+    """Revise the magnitude of some earthquakes and add new ones, as the pipeline would."""
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute(f"""UPDATE {SCHEMA}.earthquake
+                         SET magnitude = magnitude + 0.1, updated = NOW()
+                         WHERE earthquake_id IN (SELECT earthquake_id FROM {SCHEMA}.earthquake
+                                                 ORDER BY random() LIMIT %(revised)s);""",
+                         {"revised": revised})
+            curs.execute(f"""INSERT INTO {SCHEMA}.earthquake OVERRIDING SYSTEM VALUE
+                         SELECT {COPIED_COLUMNS.format(updated="NOW()")}
+                         FROM public.earthquake
+                         WHERE earthquake_id > (SELECT MAX(earthquake_id)
+                                                FROM {SCHEMA}.earthquake)
+                         ORDER BY earthquake_id LIMIT %(added)s;""", {"added": added})
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark incremental against full refreshes.")
+    parser.add_argument("--rows", type=int, default=200_000,
+                        help="Number of earthquakes to copy")
+    parser.add_argument("--revised", type=int, default=100,
+                        help="Number of earthquakes revised before each refresh")
+    parser.add_argument("--added", type=int, default=100,
+                        help="Number of earthquakes added before each refresh")
+    parser.add_argument("--refreshes", type=int, default=5,
+                        help="Number of refreshes")
+    args = parser.parse_args()
+
+    copy_earthquakes(args.rows)
+    ENV["PGOPTIONS"] = f"-c search_path={SCHEMA},public"
+    try:
+        start = perf_counter()
+        refresh_data()
+        print(f"First load of {len(data_cache['data'])} earthquakes: "
+              f"{perf_counter() - start:.2f}s")
+
+        for refresh in range(args.refreshes):
+            change_earthquakes(args.revised, args.added)
+            start = perf_counter()
+            refresh_data()
+            incremental_time = perf_counter() - start
+            start = perf_counter()
+            reloaded = get_earthquakes()
+            full_time = perf_counter() - start
+
+            sort = ["earthquake_id"]
+            assert_frame_equal(data_cache["data"].sort_values(sort).reset_index(drop=True),
+                               reloaded.sort_values(sort).reset_index(drop=True))
+            print(f"Refresh {refresh + 1}, {args.revised} revised and {args.added} added: "
+                  f"incremental {incremental_time * 1000:.0f}ms, "
+                  f"full reload {full_time * 1000:.0f}ms "
+                  f"({full_time / incremental_time:.0f}x), match")
+
+        start = perf_counter()
+        get_data()
+        print(f"get_data once loaded: {(perf_counter() - start) * 1e6:.0f}us")
+    finally:
+        del ENV["PGOPTIONS"]
+        with get_connection() as cleanup_conn:
+            cleanup_conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
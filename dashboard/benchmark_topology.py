@@ -0,0 +1,103 @@
+"""
+Script for measuring the render time of the map of events with its topology
+fetched over the network, from the CDN it used to come from or the dashboard's
+static files, against embedded from memory.
+"""
+
+from argparse import ArgumentParser
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from logging import getLogger, WARNING
+from multiprocessing import Process, Queue
+from os import environ as ENV
+from random import Random
+from time import perf_counter, sleep
+from urllib.request import urlopen
+
+from altair import data_transformers
+from vl_convert import vegalite_to_png
+
+from data import get_map_points
+from charts import get_map_of_events, STATIC_DIR, STATIC_URL
+from benchmark_charts import make_sample_data
+
+
+CDN_URL = "https://cdn.jsdelivr.net/npm/world-atlas@2/countries-110m.json"
+
+
+def serve_static_files(latency: float, ports: Queue):
+    """Serve the static files on a free port, put on the queue, waiting latency seconds before each."""
+    class DelayedHandler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            sleep(latency)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(DelayedHandler, directory=STATIC_DIR))
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def is_reachable(url: str) -> bool:
+    """Return whether a URL responds within a few seconds."""
+    try:
+        with urlopen(url, timeout=5):
+            return True
+    except OSError:
+        return False
+
+
+def time_render(spec: str, repeats: int) -> float:
+    """Return the average seconds to render a spec after a warm up render."""
+    vegalite_to_png(spec)
+    start = perf_counter()
+    for _ in range(repeats):
+        vegalite_to_png(spec)
+    return (perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+    data_transformers.disable_max_rows()
+
+    parser = ArgumentParser(description="Measure map render times with and without fetching its topology.")
+    parser.add_argument("--rows", type=int, default=10_000,
+                        help="Number of earthquakes to map")
+    parser.add_argument("--latency", type=float, default=50,
+                        help="Milliseconds the static file server waits before responding")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Times to render each map")
+    args = parser.parse_args()
+
+    map_points = get_map_points(make_sample_data(Random(0), args.rows, 90, 50), 1)
+    # In its own process, as rendering holds the interpreter lock.
+    static_ports = Queue()
+    static_server = Process(target=serve_static_files, args=(args.latency / 1000, static_ports),
+                            daemon=True)
+    static_server.start()
+    static_host = f"http://127.0.0.1:{static_ports.get()}"
+
+    cdn_reachable = is_reachable(CDN_URL)
+    for scope in ("global", "us"):
+        ENV["DASHBOARD_MAP_TOPOLOGY"] = "static"
+        static_spec = get_map_of_events(map_points, 1, scope).to_json(indent=None)
+        renders = {f"static files, {args.latency:g}ms away": static_spec.replace(
+            f'"{STATIC_URL}/', f'"{static_host}/')}
+        # The US states are only in the bundled topologies.
+        if scope == "global":
+            renders["CDN"] = static_spec.replace(
+                f'"{STATIC_URL}/countries-110m.topo.json', f'"{CDN_URL}') \
+                if cdn_reachable else None
+        ENV["DASHBOARD_MAP_TOPOLOGY"] = "inline"
+        renders["from memory"] = get_map_of_events(map_points, 1, scope).to_json(indent=None)
+
+        print(f"{scope} map of {len(map_points)} marks:")
+        for name, spec in renders.items():
+            if spec is None:
+                print(f"  {name}: unreachable")
+            else:
+                print(f"  {name}: {time_render(spec, args.repeats) * 1000:.0f}ms")
+
+    static_server.terminate()
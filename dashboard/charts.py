@@ -1,11 +1,16 @@
 """Module for serving visualisations needed for dashboard pages."""
 
 from curses.panel import bottom_panel
+from hashlib import sha256
+from json import loads
 from logging import getLogger, basicConfig
+from os import environ as ENV
+from pathlib import Path
 
 from pandas import DataFrame
 from plotly.express import treemap, choropleth
-from altair import (Chart, X, Y, Color, Scale, topo_feature, Tooltip)
+from altair import (Chart, X, Y, Color, Scale, Size, Tooltip, Legend,
+                    InlineData, UrlData, TopoDataFormat)
 from streamlit import cache_resource
 
 
@@ -17,6 +22,10 @@ basicConfig(
     datefmt="%Y-%m-%dT%H:%M:%S"
 )
 
+# Map topologies built by make_topology.py, which Streamlit serves from app/static.
+STATIC_DIR = Path(__file__).parent / "static"
+STATIC_URL = "app/static"
+
 
 @cache_resource
 def get_state_choropleth(data: DataFrame) -> treemap:
@@ -121,25 +130,29 @@ def get_region_treemap(data: DataFrame) -> treemap:
 
 
 @cache_resource
-def get_earthquakes_over_time(data: DataFrame, group_by: str = "region") -> Chart:
-    """Return chart of earthquake counts over time grouped by state or region."""
+def get_earthquakes_over_time(daily_counts: DataFrame, group_by: str = "region") -> Chart:
+    """
+    Return chart of earthquake counts over time grouped by state or region,
+    from data.get_daily_counts so only one row a day for each group is sent to the browser.
+    """
     group_field = f"{group_by}_name:N"
     group_title = group_by.capitalize()
 
-    line = Chart(data).mark_line().encode(
+    line = Chart(daily_counts).mark_line().encode(
         x=X("yearmonthdate(time):T", title="Date"),
-        y=Y("count():Q", title="Number of Earthquakes"),
+        y=Y("count:Q", title="Number of Earthquakes"),
         color=Color(group_field, title=group_title)
     )
 
-    points = Chart(data).mark_circle(size=30).encode(
+    # Opaque, as Vega-Lite only draws circles opaque by default when it aggregates them.
+    points = Chart(daily_counts).mark_circle(size=30, opacity=1).encode(
         x="yearmonthdate(time):T",
-        y="count():Q",
+        y="count:Q",
         color=group_field,
         tooltip=[
             Tooltip("yearmonthdate(time):T", title="Date"),
             Tooltip(group_field, title=group_title),
-            Tooltip("count():Q", title="Number of Earthquakes")
+            Tooltip("count:Q", title="Number of Earthquakes")
         ]
     )
 
@@ -151,16 +164,18 @@ def get_earthquakes_over_time(data: DataFrame, group_by: str = "region") -> Char
 
 
 @cache_resource
-def get_earthquake_count_by_magnitude(data: DataFrame) -> Chart:
-    """Return bar chart of earthquake counts per rounded magnitude."""
-    data['rounded_mag'] = data['magnitude'].astype(float).round(1)
-    bottom = data['rounded_mag'].min()
-    top = data['rounded_mag'].max()
-    return Chart(data).mark_bar().encode(
+def get_earthquake_count_by_magnitude(magnitude_counts: DataFrame) -> Chart:
+    """
+    Return bar chart of earthquake counts per rounded magnitude,
+    from data.get_magnitude_counts so only one row a bar is sent to the browser.
+    """
+    bottom = magnitude_counts['rounded_mag'].min()
+    top = magnitude_counts['rounded_mag'].max()
+    return Chart(magnitude_counts).mark_bar().encode(
         x=X("rounded_mag:Q", title="Magnitude").scale(domain=[bottom, top]),
-        y=Y("count():Q", title="Number of Earthquakes"),
+        y=Y("count:Q", title="Number of Earthquakes"),
         tooltip=[Tooltip("rounded_mag", title="Magnitude"),
-                 Tooltip("count()", title="Number of Earthquakes")]
+                 Tooltip("count", title="Number of Earthquakes")]
     ).properties(
         title="Earthquake Count by Magnitude"
     )
@@ -178,16 +193,42 @@ def get_total_number_of_earthquakes(data: DataFrame) -> int:
     return len(data)
 
 
+def get_topology_settings() -> dict:
+    """Return the map topology settings, which can be overridden in the environment."""
+    return {
+        "source": ENV.get("DASHBOARD_MAP_TOPOLOGY", "static"),
+        "us_states": ENV.get("DASHBOARD_MAP_US_STATES", "true") != "false"
+    }
+
+
 @cache_resource
-def get_map_of_events(data: DataFrame, zoom: int, scope: str = "global") -> Chart:
-    """Return a geographical map of earthquake events over the U.S."""
-    data = data.copy()
-    data['latitude'] = data['latitude'].astype(float)
-    data['longitude'] = data['longitude'].astype(float)
-    data['magnitude'] = data['magnitude'].astype(float)
+def load_topology(file_name: str) -> dict:
+    """Return a bundled topology and a hash of its contents, read once per process."""
+    logger.info("Loading %s...", file_name)
+    content = (STATIC_DIR / file_name).read_bytes()
+    return {"values": loads(content), "version": sha256(content).hexdigest()[:12]}
+
 
-    world_map = topo_feature(
-        'https://cdn.jsdelivr.net/npm/world-atlas@2/countries-110m.json', 'countries')
+def get_topology_data(file_name: str, feature: str) -> UrlData | InlineData:
+    """
+    Return chart data of a feature of a bundled topology. By default it is fetched
+    from Streamlit's static files, with the hash of its contents in the URL so browsers
+    can cache it until it changes. With DASHBOARD_MAP_TOPOLOGY=inline it is embedded.
+    """
+    topology = load_topology(file_name)
+    data_format = TopoDataFormat(type="topojson", feature=feature)
+    if get_topology_settings()["source"] == "inline":
+        return InlineData(values=topology["values"], format=data_format)
+    return UrlData(url=f"{STATIC_URL}/{file_name}?v={topology['version']}", format=data_format)
+
+
+@cache_resource
+def get_map_of_events(map_points: DataFrame, zoom: int, scope: str = "global") -> Chart:
+    """
+    Return a geographical map of earthquake events from data.get_map_points,
+    sized by how many earthquakes each mark clusters.
+    """
+    world_map = get_topology_data("countries-110m.topo.json", "countries")
 
     if scope == "us":
         projection = 'mercator'
@@ -198,7 +239,7 @@ def get_map_of_events(data: DataFrame, zoom: int, scope: str = "global") -> Char
         center = [0, 0]
         scale = 200*zoom
 
-    # Base map
+    # Base map, with state borders on the US map
     base = Chart(world_map).mark_geoshape(
         fill='lightgray',
         stroke='white'
@@ -210,14 +251,38 @@ def get_map_of_events(data: DataFrame, zoom: int, scope: str = "global") -> Char
         width=900,
         height=600
     )
+    if scope == "us" and get_topology_settings()["us_states"]:
+        base += Chart(get_topology_data("us-states.topo.json", "states")).mark_geoshape(
+            fill='lightgray',
+            stroke='white',
+            strokeWidth=0.5
+        ).project(
+            type=projection,
+            center=center,
+            scale=scale
+        ).properties(
+            width=900,
+            height=600
+        )
 
-    # Earthquake points
-    points = Chart(data).mark_circle(size=30).encode(
+    # Earthquake points, with a time only when each is a single earthquake
+    if "time" in map_points.columns:
+        size = {}
+        tooltip = ['time:T', 'latitude:Q', 'longitude:Q', 'magnitude:Q']
+    else:
+        # Not from zero, so single earthquakes are the same size as in detail
+        size = {"size": Size('count:Q', scale=Scale(type='sqrt', zero=False, range=[30, 300]),
+                             legend=Legend(format="d", tickMinStep=1), title="Earthquakes")}
+        tooltip = [Tooltip('count:Q', title="Earthquakes"),
+                   Tooltip('magnitude:Q', title="Largest Magnitude"),
+                   'latitude:Q', 'longitude:Q']
+    points = Chart(map_points).mark_circle(size=30).encode(
         longitude='longitude:Q',
         latitude='latitude:Q',
         color=Color('magnitude:Q', scale=Scale(
             scheme='yelloworangered'), title="Magnitude"),
-        tooltip=['time:T', 'latitude:Q', 'longitude:Q', 'magnitude:Q']
+        tooltip=tooltip,
+        **size
     ).project(
         type=projection,
         center=center,
@@ -6,6 +6,18 @@ from datetime import datetime
 from pytest import fixture
 from pandas import DataFrame
 
+import data
+
+
+@fixture(autouse=True)
+def empty_data_cache():
+    """Each test starts without cached earthquakes, data version or a refresh thread."""
+    data.data_cache.update({"data": None, "high_water": None, "refresher": None})
+    data.data_version.update({"version": None, "checked": None})
+    yield
+    data.data_cache.update({"data": None, "high_water": None, "refresher": None})
+    data.data_version.update({"version": None, "checked": None})
+
 
 @fixture()
 def sample_data():
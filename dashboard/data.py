@@ -1,14 +1,18 @@
 """Module for handling data from the RDS."""
 
-from datetime import date
+from datetime import date, datetime, timedelta
 from os import environ as ENV
 from logging import getLogger, basicConfig
+from threading import Lock, RLock, Thread
+from time import sleep, monotonic
 
 from streamlit import cache_data
 from dotenv import load_dotenv
-from pandas import DataFrame
+from pandas import DataFrame, to_datetime, concat
+from pandas.api.types import union_categoricals
 from psycopg import Connection, connect, rows
-from numpy import where
+from psycopg.types.numeric import FloatLoader
+from numpy import floor, pi
 
 
 logger = getLogger(__name__)
@@ -19,11 +23,44 @@ basicConfig(
     datefmt="%Y-%m-%dT%H:%M:%S"
 )
 
+# The columns the USA and International pages' charts use.
+CHART_COLUMNS = ["earthquake_id", "magnitude", "latitude", "longitude", "time",
+                 "state_name", "region_name"]
+NOT_IN_USA = "Not in the USA"
+# Region names on the International page, where every US earthquake is in the USA.
+INTERNATIONAL_REGION = f"""CASE WHEN state_name != '{NOT_IN_USA}'
+                          THEN 'USA' ELSE region_name END"""
+EARTHQUAKE_QUERY = """SELECT * FROM earthquake
+                      JOIN "state_region_interaction" USING(state_region_interaction_id)
+                      JOIN "state" USING (state_id)
+                      JOIN "region" USING (region_id)"""
+# Dtypes of earthquake columns once fetched, like the pipeline's transform.COLUMN_DTYPES.
+# NUMERIC columns arrive as floats, and those the charts plot and filter on keep float64.
+COLUMN_DTYPES = {"earthquake_id": "int64", "magnitude": "float64", "latitude": "float64",
+                 "longitude": "float64", "depth": "float32", "felt": "Int32",
+                 "tsunami": "boolean", "cdi": "float32", "mmi": "float32", "nst": "Int16",
+                 "sig": "Int16", "net": "category", "dmin": "float32", "alert": "category",
+                 "location_source": "category", "magnitude_type": "category",
+                 "state_region_interaction_id": "Int16", "state_id": "Int16",
+                 "region_id": "Int16", "state_name": "category", "region_name": "category"}
+FETCH_CHUNK_SIZE = 50_000
+
+# Every earthquake, with the latest updated time among them, kept up to date
+# by a background thread so pages never wait for them to be reloaded.
+data_cache = {"data": None, "high_water": None, "refresher": None}
+# data_lock is only held to swap in refreshed earthquakes, so pages never wait for a fetch.
+# refresh_lock lets one refresh run at a time, and the first load wait for another in flight.
+data_lock = Lock()
+refresh_lock = RLock()
+# The latest updated time in the RDS when last checked, which server mode's cached queries
+# are keyed by, so they are fetched again once the pipeline loads.
+data_version = {"version": None, "checked": None}
+
 
 def get_connection() -> Connection:
-    """Return a db connection using environment variables."""
+    """Return a db connection using environment variables, which reads NUMERIC columns as floats."""
     logger.info("Getting DB connection...")
-    return connect(
+    con = connect(
         host=ENV["DB_HOST"],
         user=ENV["DB_USER"],
         dbname=ENV["DB_NAME"],
@@ -31,65 +68,367 @@ def get_connection() -> Connection:
         password=ENV["DB_PASSWORD"],
         row_factory=rows.dict_row
     )
+    con.adapters.register_loader("numeric", FloatLoader)
+    return con
+
+
+def set_column_dtypes(data: DataFrame) -> DataFrame:
+    """
+    Return earthquakes with compact dtypes for whichever of their columns have one.
+    Categorical columns are made strings first, so their categories have the same dtype
+    even when every value is null, and categoricals from different fetches can be joined.
+    """
+    dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in data.columns}
+    return data.astype({column: "string" for column, dtype in dtypes.items()
+                        if dtype == "category"}).astype(dtypes)
+
+
+def concat_earthquakes(frames: list[DataFrame]) -> DataFrame:
+    """Return frames of earthquakes joined, keeping categorical columns categorical."""
+    data = concat(frames, ignore_index=True)
+    for column in frames[0].select_dtypes("category").columns:
+        data[column] = union_categoricals([frame[column] for frame in frames],
+                                          ignore_order=True)
+    return data
+
+
+def get_refresh_settings() -> dict:
+    """Return the data refresh settings, which can be overridden in the environment."""
+    return {
+        "interval": float(ENV.get("DASHBOARD_REFRESH_INTERVAL", 30)),
+        "overlap": float(ENV.get("DASHBOARD_REFRESH_OVERLAP", 600))
+    }
+
+
+def get_earthquakes(updated_after: datetime = None) -> DataFrame:
+    """
+    Return every earthquake from the RDS, or only those updated after a time.
+    They are read in chunks given compact dtypes, so every row is never held as a dict at once.
+    """
+    query = EARTHQUAKE_QUERY
+    if updated_after is not None:
+        query += " WHERE updated > %(updated_after)s"
+    frames = []
+    with get_connection() as con:
+        with con.cursor(name="earthquakes") as curs:
+            curs.execute(f"{query};", {"updated_after": updated_after})
+            while quakes := curs.fetchmany(FETCH_CHUNK_SIZE):
+                frames.append(set_column_dtypes(DataFrame.from_dict(quakes)))
+    if not frames:
+        return DataFrame()
+    return concat_earthquakes(frames)
+
+
+def merge_earthquakes(data: DataFrame, updates: DataFrame) -> DataFrame:
+    """Return the earthquakes with updates added, replacing the rows of revised events."""
+    if updates.empty:
+        return data
+    return concat_earthquakes([data[~data["earthquake_id"].isin(updates["earthquake_id"])],
+                               updates])
+
+
+def refresh_data():
+    """
+    Load every earthquake into the cache if it is empty, otherwise merge in those updated
+    since its high-water mark. The pipeline and stream can commit earthquakes out of order
+    of their updated times, so the mark is moved back by an overlap before fetching.
+    """
+    with refresh_lock:
+        high_water = data_cache["high_water"]
+        if high_water is None:
+            logger.info("Getting results from DB...")
+            data = get_earthquakes()
+            updates = data
+        else:
+            updated_after = high_water - timedelta(seconds=get_refresh_settings()["overlap"])
+            updates = get_earthquakes(updated_after)
+            data = merge_earthquakes(data_cache["data"], updates)
+        if not updates.empty:
+            latest = updates["updated"].max()
+            if high_water is None or latest > high_water:
+                high_water = latest
+        with data_lock:
+            data_cache.update({"data": data, "high_water": high_water})
+
+
+def refresh_data_forever():
+    """Refresh the cached earthquakes on an interval, logging any failures."""
+    while True:
+        sleep(get_refresh_settings()["interval"])
+        try:
+            refresh_data()
+        except Exception as e:
+            logger.warning("Could not refresh earthquakes: %s", e)
+
+
+def start_background_refresh():
+    """Start the thread refreshing the cached earthquakes, if it is not already running."""
+    refresher = data_cache["refresher"]
+    if refresher is not None and refresher.is_alive():
+        return
+    with data_lock:
+        if data_cache["refresher"] is None or not data_cache["refresher"].is_alive():
+            data_cache["refresher"] = Thread(target=refresh_data_forever, daemon=True,
+                                             name="earthquake-refresh")
+            data_cache["refresher"].start()
 
 
-@cache_data(ttl=1800)
 def get_data() -> DataFrame:
-    """Return all data for dashboard from the RDS."""
-    logger.info("Getting results from DB...")
+    """
+    Return all data for dashboard from the RDS. Only the first call in a process waits
+    for it to load, after which it is refreshed in the background and must not be modified.
+    """
+    if data_cache["data"] is None:
+        with refresh_lock:
+            if data_cache["data"] is None:
+                refresh_data()
+    start_background_refresh()
+    return data_cache["data"]
+
+
+def get_data_mode() -> str:
+    """
+    Return how pages get their data. "server" filters in the database,
+    "full" loads every earthquake and filters in pandas.
+    """
+    return ENV.get("DASHBOARD_DATA_MODE", "server")
+
+
+def get_data_version() -> datetime | None:
+    """
+    Return the latest updated time of any earthquake in the RDS, which changes whenever
+    the pipeline loads, checking again at most once every refresh interval.
+    """
+    checked = data_version["checked"]
+    if checked is None or monotonic() - checked >= get_refresh_settings()["interval"]:
+        with get_connection() as con:
+            with con.cursor() as curs:
+                curs.execute("SELECT MAX(updated) AS version FROM earthquake;")
+                version = curs.fetchone()["version"]
+        data_version.update({"version": version, "checked": monotonic()})
+    return data_version["version"]
+
+
+def get_filter_query(scope: str, names: tuple[str]) -> str:
+    """
+    Return the query for the chart columns of earthquakes matching the page's filters,
+    with state names for the "us" scope and region names otherwise.
+    """
+    region_name = "region_name" if scope == "us" else INTERNATIONAL_REGION
+    conditions = ["magnitude >= %(magnitude)s", "time >= %(start)s", "time < %(end)s"]
+    if scope == "us":
+        conditions.append("state_name != %(not_in_usa)s")
+    if names:
+        conditions.append(
+            f"{'state_name' if scope == 'us' else region_name} = ANY(%(names)s)")
+    return f"""SELECT earthquake_id, magnitude, latitude, longitude, time,
+               state_name, {region_name} AS region_name
+               FROM earthquake
+               JOIN "state_region_interaction" USING(state_region_interaction_id)
+               JOIN "state" USING (state_id)
+               JOIN "region" USING (region_id)
+               WHERE {" AND ".join(conditions)};"""
+
+
+@cache_data(ttl=1800, max_entries=64)
+def get_filtered_data(scope: str, magnitude: float, start: date, end: date,
+                      names: tuple[str] = (), version: datetime = None) -> DataFrame:
+    """
+    Return the chart columns of earthquakes matching a page's filters from the RDS,
+    cached by the filters and the data version from get_data_version.
+    Names are states for the "us" scope and regions otherwise.
+    """
+    logger.info("Getting filtered results from DB...")
     with get_connection() as con:
         with con.cursor() as curs:
-            curs.execute("""SELECT * FROM earthquake
-                         JOIN "state_region_interaction" USING(state_region_interaction_id)
-                         JOIN "state" USING (state_id) 
-                         JOIN "region" USING (region_id);""")
+            curs.execute(get_filter_query(scope, names),
+                         {"magnitude": magnitude, "start": start,
+                          "end": end + timedelta(days=1),
+                          "not_in_usa": NOT_IN_USA, "names": list(names)})
             quakes = curs.fetchall()
-    return DataFrame.from_dict(quakes)
+    return set_column_dtypes(DataFrame(quakes, columns=CHART_COLUMNS))
+
+
+@cache_data(ttl=1800)
+def get_filter_options(scope: str) -> list[str]:
+    """
+    Return the states for the "us" scope, or regions otherwise,
+    from the small dimension tables rather than every earthquake.
+    """
+    logger.info("Getting filter options from DB...")
+    if scope == "us":
+        query = """SELECT DISTINCT state_name AS name FROM state
+                   JOIN "state_region_interaction" USING (state_id)
+                   WHERE state_name != %(not_in_usa)s
+                   ORDER BY name;"""
+    else:
+        query = f"""SELECT DISTINCT {INTERNATIONAL_REGION} AS name
+                    FROM "state_region_interaction"
+                    JOIN "state" USING (state_id)
+                    JOIN "region" USING (region_id)
+                    ORDER BY name;"""
+    with get_connection() as con:
+        with con.cursor() as curs:
+            curs.execute(query, {"not_in_usa": NOT_IN_USA})
+            return [result["name"] for result in curs.fetchall()]
+
+
+@cache_data(ttl=1800, max_entries=64)
+def get_state_counts(version: datetime = None) -> DataFrame:
+    """Return the earthquake count for each state, counted in the RDS and cached by data version."""
+    logger.info("Counting earthquakes by state in DB...")
+    with get_connection() as con:
+        with con.cursor() as curs:
+            curs.execute("""SELECT state_name AS "State Name",
+                         COUNT(*) AS "Earthquake Count"
+                         FROM earthquake
+                         JOIN "state_region_interaction" USING(state_region_interaction_id)
+                         JOIN "state" USING (state_id)
+                         GROUP BY state_name
+                         ORDER BY "Earthquake Count" DESC;""")
+            counts = curs.fetchall()
+    return DataFrame(counts, columns=["State Name", "Earthquake Count"])
+
+
+@cache_data(ttl=1800, max_entries=64)
+def get_region_counts(version: datetime = None) -> DataFrame:
+    """
+    Return the earthquake count for each region and state,
+    counted in the RDS and cached by data version.
+    """
+    logger.info("Counting earthquakes by region in DB...")
+    with get_connection() as con:
+        with con.cursor() as curs:
+            curs.execute(f"""SELECT {INTERNATIONAL_REGION} AS "Region Name",
+                         state_name AS "State Name",
+                         COUNT(*) AS "Earthquake Count"
+                         FROM earthquake
+                         JOIN "state_region_interaction" USING(state_region_interaction_id)
+                         JOIN "state" USING (state_id)
+                         JOIN "region" USING (region_id)
+                         GROUP BY 1, 2
+                         ORDER BY "Earthquake Count" DESC;""")
+            counts = curs.fetchall()
+    return DataFrame(counts, columns=["Region Name", "State Name", "Earthquake Count"])
+
+
+def get_daily_counts(data: DataFrame, group_by: str = "region") -> DataFrame:
+    """
+    Return the number of earthquakes each day for each state or region,
+    in order of group so their lines are always drawn in the same order.
+    Days are midnights without a timezone, so charts show the same day everywhere.
+    """
+    group_field = f"{group_by}_name"
+    days = to_datetime(data["time"]).dt.floor("D")
+    if days.dt.tz is not None:
+        days = days.dt.tz_localize(None)
+    return (data.assign(time=days)
+            .groupby([group_field, "time"], observed=True).size()
+            .reset_index(name="count"))
+
+
+def get_magnitude_counts(data: DataFrame) -> DataFrame:
+    """Return the number of earthquakes of each magnitude rounded to one decimal place."""
+    return (data["magnitude"].round(1).rename("rounded_mag")
+            .value_counts().sort_index()
+            .reset_index(name="count"))
+
+
+@cache_data(ttl=1800, max_entries=64)
+def get_filtered_counts(scope: str, magnitude: float, start: date, end: date,
+                        names: tuple[str] = (),
+                        version: datetime = None) -> tuple[DataFrame, DataFrame]:
+    """
+    Return the daily and magnitude counts of earthquakes matching a page's filters,
+    cached by the filters and data version so the charts are not re-aggregated on every rerun.
+    """
+    data = get_filtered_data(scope, magnitude, start, end, names, version)
+    return (get_daily_counts(data, "state" if scope == "us" else "region"),
+            get_magnitude_counts(data))
+
+
+def get_map_settings() -> dict:
+    """Return the map's clustering settings, which can be overridden in the environment."""
+    return {
+        "max_marks": max(1, int(ENV.get("DASHBOARD_MAP_MAX_MARKS", 5000))),
+        "detail_zoom": float(ENV.get("DASHBOARD_MAP_DETAIL_ZOOM", 5)),
+        "cell_pixels": float(ENV.get("DASHBOARD_MAP_CELL_PIXELS", 8))
+    }
+
+
+def get_cell_size(zoom: float, cell_pixels: float) -> float:
+    """
+    Return the width in degrees of a grid cell about cell_pixels across on the map,
+    which is projected at a scale of 200 * zoom pixels to a radian.
+    """
+    return cell_pixels * 180 / (pi * 200 * zoom)
+
+
+def get_map_points(data: DataFrame, zoom: float) -> DataFrame:
+    """
+    Return the marks for the map of events. Earthquakes are clustered into grid cells
+    a few pixels wide at the zoom, with one mark per cell at its earthquakes' mean location,
+    their count and largest magnitude. Above the detail zoom every earthquake is kept,
+    and cells are widened until there are no more marks than the cap.
+    """
+    settings = get_map_settings()
+    points = data[["latitude", "longitude", "magnitude"]]
+    if zoom >= settings["detail_zoom"] and len(points) <= settings["max_marks"]:
+        return points.assign(time=data["time"], count=1)
+
+    cell_size = get_cell_size(zoom, settings["cell_pixels"])
+    while True:
+        cells = points.groupby([floor((points["latitude"] + 90) / cell_size),
+                                floor((points["longitude"] + 180) / cell_size)])
+        if cells.ngroups <= settings["max_marks"]:
+            break
+        cell_size *= 2
+    return cells.agg(latitude=("latitude", "mean"), longitude=("longitude", "mean"),
+                     magnitude=("magnitude", "max"), count=("magnitude", "size")) \
+        .reset_index(drop=True).round({"latitude": 4, "longitude": 4})
 
 
 def get_counts_by_state(data: DataFrame) -> DataFrame:
     """Return dataframes of value counts for each state."""
-    data = data.copy()
     logger.info("Grouping DataFrame by state...")
-    return data["state_name"].value_counts().rename_axis("State Name").reset_index(name="Earthquake Count")
+    counts = data["state_name"].value_counts()
+    return counts[counts > 0].rename_axis("State Name").reset_index(name="Earthquake Count")
 
 
 def get_counts_by_region(data: DataFrame) -> DataFrame:
     """Return dataframes of value counts for each region."""
-    data = data.copy()
     logger.info("Grouping DataFrame by region...")
-    return (data[["region_name", "state_name"]].value_counts()
+    counts = data[["region_name", "state_name"]].value_counts()
+    return (counts[counts > 0]
             .rename_axis(["Region Name", "State Name"])
             .reset_index(name="Earthquake Count"))
 
 
 def get_american_data(data: DataFrame) -> DataFrame:
     """Return dataframe filtered fpr US data only."""
-    data = data.copy()
     logger.info("Grouping DataFrame if from US...")
-    return data[data["state_name"] != "Not in the USA"]
+    return data[data["state_name"] != NOT_IN_USA]
 
 
 def get_international_data(data: DataFrame) -> DataFrame:
     """Return dataframe filtered for international data only."""
     data = data.copy()
     logger.info("Masking data for us and non us...")
-    data["region_name"] = where(data["state_name"] != "Not in the USA",
-                                "USA",
-                                data["region_name"])
+    region_name = data["region_name"]
+    if region_name.dtype == "category" and "USA" not in region_name.cat.categories:
+        region_name = region_name.cat.add_categories("USA")
+    data["region_name"] = region_name.where(data["state_name"] == NOT_IN_USA, "USA")
     return data
 
 
 def get_mag_filtered_data(data: DataFrame, mag: int) -> DataFrame:
     """Return magnitude filtered data with mag as a minimum magnitude."""
-    data = data.copy()
     logger.info("Filtering data by magnitude now...")
     return data[data["magnitude"] >= mag]
 
 
 def get_date_filtered_data(data: DataFrame, start: date, end: date) -> DataFrame:
     """Return date filtered data with start and end date."""
-    data = data.copy()
     logger.info("Filtering data by date now...")
     mask = (data["time"].dt.date >= start) & (data["time"].dt.date <= end)
     return data[mask]
@@ -97,14 +436,12 @@ def get_date_filtered_data(data: DataFrame, start: date, end: date) -> DataFrame
 
 def get_state_filtered_data(data: DataFrame, states: list[str]) -> DataFrame:
     """Return state filtered data with states as list of accepted names."""
-    data = data.copy()
     logger.info("Filtering data by states now...")
     return data[data["state_name"].isin(states)]
 
 
 def get_region_filtered_data(data: DataFrame, regions: list[str]) -> DataFrame:
     """Return region filtered data with regions as list of accepted names."""
-    data = data.copy()
     logger.info("Filtering data by regions now...")
     return data[data["region_name"].isin(regions)]
 
@@ -0,0 +1,121 @@
+"""
+Script for building the map of events' TopoJSON files in static/ from the
+Natural Earth and US Census boundaries bundled with the pipeline, so the
+dashboard does not fetch the world atlas from a CDN.
+"""
+
+from argparse import ArgumentParser
+from json import load, dump
+from pathlib import Path
+
+import numpy as np
+
+
+BOUNDARY_DIR = Path(__file__).parent.parent / "pipeline" / "boundaries"
+STATIC_DIR = Path(__file__).parent / "static"
+
+# Boundary file, TopoJSON file, object name and simplification tolerance in degrees.
+TOPOLOGIES = [("countries", "countries-110m.topo.json", "countries", 0.0),
+              ("us_states", "us-states.topo.json", "states", 0.03)]
+
+
+def simplify_line(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Return the points of a line simplified with the Douglas-Peucker algorithm."""
+    if tolerance <= 0 or len(points) < 3:
+        return points
+    start, end = points[0], points[-1]
+    direction = end - start
+    length = np.hypot(*direction)
+    if length:
+        offsets = points - start
+        distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+    else:
+        distances = np.hypot(*(points - start).T)
+    furthest = int(distances.argmax())
+    if distances[furthest] <= tolerance:
+        return points[[0, -1]]
+    return np.concatenate([simplify_line(points[:furthest + 1], tolerance)[:-1],
+                           simplify_line(points[furthest:], tolerance)])
+
+
+def simplify_ring(ring: np.ndarray, tolerance: float) -> np.ndarray | None:
+    """
+    Return a closed ring simplified from the point furthest from its start,
+    or None if it collapses to fewer than three corners.
+    """
+    furthest = int(np.hypot(*(ring - ring[0]).T).argmax())
+    ring = np.concatenate([simplify_line(ring[:furthest + 1], tolerance)[:-1],
+                           simplify_line(ring[furthest:], tolerance)])
+    return ring if len(ring) >= 4 else None
+
+
+def encode_ring(ring: np.ndarray, tolerance: float,
+                translate: np.ndarray, scale: np.ndarray) -> list | None:
+    """
+    Return a ring simplified, quantized to the transform's grid and delta encoded,
+    dropping points that quantize to the same place, or None if it collapses.
+    """
+    ring = simplify_ring(ring, tolerance)
+    if ring is None:
+        return None
+    quantized = np.round((ring - translate) / scale).astype(int)
+    quantized = quantized[np.r_[True, (np.diff(quantized, axis=0) != 0).any(axis=1)]]
+    if len(quantized) < 4:
+        return None
+    return np.concatenate([quantized[:1], np.diff(quantized, axis=0)]).tolist()
+
+
+def make_topology(features: list[dict], object_name: str, tolerance: float,
+                  quantization: int) -> dict:
+    """
+    Return a TopoJSON topology of GeoJSON MultiPolygon features with a name property.
+    Each ring is its own arc, as the files are small enough not to need shared borders.
+    """
+    coordinates = np.concatenate([np.array(ring, dtype=float)
+                                  for feature in features
+                                  for polygon in feature["geometry"]["coordinates"]
+                                  for ring in polygon])
+    translate = coordinates.min(axis=0)
+    scale = (coordinates.max(axis=0) - translate) / (quantization - 1)
+
+    arcs = []
+    geometries = []
+    for feature in features:
+        polygons = []
+        for polygon in feature["geometry"]["coordinates"]:
+            rings = [encode_ring(np.array(ring, dtype=float), tolerance, translate, scale)
+                     for ring in polygon]
+            # A polygon is dropped with its outer ring, as its holes are then meaningless.
+            if rings[0] is None:
+                continue
+            rings = [ring for ring in rings if ring is not None]
+            polygons.append([[len(arcs) + i] for i in range(len(rings))])
+            arcs.extend(rings)
+        if polygons:
+            geometries.append({"type": "MultiPolygon", "arcs": polygons,
+                               "properties": feature["properties"]})
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": scale.tolist(), "translate": translate.tolist()},
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": arcs
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Build the map's TopoJSON files from the pipeline's boundaries.")
+    parser.add_argument("--quantization", type=int, default=100_000,
+                        help="Number of grid points across each axis")
+    args = parser.parse_args()
+
+    STATIC_DIR.mkdir(exist_ok=True)
+    for boundary, file_name, name, ring_tolerance in TOPOLOGIES:
+        with open(BOUNDARY_DIR / f"{boundary}.geojson", encoding="utf-8") as f:
+            boundary_features = load(f)["features"]
+        topology = make_topology(boundary_features, name, ring_tolerance, args.quantization)
+        with open(STATIC_DIR / file_name, "w", encoding="utf-8") as f:
+            dump(topology, f, separators=(",", ":"))
+        print(f"{file_name}: {len(topology['objects'][name]['geometries'])} {name}, "
+              f"{len(topology['arcs'])} rings, "
+              f"{(STATIC_DIR / file_name).stat().st_size / 1024:.0f}KiB")
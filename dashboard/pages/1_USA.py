@@ -8,7 +8,10 @@ from streamlit import (metric, title, multiselect,
                        date_input, altair_chart,
                        slider, sidebar, image)
 
-from data import (get_data, get_american_data,
+from data import (get_data, get_data_mode, get_filtered_data, get_filter_options,
+                  get_data_version, get_filtered_counts, get_daily_counts, get_magnitude_counts,
+                  get_map_points,
+                  get_american_data,
                   get_mag_filtered_data,
                   get_date_filtered_data,
                   get_state_filtered_data)
@@ -32,11 +35,12 @@ def filter_data(data: DataFrame,
     return data
 
 
-def display_charts(filtered_data: DataFrame, zoom: int):
-    """Display to dashboard charts from filtered data."""
-    altair_chart(get_map_of_events(filtered_data, zoom, "us"))
-    altair_chart(get_earthquakes_over_time(filtered_data, "state"))
-    altair_chart(get_earthquake_count_by_magnitude(filtered_data))
+def display_charts(filtered_data: DataFrame, zoom: int,
+                   daily_counts: DataFrame, magnitude_counts: DataFrame):
+    """Display to dashboard charts from filtered data and its counts."""
+    altair_chart(get_map_of_events(get_map_points(filtered_data, zoom), zoom, "us"))
+    altair_chart(get_earthquakes_over_time(daily_counts, "state"))
+    altair_chart(get_earthquake_count_by_magnitude(magnitude_counts))
     col1, col2 = columns(2)
     with col1:
         metric(label="Total Number of Earthquakes for Filter Set",
@@ -51,9 +55,12 @@ def serve_page():
     title("USA")
     with sidebar:
         image("./dashboard/earthquake_monitor.png")
-    data = get_data()
-    us_data = get_american_data(data)
-    states = us_data["state_name"].unique()
+    server_side = get_data_mode() == "server"
+    if server_side:
+        states = get_filter_options("us")
+    else:
+        us_data = get_american_data(get_data())
+        states = us_data["state_name"].unique()
 
     state = None
     magnitude = None
@@ -78,8 +85,16 @@ def serve_page():
             stop = date_input(label="End Date.",
                               value="today",
                               max_value=date.today())
-    filtered_data = filter_data(us_data, state, magnitude, start, stop)
-    display_charts(filtered_data, zoom)
+    if server_side:
+        filters = ("us", magnitude, start, stop, tuple(state or ()),
+                   get_data_version())
+        filtered_data = get_filtered_data(*filters)
+        daily_counts, magnitude_counts = get_filtered_counts(*filters)
+    else:
+        filtered_data = filter_data(us_data, state, magnitude, start, stop)
+        daily_counts = get_daily_counts(filtered_data, "state")
+        magnitude_counts = get_magnitude_counts(filtered_data)
+    display_charts(filtered_data, zoom, daily_counts, magnitude_counts)
 
 
 if __name__ == "__main__":
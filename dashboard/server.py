@@ -0,0 +1,32 @@
+"""
+Module for serving the dashboard with long-lived cache headers on its static files,
+such as the map topologies, which are only requested again when their hash changes.
+"""
+
+from streamlit import App
+from starlette.middleware import Middleware
+
+
+STATIC_PATH = "/app/static/"
+STATIC_CACHE_CONTROL = b"public, max-age=31536000, immutable"
+
+
+def cache_static_files(app):
+    """Return ASGI middleware adding a long-lived Cache-Control header to static files."""
+    async def middleware(scope, receive, send):
+        if scope["type"] != "http" or STATIC_PATH not in scope["path"]:
+            await app(scope, receive, send)
+            return
+
+        async def send_with_cache_control(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message["headers"] = [*message.get("headers", []),
+                                      (b"cache-control", STATIC_CACHE_CONTROL)]
+            await send(message)
+
+        await app(scope, receive, send_with_cache_control)
+
+    return middleware
+
+
+app = App("Home.py", middleware=[Middleware(cache_static_files)])
@@ -1,10 +1,14 @@
 """Module for handling user subscriptions."""
 
 import logging
+from decimal import Decimal
 
 from boto3 import client
+from psycopg import Error
 from streamlit import toast, cache_data
 
+from data import get_connection
+
 logger = logging.getLogger(__name__)
 
 logging.basicConfig(
@@ -47,6 +51,30 @@ def create_topic(sns: client, topic_name: str) -> str:
     return sns.create_topic(Name=topic_name)["TopicArn"]
 
 
+def get_topic_values(topic_name: str) -> tuple[Decimal, Decimal, Decimal, int]:
+    """Returns the magnitude, latitude, longitude and radius encoded in a topic name."""
+    parts = topic_name.split("-")
+    latitude = Decimal(parts[3][1:]).scaleb(-4)
+    longitude = Decimal(parts[4][1:]).scaleb(-4)
+    return (Decimal(parts[2]).scaleb(-1),
+            -latitude if parts[3][0] == "m" else latitude,
+            -longitude if parts[4][0] == "m" else longitude,
+            int(parts[5]))
+
+
+def register_topic(topic_arn: str, topic_name: str) -> None:
+    """Adds a topic to the registry the pipeline matches earthquakes against."""
+    logger.info("Registering topic %s.", topic_name)
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute("""INSERT INTO subscription_topic
+                         (topic_arn, magnitude, latitude, longitude, radius)
+                         VALUES (%s, %s, %s, %s, %s)
+                         ON CONFLICT (topic_arn) DO NOTHING;""",
+                         (topic_arn, *get_topic_values(topic_name)))
+        conn.commit()
+
+
 def sub_to_topic(sns: client, topic_arn: str, email: str) -> None:
     """Subscribes a user to a topic based on the TopicArn."""
     logger.info("Subscribing %s to topic %s.", email, topic_arn)
@@ -68,6 +96,13 @@ def make_subscription(email: str, latitude: float, longitude: float,
         sns = get_sns_client()
         topic_arn = create_topic(sns, topic_name)
         sub_to_topic(sns, topic_arn, email)
+        try:
+            register_topic(topic_arn, topic_name)
+        except Error:
+            # The pipeline only reads the registry with TOPIC_SOURCE=registry, and
+            # sync_subscriptions.py imports topics missing from it from SNS.
+            logger.warning("Could not register topic %s, it is only in SNS.",
+                           topic_name, exc_info=True)
         logger.info("Subscription has been completed.")
         toast("Subscription has been made!")
     except ValueError:
@@ -1,7 +1,7 @@
 # pylint: skip-file
 """Tests for charts module."""
 
-from altair import Chart, LayerChart
+from altair import Chart, LayerChart, InlineData, UrlData
 from plotly.graph_objs import Figure
 
 from charts import (
@@ -11,8 +11,11 @@ from charts import (
     get_earthquakes_over_time,
     get_region_treemap,
     get_state_choropleth,
-    get_map_of_events
+    get_map_of_events,
+    get_topology_data,
+    load_topology
 )
+from data import get_daily_counts, get_magnitude_counts, get_map_points
 
 
 class TestGetAverageMag:
@@ -30,21 +33,29 @@ class TestGetTotalNumberOfEarthquakes:
 
 
 class TestGetEarthquakeCountByMagnitude:
-    def test_get_earthquake_count_by_magnitude(self, sample_data):
-        chart = get_earthquake_count_by_magnitude(sample_data)
+    def test_get_earthquake_count_by_magnitude(self, db_return):
+        chart = get_earthquake_count_by_magnitude(get_magnitude_counts(db_return))
         assert isinstance(chart, Chart)
         assert chart.mark == 'bar'
+        assert chart.encoding.y.shorthand == "count:Q"
 
 
 class TestGetEarthquakesOverTime:
-    def test_get_earthquakes_over_time_region(self, sample_data):
-        chart = get_earthquakes_over_time(sample_data, group_by="region")
+    def test_get_earthquakes_over_time_region(self, db_return):
+        chart = get_earthquakes_over_time(get_daily_counts(db_return, "region"),
+                                          group_by="region")
         assert isinstance(chart, LayerChart)
 
-    def test_get_earthquakes_over_time_state(self, sample_data):
-        chart = get_earthquakes_over_time(sample_data, group_by="state")
+    def test_get_earthquakes_over_time_state(self, db_return):
+        chart = get_earthquakes_over_time(get_daily_counts(db_return, "state"),
+                                          group_by="state")
         assert isinstance(chart, LayerChart)
 
+    def test_get_earthquakes_over_time_sends_counts(self, db_return):
+        daily_counts = get_daily_counts(db_return, "region")
+        chart = get_earthquakes_over_time(daily_counts, group_by="region")
+        assert len(chart.to_dict()["datasets"].popitem()[1]) == len(daily_counts)
+
 
 class TestGetRegionTreemap:
     def test_get_region_treemap(self, sample_data):
@@ -62,9 +73,43 @@ class TestGetStateChoropleth:
 
 class TestGetMapOfEvents:
     def test_get_map_of_events_us(self, sample_data):
-        fig = get_map_of_events(sample_data, zoom=1, scope="us")
+        fig = get_map_of_events(get_map_points(sample_data, 1), zoom=1, scope="us")
         assert isinstance(fig, LayerChart)
 
     def test_get_map_of_events_global(self, sample_data):
-        fig = get_map_of_events(sample_data, zoom=1, scope="global")
+        fig = get_map_of_events(get_map_points(sample_data, 1), zoom=1, scope="global")
         assert isinstance(fig, LayerChart)
+
+    def test_get_map_of_events_sizes_clusters(self, sample_data):
+        points = get_map_of_events(get_map_points(sample_data, 1), zoom=1).layer[-1]
+        assert points.encoding.size.shorthand == "count:Q"
+
+    def test_get_map_of_events_detail_has_time(self, sample_data):
+        points = get_map_of_events(get_map_points(sample_data, 10), zoom=10).layer[-1]
+        assert "time:T" in [tooltip.shorthand for tooltip in points.encoding.tooltip]
+
+
+class TestGetTopologyData:
+    def test_get_topology_data_static(self):
+        data = get_topology_data("countries-110m.topo.json", "countries")
+        assert isinstance(data, UrlData)
+        version = load_topology("countries-110m.topo.json")["version"]
+        assert data.url == f"app/static/countries-110m.topo.json?v={version}"
+        assert data.format.feature == "countries"
+
+    def test_get_topology_data_inline(self, monkeypatch):
+        monkeypatch.setenv("DASHBOARD_MAP_TOPOLOGY", "inline")
+        data = get_topology_data("us-states.topo.json", "states")
+        assert isinstance(data, InlineData)
+        assert data.values["type"] == "Topology"
+        assert "states" in data.values["objects"]
+
+    def test_get_map_of_events_us_states(self, sample_data, monkeypatch):
+        get_map_of_events.clear()
+        chart = get_map_of_events(get_map_points(sample_data, 1), zoom=1, scope="us")
+        assert len(chart.layer) == 3
+        monkeypatch.setenv("DASHBOARD_MAP_US_STATES", "false")
+        get_map_of_events.clear()
+        chart = get_map_of_events(get_map_points(sample_data, 1), zoom=1, scope="us")
+        assert len(chart.layer) == 2
+        get_map_of_events.clear()
@@ -1,11 +1,19 @@
 # pylint: skip-file
 """Tests for data module."""
 
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from threading import Thread
 from unittest.mock import MagicMock, patch
-from pandas import DataFrame
+from pandas import DataFrame, concat
 from pandas.testing import assert_frame_equal
 
-from data import get_counts_by_state, get_data
+from data import (get_counts_by_state, get_data, get_filter_query, get_filtered_data,
+                  get_filter_options, get_daily_counts, get_magnitude_counts,
+                  get_filtered_counts, get_map_points, get_earthquakes,
+                  merge_earthquakes, refresh_data, start_background_refresh,
+                  set_column_dtypes, concat_earthquakes, get_data_version, get_state_counts,
+                  data_cache, data_version, refresh_lock, CHART_COLUMNS)
 
 
 class TestGetCountsByState:
@@ -26,17 +34,325 @@ class TestGetCountsByState:
         result = get_counts_by_state(db_return)
         assert_frame_equal(result, state_counts)
 
+    def test_get_count_by_state_drops_unseen_categories(self, db_return):
+        """Checks states only in the categories of a filtered column are not counted."""
+        data = set_column_dtypes(db_return).iloc[[0]]
+        result = get_counts_by_state(data)
+        assert result["Earthquake Count"].tolist() == [1]
+
 
 class TestGetData:
     """Class that groups tests for get_data."""
 
-    def test_get_data_returns_dataframe(query_response):
+    def test_get_data_returns_dataframe(self, query_response):
         """Checks function returns dataframe."""
-        mock_connection = MagicMock()
         mock_cursor = MagicMock()
-        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
-        mock_cursor.fetchall.return_value = query_response
-        mock_cursor.execute.return_value = None
-        with patch("data.get_connection", mock_connection):
+        mock_cursor.fetchmany.side_effect = [query_response, []]
+        with patch("data.get_connection") as mock_connection, \
+             patch("data.start_background_refresh"):
+            mock_connection.return_value.__enter__.return_value.cursor.return_value \
+                .__enter__.return_value = mock_cursor
             result = get_data()
         assert isinstance(result, DataFrame)
+        assert len(result) == len(query_response)
+
+    def test_get_data_loads_once(self, db_return):
+        """Checks later calls return the cached earthquakes without loading them again."""
+        with patch("data.get_earthquakes", return_value=db_return) as mock_earthquakes, \
+             patch("data.start_background_refresh") as mock_refresh:
+            get_data()
+            result = get_data()
+        mock_earthquakes.assert_called_once_with()
+        assert mock_refresh.call_count == 2
+        assert result is db_return
+
+    def test_get_data_does_not_wait_for_refresh(self, db_return):
+        """Checks loaded earthquakes are returned while a refresh is in flight."""
+        data_cache.update({"data": db_return, "refresher": MagicMock()})
+        results = []
+        with refresh_lock:
+            page = Thread(target=lambda: results.append(get_data()))
+            page.start()
+            page.join(timeout=5)
+        assert results == [db_return]
+
+
+class TestGetEarthquakes:
+    """Class that groups tests for get_earthquakes."""
+
+    def test_get_earthquakes_updated_after(self):
+        """Checks only earthquakes updated after the time are fetched when it is given."""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.return_value = []
+        updated_after = datetime(2025, 5, 20, tzinfo=timezone.utc)
+        with patch("data.get_connection") as mock_connection:
+            mock_connection.return_value.__enter__.return_value.cursor.return_value \
+                .__enter__.return_value = mock_cursor
+            get_earthquakes(updated_after)
+        query, parameters = mock_cursor.execute.call_args.args
+        assert "WHERE updated > %(updated_after)s" in query
+        assert parameters["updated_after"] == updated_after
+
+
+class TestSetColumnDtypes:
+    """Class that groups tests for set_column_dtypes."""
+
+    def test_set_column_dtypes_compacts_columns(self):
+        """Checks numbers, nullable integers and low cardinality strings get compact dtypes."""
+        data = DataFrame({"magnitude": [Decimal("6.7"), Decimal("4.2")],
+                          "depth": [10.0, None], "nst": [12, None],
+                          "net": ["us", "us"]})
+        result = set_column_dtypes(data)
+        assert result.dtypes.astype(str).to_dict() == {
+            "magnitude": "float64", "depth": "float32", "nst": "Int16",
+            "net": "category"}
+        assert result["magnitude"].ge(6.7).tolist() == [True, False]
+
+    def test_set_column_dtypes_all_null_category(self):
+        """Checks a category column without values has string categories."""
+        result = set_column_dtypes(DataFrame({"alert": [None, None]}))
+        assert result["alert"].isna().all()
+        assert result["alert"].cat.categories.dtype == "string"
+
+
+class TestConcatEarthquakes:
+    """Class that groups tests for concat_earthquakes."""
+
+    def test_concat_earthquakes_keeps_categories(self):
+        """Checks categorical columns with different categories stay categorical."""
+        first = set_column_dtypes(DataFrame({"earthquake_id": [1], "alert": [None],
+                                             "net": ["us"]}))
+        second = set_column_dtypes(DataFrame({"earthquake_id": [2], "alert": ["green"],
+                                              "net": ["ak"]}))
+        result = concat_earthquakes([first, second])
+        assert result["net"].dtype == "category"
+        assert result["alert"].dtype == "category"
+        assert result["net"].tolist() == ["us", "ak"]
+        assert result.index.tolist() == [0, 1]
+
+
+class TestMergeEarthquakes:
+    """Class that groups tests for merge_earthquakes."""
+
+    def test_merge_earthquakes_replaces_revised_events(self, db_return):
+        """Checks revised events replace their old rows and new events are added."""
+        updates = db_return.iloc[[1]].assign(magnitude=5.7)
+        new = db_return.iloc[[0]].assign(earthquake_id=1000001239)
+        result = merge_earthquakes(db_return, concat([updates, new]))
+        assert len(result) == len(db_return) + 1
+        assert result["earthquake_id"].is_unique
+        revised = result[result["earthquake_id"] == 1000001235]
+        assert revised["magnitude"].tolist() == [5.7]
+
+    def test_merge_earthquakes_no_updates(self, db_return):
+        """Checks the earthquakes are returned unchanged without updates."""
+        assert merge_earthquakes(db_return, DataFrame()) is db_return
+
+
+class TestRefreshData:
+    """Class that groups tests for refresh_data."""
+
+    def test_refresh_data_fetches_since_high_water_mark(self, db_return, monkeypatch):
+        """Checks earthquakes updated since the mark, less the overlap, are merged in."""
+        monkeypatch.setenv("DASHBOARD_REFRESH_OVERLAP", "60")
+        data_cache.update({"data": db_return,
+                           "high_water": datetime(2025, 5, 24, 22, 52, tzinfo=timezone.utc)})
+        revised = db_return.iloc[[4]].assign(
+            magnitude=6.3, updated=datetime(2025, 5, 25, tzinfo=timezone.utc))
+        with patch("data.get_earthquakes", return_value=revised) as mock_earthquakes:
+            refresh_data()
+        mock_earthquakes.assert_called_once_with(
+            datetime(2025, 5, 24, 22, 51, tzinfo=timezone.utc))
+        assert len(data_cache["data"]) == len(db_return)
+        assert data_cache["high_water"] == datetime(2025, 5, 25, tzinfo=timezone.utc)
+
+    def test_refresh_data_keeps_high_water_mark(self, db_return):
+        """Checks the mark never moves back when only older events are revised."""
+        high_water = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        data_cache.update({"data": db_return, "high_water": high_water})
+        revised = db_return.iloc[[0]].assign(
+            updated=datetime(2025, 5, 31, tzinfo=timezone.utc))
+        with patch("data.get_earthquakes", return_value=revised):
+            refresh_data()
+        assert data_cache["high_water"] == high_water
+
+
+class TestStartBackgroundRefresh:
+    """Class that groups tests for start_background_refresh."""
+
+    def test_start_background_refresh_starts_one_thread(self):
+        """Checks only one refresh thread is started while it is running."""
+        with patch("data.Thread") as mock_thread:
+            mock_thread.return_value.is_alive.return_value = True
+            start_background_refresh()
+            start_background_refresh()
+        mock_thread.assert_called_once()
+        mock_thread.return_value.start.assert_called_once()
+
+
+class TestGetDataVersion:
+    """Class that groups tests for get_data_version."""
+
+    def test_get_data_version_checks_once_an_interval(self):
+        """Checks the latest updated time is only queried again after the refresh interval."""
+        latest = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = {"version": latest}
+        with patch("data.get_connection") as mock_connection:
+            mock_connection.return_value.__enter__.return_value.cursor.return_value \
+                .__enter__.return_value = mock_cursor
+            assert get_data_version() == latest
+            assert get_data_version() == latest
+            assert mock_cursor.execute.call_count == 1
+            data_version["checked"] -= 60
+            get_data_version()
+        assert mock_cursor.execute.call_count == 2
+
+    def test_cached_counts_refetched_for_new_version(self):
+        """Checks server mode's cached counts are fetched again once new data is loaded."""
+        get_state_counts.clear()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = []
+        with patch("data.get_connection") as mock_connection:
+            mock_connection.return_value.__enter__.return_value.cursor.return_value \
+                .__enter__.return_value = mock_cursor
+            get_state_counts(datetime(2025, 6, 1, tzinfo=timezone.utc))
+            get_state_counts(datetime(2025, 6, 1, tzinfo=timezone.utc))
+            get_state_counts(datetime(2025, 6, 2, tzinfo=timezone.utc))
+        assert mock_cursor.execute.call_count == 2
+
+
+class TestGetFilterQuery:
+    """Class that groups tests for get_filter_query."""
+
+    def test_get_filter_query_us_states(self):
+        """Checks the US query excludes other countries and filters by state."""
+        query = get_filter_query("us", ("California",))
+        assert "state_name != %(not_in_usa)s" in query
+        assert "state_name = ANY(%(names)s)" in query
+
+    def test_get_filter_query_global_regions(self):
+        """Checks the International query maps US regions to USA before filtering."""
+        query = get_filter_query("global", ("USA",))
+        assert "THEN 'USA' ELSE region_name END = ANY(%(names)s)" in query
+
+    def test_get_filter_query_no_names(self):
+        """Checks no name filter is added when nothing is selected."""
+        assert "ANY" not in get_filter_query("us", ())
+
+    def test_get_filter_query_chart_columns_only(self):
+        """Checks only the columns the charts use are selected."""
+        assert "SELECT *" not in get_filter_query("global", ())
+
+
+class TestGetFilteredData:
+    """Class that groups tests for get_filtered_data."""
+
+    def test_get_filtered_data_parameters(self):
+        """Checks filters are passed as parameters with the end date included."""
+        get_filtered_data.clear()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = []
+        with patch("data.get_connection") as mock_connection:
+            mock_connection.return_value.__enter__.return_value.cursor.return_value \
+                .__enter__.return_value = mock_cursor
+            result = get_filtered_data("us", 4.5, date(2025, 6, 9), date(2025, 6, 10),
+                                       ("California",))
+        parameters = mock_cursor.execute.call_args.args[1]
+        assert parameters["magnitude"] == 4.5
+        assert parameters["end"] == date(2025, 6, 11)
+        assert parameters["names"] == ["California"]
+        assert list(result.columns) == CHART_COLUMNS
+
+    def test_get_filter_options_returns_names(self):
+        """Checks the option names are returned in order."""
+        get_filter_options.clear()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [{"name": "Alaska"}, {"name": "California"}]
+        with patch("data.get_connection") as mock_connection:
+            mock_connection.return_value.__enter__.return_value.cursor.return_value \
+                .__enter__.return_value = mock_cursor
+            assert get_filter_options("us") == ["Alaska", "California"]
+
+
+class TestGetDailyCounts:
+    """Class that groups tests for get_daily_counts."""
+
+    def test_get_daily_counts_counts_each_day(self):
+        """Checks earthquakes are counted by group and day, in order of group."""
+        data = DataFrame({
+            "region_name": ["West", "East", "West", "West"],
+            "time": ["2025-05-20T14:32:00Z", "2025-05-20T09:00:00Z",
+                     "2025-05-20T23:59:00Z", "2025-05-21T00:01:00Z"]
+        })
+        expected = DataFrame({
+            "region_name": ["East", "West", "West"],
+            "time": [datetime(2025, 5, 20), datetime(2025, 5, 20), datetime(2025, 5, 21)],
+            "count": [1, 2, 1]
+        })
+        assert_frame_equal(get_daily_counts(data), expected, check_dtype=False)
+
+    def test_get_daily_counts_by_state(self, db_return):
+        """Checks earthquakes can be counted by state."""
+        result = get_daily_counts(db_return, "state")
+        assert list(result.columns) == ["state_name", "time", "count"]
+        assert result["count"].sum() == len(db_return)
+
+
+class TestGetMagnitudeCounts:
+    """Class that groups tests for get_magnitude_counts."""
+
+    def test_get_magnitude_counts_rounds_magnitudes(self):
+        """Checks magnitudes are rounded to one decimal place before counting."""
+        data = DataFrame({"magnitude": [4.51, 4.49, 5.0, 4.46]})
+        expected = DataFrame({"rounded_mag": [4.5, 5.0], "count": [3, 1]})
+        assert_frame_equal(get_magnitude_counts(data), expected, check_dtype=False)
+
+    def test_get_magnitude_counts_empty(self):
+        """Checks no earthquakes give no counts."""
+        result = get_magnitude_counts(DataFrame({"magnitude": []}))
+        assert list(result.columns) == ["rounded_mag", "count"]
+        assert result.empty
+
+
+class TestGetFilteredCounts:
+    """Class that groups tests for get_filtered_counts."""
+
+    def test_get_filtered_counts_groups_us_by_state(self, db_return):
+        """Checks the USA page's counts are grouped by state."""
+        get_filtered_counts.clear()
+        with patch("data.get_filtered_data", return_value=db_return) as mock_filtered:
+            daily, magnitude = get_filtered_counts("us", 4.5, date(2025, 5, 20),
+                                                   date(2025, 5, 24))
+        mock_filtered.assert_called_once_with("us", 4.5, date(2025, 5, 20),
+                                              date(2025, 5, 24), (), None)
+        assert "state_name" in daily.columns
+        assert magnitude["count"].sum() == len(db_return)
+
+
+class TestGetMapPoints:
+    """Class that groups tests for get_map_points."""
+
+    def test_get_map_points_clusters_nearby_earthquakes(self, sample_data):
+        """Checks earthquakes in the same cell become one mark with their count and largest magnitude."""
+        result = get_map_points(sample_data, 0.5)
+        assert len(result) == 2
+        cluster = result[result["count"] == 2].iloc[0]
+        assert cluster["magnitude"] == 6.1
+        assert round(cluster["latitude"], 2) == round((36.77 + 34.05) / 2, 2)
+        assert "time" not in result.columns
+
+    def test_get_map_points_keeps_detail_when_zoomed_in(self, sample_data, monkeypatch):
+        """Checks every earthquake is kept at or above the detail zoom."""
+        monkeypatch.setenv("DASHBOARD_MAP_DETAIL_ZOOM", "4")
+        result = get_map_points(sample_data, 4)
+        assert len(result) == len(sample_data)
+        assert list(result["count"]) == [1, 1, 1]
+        assert "time" in result.columns
+
+    def test_get_map_points_caps_marks(self, sample_data, monkeypatch):
+        """Checks cells are widened until there are no more marks than the cap."""
+        monkeypatch.setenv("DASHBOARD_MAP_MAX_MARKS", "1")
+        result = get_map_points(sample_data, 10)
+        assert len(result) == 1
+        assert result["count"].sum() == len(sample_data)
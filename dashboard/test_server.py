@@ -0,0 +1,33 @@
+# pylint: skip-file
+"""Tests for server module."""
+
+from asyncio import run
+
+from server import cache_static_files, STATIC_CACHE_CONTROL
+
+
+def get_response_headers(path: str, status: int = 200) -> list:
+    """Return the headers of a response to a request for path through the middleware."""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    run(cache_static_files(app)({"type": "http", "path": path}, None, send))
+    return messages[0]["headers"]
+
+
+class TestCacheStaticFiles:
+    def test_cache_static_files_adds_cache_control(self):
+        headers = get_response_headers("/app/static/countries-110m.topo.json")
+        assert (b"cache-control", STATIC_CACHE_CONTROL) in headers
+
+    def test_cache_static_files_ignores_other_paths(self):
+        assert get_response_headers("/USA") == []
+
+    def test_cache_static_files_ignores_missing_files(self):
+        assert get_response_headers("/app/static/missing.json", 404) == []
@@ -1,14 +1,54 @@
 # pylint: skip-file
 """Tests for subscription module."""
 
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from psycopg import OperationalError
+
 from subscription import (make_subscription,
                           create_topic_name,
-                          format_coordinate)
+                          format_coordinate,
+                          get_topic_values)
 
 
 class TestMakeSubscription:
     """Class that groups tests for make_subscription."""
-    pass
+
+    @patch("subscription.toast")
+    @patch("subscription.register_topic")
+    @patch("subscription.get_sns_client")
+    def test_make_subscription_registers_topic(self, mock_get_sns, mock_register, mock_toast):
+        """Tests that the topic is registered once the user is subscribed to it."""
+        sns = mock_get_sns.return_value
+        sns.create_topic.return_value = {"TopicArn": "arn:test"}
+        make_subscription("a@b.com", 10.10, 12.5, 102, 5.4)
+        mock_register.assert_called_once_with(
+            "arn:test", "c17-quake-54-p101000-p125000-102")
+        sns.subscribe.assert_called_once()
+        mock_toast.assert_called_once_with("Subscription has been made!")
+
+    @patch("subscription.toast")
+    @patch("subscription.register_topic")
+    @patch("subscription.get_sns_client")
+    def test_make_subscription_registry_unavailable(self, mock_get_sns, mock_register,
+                                                    mock_toast):
+        """Tests that the user is still subscribed when the topic cannot be registered."""
+        sns = mock_get_sns.return_value
+        sns.create_topic.return_value = {"TopicArn": "arn:test"}
+        mock_register.side_effect = OperationalError("connection refused")
+        make_subscription("a@b.com", 10.10, 12.5, 102, 5.4)
+        sns.subscribe.assert_called_once()
+        mock_toast.assert_called_once_with("Subscription has been made!")
+
+
+class TestGetTopicValues:
+    """Class that groups tests for get_topic_values."""
+
+    def test_get_topic_values(self):
+        """Tests that the values match the ones encoded in the topic name."""
+        assert get_topic_values("c17-quake-54-p101000-m125000-102") == (
+            Decimal("5.4"), Decimal("10.1"), Decimal("-12.5"), 102)
 
 
 class TestCreateTopicName:
@@ -0,0 +1,75 @@
+"""
+Script for benchmarking serial and concurrent publishing of alerts
+against an in-process stand-in for SNS with a publish quota.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from os import environ as ENV
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from notification_maker import send_emails
+
+
+def make_fake_sns(latency: float, quota: float) -> SimpleNamespace:
+    """
+    Returns a client whose publish takes about the given latency,
+    and throttles calls beyond the quota a second like SNS.
+    """
+    burst = max(1, quota / 10)
+    bucket = {"tokens": burst, "updated": monotonic(), "lock": Lock()}
+
+    def publish(TopicArn: str, Subject: str, Message: str) -> dict:
+        sleep(uniform(0.5, 1.5) * latency)
+        with bucket["lock"]:
+            now = monotonic()
+            bucket["tokens"] = min(burst, bucket["tokens"] + (now - bucket["updated"]) * quota)
+            bucket["updated"] = now
+            if bucket["tokens"] < 1:
+                raise ClientError({"Error": {"Code": "Throttling",
+                                             "Message": "Rate exceeded"}}, "Publish")
+            bucket["tokens"] -= 1
+        return {"MessageId": TopicArn}
+
+    return SimpleNamespace(publish=publish)
+
+
+def make_sample_alerts(size: int) -> list[dict]:
+    """Returns alerts for one earthquake matching many topics."""
+    return [{"topic_arn": f"arn:aws:sns:eu-west-2:0:c17-quake-{i}", "magnitude": 6.1,
+             "state_name": "California", "region_name": "West Coast",
+             "time": "2025-06-11 15:17", "tsunami": False,
+             "latitude": 33.6663, "longitude": -116.771} for i in range(size)]
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark serial and concurrent alert publishing.")
+    parser.add_argument("--alerts", type=int, default=1000,
+                        help="Number of topics the earthquake matches")
+    parser.add_argument("--latency", type=float, default=0.03,
+                        help="Average seconds for the stand-in to answer a publish")
+    parser.add_argument("--quota", type=float, default=300,
+                        help="Publishes a second the stand-in allows before throttling")
+    parser.add_argument("--rate", type=float,
+                        help="Publishes a second to limit to, the quota by default")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 10, 50],
+                        help="Numbers of publish workers to compare")
+    args = parser.parse_args()
+
+    sample_alerts = make_sample_alerts(args.alerts)
+    for workers in args.workers:
+        fake_sns = make_fake_sns(args.latency, args.quota)
+        ENV["PUBLISH_WORKERS"] = str(workers)
+        ENV["PUBLISH_RATE"] = str(args.rate or args.quota)
+        stats = send_emails(sample_alerts, fake_sns)
+        print(f"{workers} workers: {stats['sent']} sent, {stats['retried']} retries, "
+              f"{stats['failed']} failed in {stats['seconds']:.2f}s "
+              f"({stats['per_second']:.0f}/s), latency p50 {stats['latency_p50']:.2f}s "
+              f"p99 {stats['latency_p99']:.2f}s max {stats['latency_max']:.2f}s")
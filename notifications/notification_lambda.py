@@ -4,10 +4,17 @@ from notification_maker import send_emails, get_sns_client
 
 
 def lambda_handler(event: dict, context: dict) -> dict:
-    """Creates a lambda handler."""
+    """
+    Creates a lambda handler.
+    Raises once every alert has been tried if any could not be published,
+    so dropped alerts fail the invocation rather than only being logged.
+    """
     if event.get("message"):
         sns = get_sns_client()
         data = event["message"]
-        send_emails(data, sns)
+        stats = send_emails(data, sns)
+        if stats["failed"]:
+            raise RuntimeError(f"Failed to send {stats['failed']} of "
+                               f"{stats['sent'] + stats['failed']} emails.")
         return {None: None}
     return {None: None}
@@ -1,9 +1,17 @@
 """Module that creates and formats the notification messages."""
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from os import environ as ENV
+from random import uniform
+from threading import Lock
+from time import monotonic, perf_counter, sleep
 
 from boto3 import client
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import (ClientError, EndpointConnectionError,
+                                 ConnectionClosedError, ConnectTimeoutError,
+                                 ReadTimeoutError)
 
 logger = logging.getLogger(__name__)
 
@@ -13,10 +21,29 @@ logging.basicConfig(
     datefmt="%Y-%m-%dT%H:%M:%S"
 )
 
+RETRY_CODES = {"Throttling", "ThrottlingException", "ThrottledException",
+               "InternalError", "InternalFailure", "ServiceUnavailable",
+               "KMSThrottlingException"}
+RETRY_ERRORS = (EndpointConnectionError, ConnectionClosedError,
+                ConnectTimeoutError, ReadTimeoutError)
+
+
+def get_publish_settings() -> dict:
+    """Returns the publish settings, which can be overridden in the environment."""
+    return {
+        "workers": int(ENV.get("PUBLISH_WORKERS", 10)),
+        "rate": float(ENV.get("PUBLISH_RATE", 100)),
+        "burst": int(ENV.get("PUBLISH_BURST", 10)),
+        "max_retries": int(ENV.get("PUBLISH_MAX_RETRIES", 3)),
+        "backoff_base": float(ENV.get("PUBLISH_BACKOFF_BASE", 0.2)),
+        "backoff_max": float(ENV.get("PUBLISH_BACKOFF_MAX", 5))
+    }
+
 
 def get_sns_client() -> client:
-    """Makes a SNS client."""
-    sns = client("sns")
+    """Makes a SNS client, with a connection for every publish worker."""
+    sns = client("sns", config=Config(
+        max_pool_connections=get_publish_settings()["workers"]))
     return sns
 
 
@@ -90,9 +117,103 @@ def publish_email(data: dict, sns: client) -> None:
         raise
 
 
-def send_emails(passed_data: list[dict], sns: client) -> None:
-    """Goes through all the topics generated."""
-    for data in passed_data:
-        if validate_keys(data) and validate_types(data):
+def make_token_bucket(rate: float, burst: int) -> dict:
+    """Returns a full token bucket refilled at rate tokens a second."""
+    return {"rate": rate, "burst": burst, "tokens": float(burst),
+            "updated": monotonic(), "lock": Lock()}
+
+
+def take_token(bucket: dict) -> None:
+    """Waits until the bucket has a token and takes it."""
+    while True:
+        with bucket["lock"]:
+            now = monotonic()
+            bucket["tokens"] = min(bucket["burst"], bucket["tokens"]
+                                   + (now - bucket["updated"]) * bucket["rate"])
+            bucket["updated"] = now
+            if bucket["tokens"] >= 1:
+                bucket["tokens"] -= 1
+                return
+            wait = (1 - bucket["tokens"]) / bucket["rate"]
+        sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True if publishing may succeed when tried again."""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in RETRY_CODES
+    return isinstance(error, RETRY_ERRORS)
+
+
+def get_retry_delay(attempt: int, settings: dict) -> float:
+    """Returns the seconds to wait before a retry, with exponential backoff and full jitter."""
+    return uniform(0, min(settings["backoff_max"],
+                          settings["backoff_base"] * 2 ** attempt))
+
+
+def publish_with_retry(data: dict, sns: client, bucket: dict, settings: dict) -> dict:
+    """
+    Publishes an email within the rate limit, retrying throttling and
+    transient errors with backoff. Returns whether it was sent and the retries taken.
+    """
+    for attempt in range(settings["max_retries"] + 1):
+        take_token(bucket)
+        try:
             publish_email(data, sns)
-    logger.info("Successfully sent all emails.")
+            return {"sent": True, "retries": attempt}
+        except (ClientError, *RETRY_ERRORS) as e:
+            if not is_retryable(e) or attempt == settings["max_retries"]:
+                logger.error("Giving up on topic %s after %s attempts.",
+                             data["topic_arn"], attempt + 1)
+                return {"sent": False, "retries": attempt}
+            sleep(get_retry_delay(attempt, settings))
+    return {"sent": False, "retries": settings["max_retries"]}
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+    """Returns the nearest-rank percentile of the values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+def send_emails(passed_data: list[dict], sns: client) -> dict:
+    """
+    Publishes an email for every valid topic generated, using a pool of workers
+    limited to the SNS publish rate. Returns the number sent, retried and failed,
+    the throughput and the percentiles of seconds until each alert was published.
+    """
+    settings = get_publish_settings()
+    bucket = make_token_bucket(settings["rate"], settings["burst"])
+    started = perf_counter()
+    alerts = [data for data in passed_data if validate_keys(data) and validate_types(data)]
+
+    def publish(data: dict) -> dict:
+        result = publish_with_retry(data, sns, bucket, settings)
+        result["latency"] = perf_counter() - started
+        return result
+
+    with ThreadPoolExecutor(max_workers=settings["workers"]) as executor:
+        results = list(executor.map(publish, alerts))
+
+    elapsed = perf_counter() - started
+    latencies = [result["latency"] for result in results if result["sent"]]
+    stats = {
+        "sent": len(latencies),
+        "retried": sum(result["retries"] for result in results),
+        "failed": len(results) - len(latencies),
+        "seconds": elapsed,
+        "per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": get_percentile(latencies, 50),
+        "latency_p99": get_percentile(latencies, 99),
+        "latency_max": max(latencies, default=0.0)
+    }
+    logger.info("Sent %s emails (%s retries, %s failed) in %.2fs, %.1f/s, "
+                "latency p50 %.2fs p99 %.2fs max %.2fs.",
+                stats["sent"], stats["retried"], stats["failed"], stats["seconds"],
+                stats["per_second"], stats["latency_p50"], stats["latency_p99"],
+                stats["latency_max"])
+    if stats["failed"]:
+        logger.error("Failed to send %s emails.", stats["failed"])
+    return stats
@@ -0,0 +1,36 @@
+# pylint: skip-file
+"""Unit tests for the functions in notification_lambda.py."""
+
+from unittest.mock import patch
+
+from pytest import raises
+
+from notification_lambda import lambda_handler
+
+
+class TestLambdaHandler:
+    """A class that groups together tests for lambda_handler()."""
+
+    @patch("notification_lambda.get_sns_client")
+    @patch("notification_lambda.send_emails")
+    def test_lambda_handler_sends_emails(self, mock_send_emails, mock_get_sns_client):
+        """Checks every alert is sent and the invocation succeeds."""
+        mock_send_emails.return_value = {"sent": 2, "failed": 0}
+        lambda_handler({"message": [{"topic_arn": "a"}, {"topic_arn": "b"}]}, None)
+        mock_send_emails.assert_called_once_with(
+            [{"topic_arn": "a"}, {"topic_arn": "b"}], mock_get_sns_client.return_value)
+
+    @patch("notification_lambda.get_sns_client")
+    @patch("notification_lambda.send_emails")
+    def test_lambda_handler_fails_when_alerts_dropped(self, mock_send_emails,
+                                                      mock_get_sns_client):
+        """Checks the invocation fails when any alert could not be published."""
+        mock_send_emails.return_value = {"sent": 1, "failed": 1}
+        with raises(RuntimeError, match="Failed to send 1 of 2 emails"):
+            lambda_handler({"message": [{"topic_arn": "a"}, {"topic_arn": "b"}]}, None)
+
+    @patch("notification_lambda.send_emails")
+    def test_lambda_handler_without_message(self, mock_send_emails):
+        """Checks nothing is sent without a message."""
+        lambda_handler({}, None)
+        mock_send_emails.assert_not_called()
@@ -3,8 +3,20 @@
 """File that tests the notification-making functions."""
 
 
+from threading import Lock
+from time import perf_counter, sleep
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
 from notification_maker import (validate_keys, validate_types,
-                                make_message, get_location_message)
+                                make_message, get_location_message,
+                                make_token_bucket, take_token, is_retryable,
+                                get_percentile, send_emails)
+
+
+def make_client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Publish")
 
 
 class TestValidateKeys:
@@ -234,3 +246,114 @@ class TestGetLocationMessage:
         occurring outside sovereign territory."""
         result = get_location_message(sample_non_country_data)
         assert result == "outside sovereign territory"
+
+
+class TestTakeToken:
+    """A class that groups together tests for take_token."""
+
+    def test_take_token_burst_is_immediate(self):
+        """Checks a full bucket gives its burst without waiting."""
+        bucket = make_token_bucket(10, 5)
+        start = perf_counter()
+        for _ in range(5):
+            take_token(bucket)
+        assert perf_counter() - start < 0.05
+
+    def test_take_token_waits_for_rate(self):
+        """Checks tokens beyond the burst are given at the rate."""
+        bucket = make_token_bucket(50, 1)
+        start = perf_counter()
+        for _ in range(6):
+            take_token(bucket)
+        assert perf_counter() - start >= 0.09
+
+
+class TestIsRetryable:
+    """A class that groups together tests for is_retryable."""
+
+    def test_is_retryable_throttling(self):
+        """Checks throttling and connection errors are retried."""
+        assert is_retryable(make_client_error("Throttling"))
+        assert is_retryable(EndpointConnectionError(endpoint_url="https://sns"))
+
+    def test_is_retryable_not_found(self):
+        """Checks errors that will not change are not retried."""
+        assert not is_retryable(make_client_error("NotFound"))
+
+
+class TestGetPercentile:
+    """A class that groups together tests for get_percentile."""
+
+    def test_get_percentile(self):
+        """Checks the nearest rank is returned."""
+        values = list(range(1, 101))
+        assert get_percentile(values, 50) == 51
+        assert get_percentile(values, 99) == 100
+        assert get_percentile([], 99) == 0.0
+
+
+class TestSendEmails:
+    """A class that groups together tests for send_emails."""
+
+    def test_send_emails_publishes_valid_topics(self, sample_data, monkeypatch):
+        """Checks every valid topic is published once and invalid ones are skipped."""
+        monkeypatch.setenv("PUBLISH_RATE", "1000")
+        sns = MagicMock()
+        sns.publish.return_value = {"MessageId": "1"}
+        alerts = [dict(sample_data, topic_arn=f"arn:{i}") for i in range(20)]
+        alerts.append(dict(sample_data, magnitude="big"))
+        stats = send_emails(alerts, sns)
+        assert sorted(call.kwargs["TopicArn"] for call in sns.publish.call_args_list) == \
+            sorted(f"arn:{i}" for i in range(20))
+        assert stats["sent"] == 20
+        assert stats["failed"] == 0
+        assert stats["latency_max"] <= stats["seconds"]
+
+    def test_send_emails_concurrently(self, sample_data, monkeypatch):
+        """Checks publishes run in parallel up to the worker count."""
+        monkeypatch.setenv("PUBLISH_WORKERS", "4")
+        monkeypatch.setenv("PUBLISH_RATE", "1000")
+        in_flight = {"now": 0, "most": 0}
+        lock = Lock()
+
+        def publish(**kwargs):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["most"] = max(in_flight["most"], in_flight["now"])
+            sleep(0.02)
+            with lock:
+                in_flight["now"] -= 1
+            return {"MessageId": "1"}
+
+        sns = MagicMock()
+        sns.publish.side_effect = publish
+        send_emails([dict(sample_data, topic_arn=f"arn:{i}") for i in range(12)], sns)
+        assert in_flight["most"] == 4
+
+    @patch("notification_maker.sleep")
+    def test_send_emails_retries_throttling(self, mock_sleep, sample_data, monkeypatch):
+        """Checks a throttled topic is retried with backoff until it is sent."""
+        monkeypatch.setenv("PUBLISH_RATE", "1000")
+        sns = MagicMock()
+        sns.publish.side_effect = [make_client_error("Throttling"),
+                                   make_client_error("Throttling"),
+                                   {"MessageId": "1"}]
+        stats = send_emails([sample_data], sns)
+        assert stats["sent"] == 1
+        assert stats["retried"] == 2
+        assert mock_sleep.call_count == 2
+
+    @patch("notification_maker.sleep")
+    def test_send_emails_gives_up(self, mock_sleep, sample_data, monkeypatch):
+        """Checks a topic that keeps failing is counted without stopping the others."""
+        monkeypatch.setenv("PUBLISH_WORKERS", "1")
+        monkeypatch.setenv("PUBLISH_RATE", "1000")
+        monkeypatch.setenv("PUBLISH_MAX_RETRIES", "2")
+        sns = MagicMock()
+        sns.publish.side_effect = [make_client_error("NotFound"),
+                                   {"MessageId": "1"}]
+        stats = send_emails([dict(sample_data, topic_arn="arn:gone"),
+                             dict(sample_data, topic_arn="arn:ok")], sns)
+        assert stats["sent"] == 1
+        assert stats["failed"] == 1
+        mock_sleep.assert_not_called()
@@ -0,0 +1,140 @@
+"""
+Script for benchmarking a single summary query against sharded backfill,
+using a local stand-in for the USGS event API.
+"""
+
+from argparse import ArgumentParser
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from logging import getLogger, WARNING
+from os import environ as ENV
+from random import uniform
+from threading import Thread
+from time import perf_counter
+import asyncio
+
+from aiohttp import web
+import requests
+
+from extract import access_api, access_api_backfill
+
+
+MAX_ALLOWED = 20_000
+
+
+def make_sample_times(start: datetime, end: datetime, size: int) -> list[int]:
+    """Return sorted millisecond event times spread over the window."""
+    return sorted(int(uniform(start.timestamp(), end.timestamp()) * 1000)
+                  for _ in range(size))
+
+
+def make_feature(i: int, time: int) -> dict:
+    """Return a fake event summary of roughly the size USGS sends."""
+    return {"type": "Feature", "id": f"bm{i}",
+            "properties": {"mag": 1.2, "place": "10 km SSW of Benchmark, CA",
+                           "time": time, "updated": time + 60_000,
+                           "url": f"https://benchmark.example/earthquake/{i}",
+                           "detail": f"https://benchmark.example/detail/bm{i}.geojson",
+                           "status": "reviewed", "tsunami": 0, "sig": 22,
+                           "net": "ci", "code": str(i), "ids": f",bm{i},",
+                           "sources": ",ci,", "types": ",origin,phase-data,",
+                           "nst": 15, "dmin": 0.07, "rms": 0.13, "gap": 115,
+                           "magType": "ml", "type": "earthquake",
+                           "title": "M 1.2 - 10 km SSW of Benchmark, CA"},
+            "geometry": {"type": "Point", "coordinates": [-116.77, 33.67, 15.8]}}
+
+
+def make_detail(i: int, time: int) -> dict:
+    """Return a fake detailed event with the products transform reads."""
+    feature = make_feature(i, time)
+    longitude, latitude, depth = feature["geometry"]["coordinates"]
+    feature["properties"].update({
+        "felt": None, "cdi": None, "mmi": None, "alert": None,
+        "products": {"origin": [{"properties": {
+            "latitude": str(latitude), "longitude": str(longitude),
+            "depth": str(depth)}}]}})
+    return feature
+
+
+def make_stand_in(times: list[int], base_latency: float, event_latency: float) -> web.Application:
+    """
+    Return an app answering count, query and detail requests like USGS,
+    including its limit on events per query, with a simulated processing time.
+    """
+    def get_matching_range(query) -> tuple[int, int]:
+        start = int(datetime.fromisoformat(query["starttime"]).timestamp() * 1000)
+        end = int(datetime.fromisoformat(query["endtime"]).timestamp() * 1000)
+        return bisect_left(times, start), bisect_right(times, end)
+
+    async def count(request):
+        first, last = get_matching_range(request.query)
+        await asyncio.sleep(base_latency)
+        return web.json_response({"count": last - first, "maxAllowed": MAX_ALLOWED})
+
+    async def query(request):
+        first, last = get_matching_range(request.query)
+        offset = int(request.query.get("offset", 1)) - 1
+        limit = int(request.query.get("limit", last - first))
+        if limit > MAX_ALLOWED:
+            return web.Response(status=400, text="Error 400: Bad Request")
+        first, last = first + offset, min(last, first + offset + limit)
+        await asyncio.sleep(base_latency + event_latency * (last - first))
+        return web.json_response({"type": "FeatureCollection",
+                                  "features": [make_feature(i, times[i])
+                                               for i in range(first, last)]})
+
+    async def detail(request):
+        i = int(request.match_info["event"].removeprefix("bm"))
+        await asyncio.sleep(base_latency)
+        return web.json_response(make_detail(i, times[i]))
+
+    app = web.Application()
+    app.router.add_get("/count", count)
+    app.router.add_get("/query", query)
+    app.router.add_get("/detail/{event}.geojson", detail)
+    return app
+
+
+def start_stand_in(app: web.Application) -> str:
+    """Serve the app from a background thread and return its url."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark single query and backfill extraction.")
+    parser.add_argument("--days", type=int, default=30,
+                        help="Length of the time window in days")
+    parser.add_argument("--events", type=int, default=18_000,
+                        help="Number of events in the window")
+    parser.add_argument("--base-latency", type=float, default=0.1,
+                        help="Simulated seconds for the stand-in to answer any request")
+    parser.add_argument("--event-latency", type=float, default=0.0001,
+                        help="Simulated seconds for the stand-in to find each event")
+    args = parser.parse_args()
+
+    window_end = datetime(2025, 6, 30)
+    window_start = window_end - timedelta(days=args.days)
+    sample_times = make_sample_times(window_start, window_end, args.events)
+    ENV["USGS_API_URL"] = start_stand_in(
+        make_stand_in(sample_times, args.base_latency, args.event_latency))
+
+    start = perf_counter()
+    try:
+        single = len(access_api(window_start, window_end)["features"])
+        single_time = perf_counter() - start
+        print(f"Single query: {single} events in {single_time:.2f}s")
+    except requests.exceptions.HTTPError as e:
+        print(f"Single query failed: {e}")
+
+    start = perf_counter()
+    backfill = asyncio.run(access_api_backfill(window_start, window_end))
+    backfill_time = perf_counter() - start
+    print(f"Backfill: {len(backfill['features'])} events in {backfill_time:.2f}s")
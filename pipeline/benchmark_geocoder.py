@@ -0,0 +1,84 @@
+"""
+Script for comparing the offline geocoder with the OpenCage answers
+already recorded in the earthquake table.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from load import get_connection
+from offline_geocoder import get_offline_address, load_boundary_layer
+
+
+def get_recorded_addresses(limit: int) -> list[dict]:
+    """Return coordinates with the state and region stored for them."""
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute("""SELECT latitude, longitude, state_name, region_name
+                         FROM earthquake
+                         JOIN "state_region_interaction" USING(state_region_interaction_id)
+                         JOIN "state" USING (state_id)
+                         JOIN "region" USING (region_id)
+                         WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                         ORDER BY time DESC
+                         LIMIT %s;""",
+                         (limit,))
+            return curs.fetchall()
+
+
+def is_matching_answer(quake: dict, address: list[str]) -> bool:
+    """Return whether the offline address gives the recorded state or country."""
+    if quake["state_name"] == "Not in the USA":
+        return address[-1] == quake["region_name"]
+    return address[-1] == "United States" and address[-2] == quake["state_name"]
+
+
+def compare_geocoders(quakes: list[dict]) -> dict:
+    """Return agreement, fallback rate and throughput of the offline geocoder."""
+    load_boundary_layer("us_states")
+    load_boundary_layer("countries")
+
+    start = perf_counter()
+    addresses = [get_offline_address(quake["latitude"], quake["longitude"])
+                 for quake in quakes]
+    duration = perf_counter() - start
+
+    answered = [(quake, address) for quake, address in zip(quakes, addresses)
+                if address is not None]
+    mismatches = [(quake, address) for quake, address in answered
+                  if not is_matching_answer(quake, address)]
+    return {
+        "lookups": len(quakes),
+        "answered": len(answered),
+        "fallback_rate": 1 - len(answered) / len(quakes) if quakes else 0.0,
+        "agreement": 1 - len(mismatches) / len(answered) if answered else 0.0,
+        "lookups_per_second": len(quakes) / duration if duration else 0.0,
+        "mismatches": mismatches
+    }
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(
+        description="Compare the offline geocoder with recorded OpenCage answers.")
+    parser.add_argument("--limit", type=int, default=100_000,
+                        help="Number of most recent earthquakes to compare")
+    parser.add_argument("--show-mismatches", action="store_true",
+                        help="Print each earthquake the geocoders disagree on")
+    args = parser.parse_args()
+
+    results = compare_geocoders(get_recorded_addresses(args.limit))
+    print(f"Lookups: {results['lookups']}")
+    print(f"Answered offline: {results['answered']}"
+          f" (fallback to OpenCage: {results['fallback_rate']:.1%})")
+    print(f"Agreement with OpenCage: {results['agreement']:.2%}")
+    print(f"Throughput: {results['lookups_per_second']:.0f} lookups/s")
+    if args.show_mismatches:
+        for quake, address in results["mismatches"]:
+            print(f"{quake['latitude']}, {quake['longitude']}: recorded"
+                  f" {quake['state_name']}/{quake['region_name']}, offline {address}")
@@ -0,0 +1,90 @@
+"""Script for benchmarking row by row and bulk uploads to the database."""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from logging import getLogger, WARNING
+from random import choice, uniform, randint
+from time import perf_counter
+
+from dotenv import load_dotenv
+from pandas import DataFrame
+from pytz import timezone
+
+from load import get_connection, upload_df_to_db
+
+
+BENCHMARK_URL = "https://benchmark.example/earthquake"
+
+
+def make_sample_df(size: int) -> DataFrame:
+    """Return DataFrame of fake earthquakes in the form load uploads."""
+    london_tz = timezone("Europe/London")
+    now = london_tz.localize(datetime.now())
+    locations = [("California", "West Coast"), ("Alaska", "Alaska"),
+                 ("Not in the USA", "Japan"), ("Not in the USA", "Chile")]
+    rows = []
+    for i in range(size):
+        state_name, region_name = choice(locations)
+        rows.append({
+            "magnitude": round(uniform(0, 8), 2),
+            "latitude": uniform(-90, 90),
+            "longitude": uniform(-180, 180),
+            "time": now - timedelta(seconds=i),
+            "updated": now,
+            "depth": uniform(0, 100),
+            "url": f"{BENCHMARK_URL}/{i}",
+            "felt": randint(0, 100),
+            "tsunami": False,
+            "cdi": None,
+            "mmi": None,
+            "nst": randint(0, 50),
+            "sig": randint(0, 500),
+            "net": "us",
+            "dmin": uniform(0, 1),
+            "alert": None,
+            "magnitude_type": "Ml",
+            "state_name": state_name,
+            "region_name": region_name
+        })
+    return DataFrame(rows)
+
+
+def delete_benchmark_rows():
+    """Remove any fake earthquakes added by the benchmark."""
+    with get_connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute("""DELETE FROM earthquake WHERE "url" LIKE %s;""",
+                         (f"{BENCHMARK_URL}/%",))
+        conn.commit()
+
+
+def time_upload(data: DataFrame, bulk: bool) -> float:
+    """Return seconds taken to upload the data."""
+    delete_benchmark_rows()
+    start = perf_counter()
+    upload_df_to_db(data, bulk)
+    duration = perf_counter() - start
+    delete_benchmark_rows()
+    return duration
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark database upload modes.")
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=[1_000, 10_000, 100_000],
+                        help="Numbers of rows to upload")
+    parser.add_argument("--skip-row", action="store_true",
+                        help="Only time the bulk upload")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        sample = make_sample_df(n)
+        bulk_time = time_upload(sample, bulk=True)
+        print(f"{n} rows - bulk: {bulk_time:.2f}s ({n / bulk_time:.0f} rows/s)")
+        if not args.skip_row:
+            row_time = time_upload(sample, bulk=False)
+            print(f"{n} rows - row:  {row_time:.2f}s ({n / row_time:.0f} rows/s)"
+                  f" - {row_time / bulk_time:.1f}x slower")
@@ -0,0 +1,79 @@
+"""
+Script for comparing staged and streaming pipeline runs end to end,
+using a local stand-in for the USGS API and the database in .env.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from logging import getLogger, WARNING, INFO
+from os import environ as ENV
+from time import perf_counter, sleep
+from unittest.mock import patch
+
+from dotenv import load_dotenv
+
+from benchmark_extract import make_sample_times, make_stand_in, start_stand_in
+from benchmark_load import delete_benchmark_rows
+from pipeline import run_pipeline, run_streaming_pipeline
+from topic import get_topic_dictionaries
+
+
+def make_sample_topics(size: int) -> list[dict]:
+    """Return fake subscription topics around the stand-in's events."""
+    return [{"topic_arn": f"arn:aws:sns:eu-west-2:0:c17-quake-{i}",
+             "magnitude": 1.0, "latitude": 33.67, "longitude": -116.77,
+             "radius": 10 + i} for i in range(size)]
+
+
+def run_staged() -> tuple[int, int]:
+    """Return uploaded earthquakes and alerts from the staged pipeline."""
+    uploaded = run_pipeline(window_start, window_end)
+    if uploaded is None:
+        return 0, 0
+    return len(uploaded), len(get_topic_dictionaries(uploaded))
+
+
+def run_streaming() -> tuple[int, int]:
+    """Return uploaded earthquakes and alerts from the streaming pipeline."""
+    uploaded, alerts = run_streaming_pipeline(window_start, window_end)
+    return len(uploaded), len(alerts)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    getLogger().setLevel(WARNING)
+    getLogger("stream").setLevel(INFO)
+
+    parser = ArgumentParser(description="Benchmark staged and streaming pipeline runs.")
+    parser.add_argument("--events", type=int, default=500,
+                        help="Number of events in the time window")
+    parser.add_argument("--request-latency", type=float, default=0.05,
+                        help="Simulated seconds for the stand-in to answer a request")
+    parser.add_argument("--geocode-latency", type=float, default=0.01,
+                        help="Simulated seconds per reverse geocode")
+    parser.add_argument("--topics", type=int, default=100,
+                        help="Number of subscription topics to match")
+    args = parser.parse_args()
+
+    window_end = datetime.now()
+    window_start = window_end - timedelta(hours=1)
+    stand_in = start_stand_in(make_stand_in(
+        make_sample_times(window_start, window_end, args.events), args.request_latency, 0))
+    ENV["USGS_API_URL"] = stand_in
+    ENV["USGS_DETAIL_URL"] = f"{stand_in}/detail"
+
+    def get_address(latitude, longitude):
+        sleep(args.geocode_latency)
+        return ["California", "United States"]
+
+    topics = make_sample_topics(args.topics)
+    with patch("transform.get_address", get_address), \
+            patch("topic.get_subscription_topics", return_value=topics), \
+            patch("stream.get_subscription_topics", return_value=topics):
+        for name, run in [("Staged", run_staged), ("Streaming", run_streaming)]:
+            delete_benchmark_rows()
+            start = perf_counter()
+            earthquakes, alerts = run()
+            print(f"{name}: {earthquakes} earthquakes, {alerts} alerts"
+                  f" in {perf_counter() - start:.2f}s")
+        delete_benchmark_rows()
@@ -0,0 +1,104 @@
+"""
+Script for benchmarking brute force topic matching against the topic index
+and the batch matcher, checking they all find the same alerts.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+from logging import getLogger, WARNING
+from random import Random
+from time import perf_counter
+
+from pandas import DataFrame
+
+from topic import (get_applicable_topics, build_topic_index, get_indexed_topics,
+                   get_batch_topics)
+
+
+def make_location(rng: Random) -> tuple[float, float]:
+    """Return a location, mostly in the United States and otherwise anywhere."""
+    if rng.random() < 0.7:
+        return rng.uniform(24, 50), rng.uniform(-125, -66)
+    return rng.uniform(-70, 80), rng.uniform(-180, 180)
+
+
+def make_sample_topics(rng: Random, size: int) -> list[dict]:
+    """Return subscription topics with radii from ten to a thousand kilometres."""
+    topics = []
+    for i in range(size):
+        latitude, longitude = make_location(rng)
+        topics.append({"topic_arn": f"arn:aws:sns:eu-west-2:0:c17-quake-{i}",
+                       "magnitude": rng.randint(0, 70) / 10,
+                       "latitude": latitude, "longitude": longitude,
+                       "radius": int(10 ** rng.uniform(1, 3))})
+    return topics
+
+
+def make_sample_rows(rng: Random, size: int, burst: bool = False) -> list[dict]:
+    """
+    Return earthquakes with mostly small magnitudes,
+    which are aftershocks within half a degree of one place for a burst.
+    """
+    rows = []
+    epicentre = make_location(rng)
+    for _ in range(size):
+        latitude, longitude = make_location(rng)
+        if burst:
+            latitude = epicentre[0] + rng.uniform(-0.5, 0.5)
+            longitude = epicentre[1] + rng.uniform(-0.5, 0.5)
+        rows.append({"magnitude": round(min(9.0, rng.expovariate(1.0) + 0.5), 1),
+                     "latitude": latitude, "longitude": longitude,
+                     "state_name": "Unknown State", "region_name": "Unknown",
+                     "time": datetime(2025, 6, 1), "tsunami": False})
+    return rows
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(
+        description="Benchmark brute force, indexed and batch topic matching.")
+    parser.add_argument("--topics", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Numbers of subscription topics to match against")
+    parser.add_argument("--events", type=int, default=1000,
+                        help="Number of earthquakes to match with the index")
+    parser.add_argument("--brute-events", type=int, default=20,
+                        help="Number of those earthquakes to also match by brute force")
+    parser.add_argument("--burst", action="store_true",
+                        help="Make every earthquake an aftershock near one place")
+    args = parser.parse_args()
+
+    random = Random(0)
+    sample_rows = make_sample_rows(random, args.events, args.burst)
+    sample_data = DataFrame(sample_rows)
+    for size in args.topics:
+        sample_topics = make_sample_topics(random, size)
+
+        start = perf_counter()
+        index = build_topic_index(sample_topics)
+        build_time = perf_counter() - start
+
+        start = perf_counter()
+        indexed = [get_indexed_topics(index, sample_topics, row) for row in sample_rows]
+        index_time = (perf_counter() - start) / len(sample_rows)
+
+        start = perf_counter()
+        brute = [get_applicable_topics(sample_topics, row)
+                 for row in sample_rows[:args.brute_events]]
+        brute_time = (perf_counter() - start) / len(brute)
+
+        start = perf_counter()
+        batch = get_batch_topics(sample_data, sample_topics)
+        batch_time = (perf_counter() - start) / len(sample_rows)
+
+        assert brute == indexed[:len(brute)], "Index and brute force alerts differ"
+        assert batch == [alert for alerts in indexed for alert in alerts], \
+            "Batch and index alerts differ"
+        alerts = sum(len(alerts) for alerts in indexed)
+        print(f"{size} topics: index built in {build_time:.2f}s, "
+              f"{alerts} alerts for {len(sample_rows)} earthquakes")
+        print(f"  Brute force: {brute_time * 1000:.3f}ms per earthquake")
+        print(f"  Index: {index_time * 1000:.3f}ms per earthquake "
+              f"({brute_time / index_time:.0f}x)")
+        print(f"  Batch: {batch_time * 1000:.3f}ms per earthquake "
+              f"({brute_time / batch_time:.0f}x)")
@@ -0,0 +1,82 @@
+"""
+Script for benchmarking the columnar DataFrame builder in transform
+against growing the DataFrame one row at a time.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, WARNING
+from random import uniform, randint, choice
+from time import perf_counter
+from unittest.mock import patch
+
+import pandas as pd
+
+from transform import (transform, clean_earthquake_data, make_row_for_dataframe,
+                       LOAD_COLUMNS)
+
+
+def make_sample_events(size: int) -> list[dict]:
+    """Return fake detailed USGS events in the form extract returns."""
+    events = []
+    for i in range(size):
+        latitude = uniform(-60, 70)
+        longitude = uniform(-180, 180)
+        depth = uniform(0, 100)
+        events.append({
+            "type": "Feature",
+            "properties": {
+                "mag": round(uniform(0, 8), 2), "time": 1749655031680 + i,
+                "updated": 1749675581157 + i,
+                "url": f"https://benchmark.example/earthquake/{i}",
+                "felt": choice([None, randint(0, 100)]), "cdi": None, "mmi": None,
+                "alert": choice([None, "green", "yellow"]), "tsunami": randint(0, 1),
+                "sig": randint(0, 500), "net": choice(["ci", "us", "ak", "nc"]),
+                "ids": f",bm{i},", "sources": ",bm,", "nst": choice([None, 15]),
+                "dmin": uniform(0, 1), "magType": choice(["ml", "md", "mb"]),
+                "type": "earthquake",
+                "products": {"origin": [{"properties": {
+                    "latitude": str(latitude), "longitude": str(longitude),
+                    "depth": str(depth)}}]}
+            }
+        })
+    return events
+
+
+def transform_by_row(data_from_extract: list[dict]) -> pd.DataFrame:
+    """Return the DataFrame built the old way, assigning one row at a time."""
+    earthquakes = clean_earthquake_data(data_from_extract)
+    df = pd.DataFrame(columns=LOAD_COLUMNS)
+    for i, earthquake in enumerate(earthquakes):
+        df.loc[i] = make_row_for_dataframe(earthquake)
+    return df
+
+
+def time_transform(function, events: list[dict]) -> float:
+    """Return seconds taken to transform the events, without geocoding."""
+    with patch("transform.get_address", return_value=["California", "United States"]):
+        start = perf_counter()
+        function(events)
+        return perf_counter() - start
+
+
+if __name__ == "__main__":
+    getLogger().setLevel(WARNING)
+
+    parser = ArgumentParser(description="Benchmark building the transformed DataFrame.")
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=[100, 10_000, 50_000],
+                        help="Numbers of events to transform")
+    parser.add_argument("--skip-row", action="store_true",
+                        help="Only time the columnar builder")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        sample = make_sample_events(n)
+        columnar_time = time_transform(transform, sample)
+        print(f"{n} events - columnar: {columnar_time:.2f}s"
+              f" ({n / columnar_time:.0f} events/s)")
+        if not args.skip_row:
+            row_time = time_transform(transform_by_row, sample)
+            print(f"{n} events - by row:   {row_time:.2f}s"
+                  f" ({n / row_time:.0f} events/s)"
+                  f" - {row_time / columnar_time:.1f}x slower")
@@ -9,6 +9,10 @@ from datetime import datetime
 from pytz import timezone
 from unittest.mock import MagicMock
 
+from load import dimension_cache
+from geocode import cache_connections, cache_stats
+from topic import registry_cache
+
 
 @fixture
 def example_detailed_event():
@@ -27,26 +31,36 @@ def expected_columns():
     ]
 
 
+@fixture(autouse=True)
+def empty_dimension_cache():
+    """Stops dimension ids cached by one test leaking into another."""
+    dimension_cache.clear()
+
+
+@fixture(autouse=True)
+def empty_registry_cache():
+    """Stops subscription topics cached by one test leaking into another."""
+    registry_cache.clear()
+
+
+@fixture(autouse=True)
+def empty_geocode_cache(tmp_path, monkeypatch):
+    """Gives each test its own empty geocode cache file."""
+    monkeypatch.setenv("GEOCODE_CACHE_PATH", str(tmp_path / "geocode_cache.db"))
+    cache_connections.clear()
+    cache_stats.update({"hits": 0, "misses": 0})
+    yield
+    for conn in cache_connections.values():
+        conn.close()
+    cache_connections.clear()
+
+
 @fixture
 def mock_conn():
     """Empty connection object."""
     return MagicMock()
 
 
-@fixture
-def example_dict():
-    """Example record in database."""
-    return {
-        "earthquake_id": 1, "magnitude": 2.5, "latitude": 10.0, "longitude": 20.0,
-        "time": "2024-01-01", "updated": "2024-01-02", "depth": 5.0, "url": "example.com",
-        "felt": 1, "tsunami": 0, "cdi": None, "mmi": None, "nst": None,
-        "sig": None, "net": None, "dmin": None, "alert": None,
-        "location_source": None, "magnitude_type": None,
-        "state_name": "California", "region_name": "West Coast",
-        "state_id": 12, "region_id": 4
-    }
-
-
 @fixture
 def example_df():
     """Example dataframe with two earthquake entries."""
@@ -70,28 +84,9 @@ def example_df():
     ])
 
 
-@fixture
-def example_df2():
-    """Second example dataframe with one duplicate entry from example_df."""
-    london_tz = timezone("Europe/London")
-    return DataFrame([
-        {
-            "earthquake_id": 1, "magnitude": 2.5, "latitude": 10.0, "longitude": 20.0,
-            "time": london_tz.localize(datetime.fromtimestamp(1749753475/1000)),
-            "updated": london_tz.localize(datetime.fromtimestamp(1749753475/1000)),
-            "depth": 5.0, "url": "example.com",
-            "felt": 1, "tsunami": 0, "cdi": 3.1, "mmi": 2.3, "nst": 1,
-            "sig": 1, "net": "us", "dmin": 0.1, "alert": "green",
-            "location_source": "us", "magnitude_type": "mb",
-            "state_name": "California", "region_name": "West Coast",
-            "state_id": 12, "region_id": 4
-        }
-    ])
-
-
 @fixture
 def example_diff():
-    """Expected difference between example_df and example_df2 (only the unique row)."""
+    """Expected prepared row of example_df when only the second earthquake is new."""
     london_tz = timezone("Europe/London")
     return DataFrame([
         {
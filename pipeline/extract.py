@@ -2,12 +2,17 @@
 Extracts earthquake data from the USGS API and returns detailed event information.
 """
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from math import ceil
+from os import environ as ENV
+from random import uniform
+from urllib.parse import urlencode
 import asyncio
 
 import requests
-from aiohttp import ClientSession
-from aiohttp.client_exceptions import ContentTypeError
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from aiohttp.client_exceptions import ClientError, ContentTypeError
 
 logger = logging.getLogger(__name__)
 
@@ -17,19 +22,45 @@ logging.basicConfig(
     datefmt="%Y-%m-%dT%H:%M:%S"
 )
 
+# Statuses worth retrying, as USGS may recover from them.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def access_api(start: datetime, end: datetime) -> dict:
-    """Fetches earthquake events from the USGS API as a JSON object."""
-    base_url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+fetch_stats = {"succeeded": 0, "retried": 0, "abandoned": 0}
+
+
+def get_usgs_api_url() -> str:
+    """Returns the USGS event API base url, which can be pointed at a stand-in."""
+    return ENV.get("USGS_API_URL", "https://earthquake.usgs.gov/fdsnws/event/1")
+
+
+def get_summary_params(start: datetime, end: datetime,
+                       updated_after: datetime | None = None) -> dict:
+    """
+    Returns query parameters for earthquakes in a time window,
+    only including events updated after updated_after if it is given.
+    """
     params = {
         "format": "geojson",
         "starttime": start.strftime("%Y-%m-%dT%H:%M:%S"),
         "endtime": end.strftime("%Y-%m-%dT%H:%M:%S"),
         "eventtype": "earthquake"
     }
+    if updated_after is not None:
+        params["updatedafter"] = updated_after.astimezone(
+            timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+    return params
+
+
+def access_api(start: datetime, end: datetime,
+               updated_after: datetime | None = None) -> dict:
+    """
+    Fetches earthquake events from the USGS API as a JSON object,
+    only including events updated after updated_after if it is given.
+    """
+    params = get_summary_params(start, end, updated_after)
 
     logger.info("Requesting events from USGS API.")
-    response = requests.get(base_url, params=params)
+    response = requests.get(f"{get_usgs_api_url()}/query", params=params)
     response.raise_for_status()
     return response.json()
 
@@ -43,45 +74,230 @@ def get_event_ids_from_json_list(event_features: list[dict]) -> list[str]:
 def create_usgs_urls_from_event_ids(event_ids: list[str]) -> list[str]:
     """Constructs detail URLs from USGS event IDs."""
     logger.info("Creating USGS detail URLs.")
+    detail_url = ENV.get("USGS_DETAIL_URL",
+                         "https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail")
     return [
-        f"https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/{event_id}.geojson"
+        f"{detail_url}/{event_id}.geojson"
         for event_id in event_ids
     ]
 
 
-async def make_api_call(session: ClientSession, url: str) -> dict:
-    """Makes a single async API call to fetch event details."""
-    logger.debug("Making API call to %s", url)
-    response = await session.get(url)
+def get_fetch_settings() -> dict:
+    """Returns the detail fetch settings, which can be overridden in the environment."""
+    return {
+        "workers": int(ENV.get("FETCH_WORKERS", 20)),
+        "connection_limit": int(ENV.get("FETCH_CONNECTION_LIMIT", 20)),
+        "keepalive": float(ENV.get("FETCH_KEEPALIVE", 30)),
+        "dns_cache_ttl": int(ENV.get("FETCH_DNS_CACHE_TTL", 300)),
+        "timeout": float(ENV.get("FETCH_TIMEOUT", 10)),
+        "max_retries": int(ENV.get("FETCH_MAX_RETRIES", 4)),
+        "backoff_base": float(ENV.get("FETCH_BACKOFF_BASE", 0.5)),
+        "backoff_max": float(ENV.get("FETCH_BACKOFF_MAX", 30))
+    }
 
-    try:
-        data = await response.json()
-    except ContentTypeError as e:
-        logger.error("URL %s caused Content Type Error: %s", url, e.status)
-        return {}
-
-    if response.status == 200:
-        logger.info("Successful API call: %s", url)
-        return data
+
+def get_retry_delay(attempt: int, retry_after: str | None, settings: dict) -> float:
+    """
+    Returns seconds to wait before retrying, honouring a Retry-After header
+    (in seconds or as a date) or else using exponential backoff with full jitter.
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after)
+                         - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), settings["backoff_max"])
+
+    return uniform(0, min(settings["backoff_max"],
+                          settings["backoff_base"] * 2 ** attempt))
+
+
+def make_session(settings: dict) -> ClientSession:
+    """Returns a session whose pooled connections are shared by every call."""
+    connector = TCPConnector(limit=settings["connection_limit"],
+                             keepalive_timeout=settings["keepalive"],
+                             ttl_dns_cache=settings["dns_cache_ttl"])
+    return ClientSession(connector=connector,
+                         timeout=ClientTimeout(total=settings["timeout"]))
+
+
+async def make_api_call(session: ClientSession, url: str,
+                        settings: dict | None = None) -> dict:
+    """
+    Makes a single async API call to fetch event details,
+    retrying timeouts, connection errors and throttled or failed responses.
+    """
+    if settings is None:
+        settings = get_fetch_settings()
+
+    for attempt in range(settings["max_retries"] + 1):
+        logger.debug("Making API call to %s", url)
+        retry_after = None
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    logger.info("Successful API call: %s", url)
+                    fetch_stats["succeeded"] += 1
+                    return data
+                if response.status not in RETRY_STATUSES:
+                    logger.error("URL %s returned status %s", url, response.status)
+                    break
+                retry_after = response.headers.get("Retry-After")
+                logger.warning("URL %s returned status %s", url, response.status)
+        except ContentTypeError as e:
+            logger.error("URL %s caused Content Type Error: %s", url, e.status)
+            break
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning("API call to %s failed: %r", url, e)
+
+        if attempt < settings["max_retries"]:
+            fetch_stats["retried"] += 1
+            await asyncio.sleep(get_retry_delay(attempt, retry_after, settings))
+
+    logger.error("Abandoned API call: %s", url)
+    fetch_stats["abandoned"] += 1
     return {}
 
 
 async def make_many_api_calls(urls: list[str]) -> list[dict]:
-    """Makes multiple async API calls and returns list of results."""
+    """
+    Makes multiple async API calls with a bounded number of workers
+    sharing one pooled session, and returns list of results.
+    """
     logger.info("Fetching detailed event data from USGS.")
-    async with ClientSession() as session:
-        tasks = [make_api_call(session, url) for url in urls]
-        return await asyncio.gather(*tasks)
+    settings = get_fetch_settings()
+    fetch_stats.update({"succeeded": 0, "retried": 0, "abandoned": 0})
+    semaphore = asyncio.Semaphore(settings["workers"])
+
+    async def fetch(url: str) -> dict:
+        async with semaphore:
+            return await make_api_call(session, url, settings)
+
+    async with make_session(settings) as session:
+        results = await asyncio.gather(*[fetch(url) for url in urls])
+
+    logger.info("Detail fetch stats: %s", fetch_stats)
+    return results
+
+
+def get_fetch_stats() -> dict:
+    """Returns counts of succeeded, retried and abandoned calls from the last fetch."""
+    return dict(fetch_stats)
+
+
+def get_backfill_settings() -> dict:
+    """Returns the backfill settings, which can be overridden in the environment."""
+    return {
+        "workers": int(ENV.get("BACKFILL_WORKERS", 4)),
+        "shard_size": int(ENV.get("BACKFILL_SHARD_SIZE", 5_000)),
+        "page_size": int(ENV.get("BACKFILL_PAGE_SIZE", 20_000))
+    }
+
+
+async def get_event_count(session: ClientSession, params: dict, settings: dict) -> int:
+    """Returns the number of events matching the query from the count endpoint."""
+    data = await make_api_call(
+        session, f"{get_usgs_api_url()}/count?{urlencode(params)}", settings)
+    if "count" not in data:
+        raise ClientError(f"Could not count events from {params['starttime']}"
+                          f" to {params['endtime']}")
+    return data["count"]
+
+
+def split_time_window(start: datetime, end: datetime,
+                      shards: int) -> list[tuple[datetime, datetime]]:
+    """Returns the time window split into equal consecutive shards."""
+    step = (end - start) / shards
+    return [(start + step * i, start + step * (i + 1) if i < shards - 1 else end)
+            for i in range(shards)]
+
+
+async def fetch_shard(session: ClientSession, semaphore: asyncio.Semaphore,
+                      params: dict, settings: dict) -> list[dict]:
+    """
+    Returns the event summaries in one shard,
+    paging with offset and limit if it is too dense for one query.
+    """
+    page_size = get_backfill_settings()["page_size"]
+    async with semaphore:
+        count = await get_event_count(session, params, settings)
+
+    async def fetch_page(offset: int) -> list[dict]:
+        page_params = {**params, "orderby": "time-asc",
+                       "offset": offset, "limit": page_size}
+        async with semaphore:
+            data = await make_api_call(
+                session, f"{get_usgs_api_url()}/query?{urlencode(page_params)}", settings)
+        if "features" not in data:
+            raise ClientError(f"Could not fetch events from {params['starttime']}"
+                              f" to {params['endtime']} at offset {offset}")
+        return data["features"]
+
+    pages = await asyncio.gather(*[fetch_page(offset)
+                                   for offset in range(1, count + 1, page_size)])
+    return [feature for page in pages for feature in page]
+
+
+def merge_features(shards: list[list[dict]]) -> list[dict]:
+    """Returns the features of every shard, keeping the latest version of each event."""
+    features = {}
+    for shard in shards:
+        for feature in shard:
+            kept = features.get(feature["id"])
+            if kept is None or feature["properties"]["updated"] > kept["properties"]["updated"]:
+                features[feature["id"]] = feature
+    return list(features.values())
+
+
+async def access_api_backfill(start: datetime, end: datetime,
+                              updated_after: datetime | None = None) -> dict:
+    """
+    Fetches earthquake events for a long time window from the USGS API,
+    split into shards sized from the count endpoint and fetched concurrently.
+    """
+    settings = get_fetch_settings()
+    backfill_settings = get_backfill_settings()
+    semaphore = asyncio.Semaphore(backfill_settings["workers"])
+
+    async with make_session(settings) as session:
+        total = await get_event_count(
+            session, get_summary_params(start, end, updated_after), settings)
+        windows = split_time_window(
+            start, end, max(1, ceil(total / backfill_settings["shard_size"])))
+        logger.info("Backfilling %s events in %s shards.", total, len(windows))
+        shards = await asyncio.gather(*[
+            fetch_shard(session, semaphore,
+                        get_summary_params(shard_start, shard_end, updated_after),
+                        settings)
+            for shard_start, shard_end in windows])
+
+    features = merge_features(shards)
+    logger.info("Backfilled %s distinct events.", len(features))
+    return {"type": "FeatureCollection", "features": features}
 
 
-def extract(api: str, start_time: datetime, end_time: datetime) -> list[dict]:
-    """Main extract function to retrieve and return detailed earthquake data."""
+def extract(api: str, start_time: datetime, end_time: datetime,
+            updated_after: datetime | None = None, backfill: bool = False) -> list[dict]:
+    """
+    Main extract function to retrieve and return detailed earthquake data.
+    Backfill splits the window into concurrent shards for long time ranges.
+    """
     if api.upper() != "USGS":
         raise ValueError("Only 'USGS' API is supported currently.")
 
     try:
-        summary_json = access_api(start_time, end_time)
-    except requests.exceptions.RequestException as e:
+        if backfill:
+            summary_json = asyncio.run(
+                access_api_backfill(start_time, end_time, updated_after))
+        else:
+            summary_json = access_api(start_time, end_time, updated_after)
+    except (requests.exceptions.RequestException, ClientError) as e:
         logger.warning("No data returned or API error: %s", e)
         return []
 
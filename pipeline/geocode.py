@@ -0,0 +1,185 @@
+"""
+Persistent cache of reverse geocoded addresses, kept in a local SQLite file
+and keyed on coordinates rounded to a configurable grid.
+"""
+import logging
+import sqlite3
+from os import environ as ENV
+from time import time
+
+from dotenv import load_dotenv
+from psycopg import Connection
+
+from load import get_connection
+
+
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(
+    level="INFO",
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S"
+)
+
+cache_stats = {"hits": 0, "misses": 0}
+
+# Open SQLite connections keyed by file path, kept between warm lambda invocations.
+cache_connections = {}
+
+
+def get_cache_precision() -> int:
+    """Return number of decimal places coordinates are rounded to for the cache."""
+    return int(ENV.get("GEOCODE_CACHE_PRECISION", 2))
+
+
+def get_cache_size() -> int:
+    """Return maximum number of addresses kept in the cache."""
+    return int(ENV.get("GEOCODE_CACHE_SIZE", 100_000))
+
+
+def get_cache_connection() -> sqlite3.Connection:
+    """Return connection to the geocode cache, creating the file if needed."""
+    path = ENV.get("GEOCODE_CACHE_PATH", "/tmp/geocode_cache.db")
+    if path not in cache_connections:
+        logger.info("Opening geocode cache at %s...", path)
+        # Shared with the worker threads the streaming pipeline geocodes in.
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("""CREATE TABLE IF NOT EXISTS address (
+                        precision INTEGER NOT NULL,
+                        lat_key INTEGER NOT NULL,
+                        lon_key INTEGER NOT NULL,
+                        state TEXT NOT NULL,
+                        country TEXT NOT NULL,
+                        last_used REAL NOT NULL,
+                        PRIMARY KEY (precision, lat_key, lon_key));""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS address_last_used
+                        ON address (last_used);""")
+        conn.commit()
+        cache_connections[path] = conn
+    return cache_connections[path]
+
+
+def get_grid_key(latitude: float, longitude: float, precision: int) -> tuple[int, int]:
+    """Return the grid cell the coordinates fall in."""
+    scale = 10 ** precision
+    return round(float(latitude) * scale), round(float(longitude) * scale)
+
+
+def evict_least_recently_used(conn: sqlite3.Connection):
+    """Remove the least recently used addresses above the cache size."""
+    excess = conn.execute("SELECT COUNT(*) FROM address;").fetchone()[0] \
+        - get_cache_size()
+    if excess > 0:
+        logger.info("Evicting %s addresses from geocode cache.", excess)
+        conn.execute("""DELETE FROM address WHERE rowid IN (
+                        SELECT rowid FROM address
+                        ORDER BY last_used LIMIT ?);""",
+                     (excess,))
+
+
+def get_cached_address(latitude: float, longitude: float) -> list[str] | None:
+    """Return address for the coordinates if it is in the cache."""
+    precision = get_cache_precision()
+    lat_key, lon_key = get_grid_key(latitude, longitude, precision)
+    try:
+        conn = get_cache_connection()
+        result = conn.execute("""SELECT state, country FROM address
+                              WHERE precision = ? AND lat_key = ? AND lon_key = ?;""",
+                              (precision, lat_key, lon_key)).fetchone()
+        if result is None:
+            cache_stats["misses"] += 1
+            return None
+        conn.execute("""UPDATE address SET last_used = ?
+                     WHERE precision = ? AND lat_key = ? AND lon_key = ?;""",
+                     (time(), precision, lat_key, lon_key))
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning("Geocode cache unavailable: %s", e)
+        cache_stats["misses"] += 1
+        return None
+
+    logger.debug("Found cached address for %s, %s.", latitude, longitude)
+    cache_stats["hits"] += 1
+    return list(result)
+
+
+def cache_address(latitude: float, longitude: float, address: list[str]):
+    """Store the address for the coordinates in the cache."""
+    precision = get_cache_precision()
+    lat_key, lon_key = get_grid_key(latitude, longitude, precision)
+    try:
+        conn = get_cache_connection()
+        conn.execute("""INSERT OR REPLACE INTO address
+                     VALUES (?, ?, ?, ?, ?, ?);""",
+                     (precision, lat_key, lon_key, address[-2], address[-1], time()))
+        evict_least_recently_used(conn)
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning("Could not cache address: %s", e)
+
+
+def is_cache_empty() -> bool:
+    """Return whether the cache holds no addresses."""
+    try:
+        conn = get_cache_connection()
+        return conn.execute("SELECT 1 FROM address LIMIT 1;").fetchone() is None
+    except sqlite3.Error as e:
+        logger.warning("Geocode cache unavailable: %s", e)
+        return False
+
+
+def warm_geocode_cache(db_conn: Connection) -> int:
+    """
+    Fill the cache from coordinates already stored in the earthquake table.
+    Earthquakes without a country are skipped as they may be failed lookups.
+    Returns the number of coordinates read from the database.
+    """
+    logger.info("Warming geocode cache from database...")
+    with db_conn.cursor() as curs:
+        curs.execute("""SELECT latitude, longitude, state_name, region_name
+                     FROM earthquake
+                     JOIN "state_region_interaction" USING(state_region_interaction_id)
+                     JOIN "state" USING (state_id)
+                     JOIN "region" USING (region_id)
+                     WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                     AND region_name != 'No Country'
+                     ORDER BY updated DESC
+                     LIMIT %s;""",
+                     (get_cache_size(),))
+        quakes = curs.fetchall()
+
+    precision = get_cache_precision()
+    now = time()
+    addresses = []
+    for quake in quakes:
+        if quake["state_name"] == "Not in the USA":
+            address = ["Unknown", quake["region_name"]]
+        else:
+            address = [quake["state_name"], "United States"]
+        addresses.append((precision,
+                          *get_grid_key(quake["latitude"], quake["longitude"], precision),
+                          *address, now))
+
+    conn = get_cache_connection()
+    conn.executemany("""INSERT OR IGNORE INTO address
+                     VALUES (?, ?, ?, ?, ?, ?);""",
+                     addresses)
+    evict_least_recently_used(conn)
+    conn.commit()
+    logger.info("Geocode cache warmed with %s coordinates.", len(addresses))
+    return len(addresses)
+
+
+def get_cache_stats() -> dict:
+    """Return hit and miss counts for the cache since the process started."""
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    return {
+        "hits": cache_stats["hits"],
+        "misses": cache_stats["misses"],
+        "hit_rate": cache_stats["hits"] / lookups if lookups else 0.0
+    }
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    warm_geocode_cache(get_connection())
@@ -6,12 +6,45 @@ from datetime import datetime
 from pytz import timezone
 
 from dotenv import load_dotenv
-from pandas import DataFrame, to_numeric
+from pandas import DataFrame, to_numeric, isna
 from psycopg import Connection, connect, rows, DatabaseError
 
 
 logger = getLogger(__name__)
 
+EARTHQUAKE_COLUMNS = ["magnitude", "latitude", "longitude", "time", "updated", "depth",
+                      "url", "felt", "tsunami", "cdi", "mmi", "nst", "sig", "net", "dmin",
+                      "alert", "magnitude_type"]
+INTEGER_COLUMNS = ["felt", "nst", "sig"]
+
+# Region, state and state region interaction ids keyed by lower case name
+# (or state and region id pair), kept between warm lambda invocations.
+dimension_cache = {}
+
+# Events that could not be transformed or uploaded since the counts were last reset,
+# so a run knows not to advance its watermark past them.
+load_stats = {"failed": 0}
+
+UPSERT_CONFLICT_SQL = """ON CONFLICT ("url") DO UPDATE SET
+                     magnitude = EXCLUDED.magnitude,
+                     latitude = EXCLUDED.latitude,
+                     longitude = EXCLUDED.longitude,
+                     "time" = EXCLUDED."time",
+                     updated = EXCLUDED.updated,
+                     depth = EXCLUDED.depth,
+                     felt = EXCLUDED.felt,
+                     tsunami = EXCLUDED.tsunami,
+                     cdi = EXCLUDED.cdi,
+                     mmi = EXCLUDED.mmi,
+                     nst = EXCLUDED.nst,
+                     sig = EXCLUDED.sig,
+                     net = EXCLUDED.net,
+                     dmin = EXCLUDED.dmin,
+                     alert = EXCLUDED.alert,
+                     magnitude_type = EXCLUDED.magnitude_type,
+                     state_region_interaction_id = EXCLUDED.state_region_interaction_id
+                     WHERE earthquake.updated < EXCLUDED.updated"""
+
 basicConfig(
     level="DEBUG",
     format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
@@ -31,28 +64,6 @@ def get_connection() -> Connection:
     )
 
 
-def get_current_db() -> DataFrame:
-    """Return all records currently in database."""
-    logger.info("Getting database connection...")
-    conn = get_connection()
-
-    with conn.cursor() as curs:
-        curs.execute("""SELECT * FROM earthquake
-                        JOIN "state_region_interaction" USING(state_region_interaction_id)
-                        JOIN "state" USING (state_id)
-                        JOIN "region" USING (region_id);""")
-        quakes = DataFrame(curs.fetchall())
-    if quakes.empty:
-        quake_cols = [
-            "earthquake_id", "magnitude", "latitude", "longitude", "time", "updated",
-            "depth", "url", "felt", "tsunami", "cdi", "mmi", "nst", "sig", "net", "dmin",
-            "alert", "location_source", "magnitude_type", "state_name", "region_name",
-            "state_id", "region_id"
-        ]
-        return DataFrame(columns=quake_cols)
-    return quakes.drop(columns=["state_id", "region_id"])
-
-
 def preprocess_df(df: DataFrame) -> DataFrame:
     """Returned sanitised dfs for merging."""
     numeric_cols = ['latitude', 'longitude',
@@ -74,26 +85,48 @@ def preprocess_df(df: DataFrame) -> DataFrame:
     df['cdi'] = df['cdi']
     df['mmi'] = df['mmi']
     df['dmin'] = df['dmin']
-    df["tsunami"] = df["tsunami"].apply(lambda x: bool(x))
+    df["tsunami"] = df["tsunami"].astype("boolean").fillna(False).astype(bool)
     df["magnitude_type"] = df["magnitude_type"].str.title()
     df['felt'] = to_numeric(df['felt'], errors='coerce').fillna(0).astype(int)
 
     return df
 
 
-def get_diff(df1: DataFrame, df2: DataFrame) -> DataFrame:
-    """Return records that only exist in first DataFrame."""
-    df1 = preprocess_df(df1)
+def invalidate_dimension_cache():
+    """Empty the dimension cache so it is reloaded from the database on next use."""
+    logger.info("Invalidating dimension cache...")
+    dimension_cache.clear()
 
-    df1 = df1.drop(columns=["earthquake_id", "location_source"])
 
-    df1 = df1.reset_index(drop=True)
+def preload_dimension_cache(conn: Connection):
+    """Fill the dimension cache with one query per dimension table if it is empty."""
+    if dimension_cache:
+        return
 
-    return df1[~df1["url"].isin(df2["url"])]
+    logger.info("Loading dimension cache from database...")
+    with conn.cursor() as curs:
+        curs.execute("""SELECT region_id, region_name FROM region;""")
+        regions = {r["region_name"].lower(): r["region_id"]
+                   for r in curs.fetchall()}
+        curs.execute("""SELECT state_id, state_name FROM "state";""")
+        states = {r["state_name"].lower(): r["state_id"]
+                  for r in curs.fetchall()}
+        curs.execute("""SELECT state_region_interaction_id, state_id, region_id
+                     FROM "state_region_interaction";""")
+        state_regions = {(r["state_id"], r["region_id"]): r["state_region_interaction_id"]
+                         for r in curs.fetchall()}
+
+    dimension_cache["region"] = regions
+    dimension_cache["state"] = states
+    dimension_cache["state_region"] = state_regions
 
 
 def get_region_id(conn: Connection, region: str) -> int | None:
     """Return id of region if it is in the database."""
+    preload_dimension_cache(conn)
+    if region.lower() in dimension_cache["region"]:
+        return dimension_cache["region"][region.lower()]
+
     logger.info("Checking if region, %s, is in database...", region)
     with conn.cursor() as curs:
         curs.execute("""SELECT * FROM region
@@ -102,12 +135,17 @@ def get_region_id(conn: Connection, region: str) -> int | None:
         result = curs.fetchone()
     if result:
         logger.debug("Found region: %s", result)
+        dimension_cache["region"][region.lower()] = result["region_id"]
         return result["region_id"]
     return None
 
 
 def get_state_id(conn: Connection, state: str) -> int | None:
     """Return id of state if it is in the database."""
+    preload_dimension_cache(conn)
+    if state.lower() in dimension_cache["state"]:
+        return dimension_cache["state"][state.lower()]
+
     logger.info("Checking if state, %s, is in database...", state)
     with conn.cursor() as curs:
         curs.execute("""SELECT * FROM "state"
@@ -116,12 +154,17 @@ def get_state_id(conn: Connection, state: str) -> int | None:
         result = curs.fetchone()
     if result:
         logger.debug("Found state: %s", result)
+        dimension_cache["state"][state.lower()] = result["state_id"]
         return result["state_id"]
     return None
 
 
 def get_state_region_id(conn: Connection, state: int, region: int) -> int | None:
     """Return id of state region interaction if it is in the database."""
+    preload_dimension_cache(conn)
+    if (state, region) in dimension_cache["state_region"]:
+        return dimension_cache["state_region"][(state, region)]
+
     logger.info(
         "Checking if state region interaction, %s and %s, is in database...", state, region)
     with conn.cursor() as curs:
@@ -132,19 +175,18 @@ def get_state_region_id(conn: Connection, state: int, region: int) -> int | None
         result = curs.fetchone()
     if result:
         logger.debug("Found state region interaction: %s", result)
+        dimension_cache["state_region"][(state, region)] = \
+            result["state_region_interaction_id"]
         return result["state_region_interaction_id"]
     return None
 
 
-def upload_row_to_db(row: dict):
-    """Upload row as a dictionary to the database."""
-
-    logger.info("Getting database connection...")
-    conn = get_connection()
-
-    logger.debug("Uploading row: %s", row)
-
-    region_id = get_region_id(conn, row["region_name"])
+def resolve_state_region_id(conn: Connection, state_name: str, region_name: str) -> int:
+    """
+    Return id of the state region interaction for the names,
+    uploading any of the state, region or interaction that are missing.
+    """
+    region_id = get_region_id(conn, region_name)
 
     if region_id is None:
         logger.info("Uploading region data...")
@@ -152,19 +194,21 @@ def upload_row_to_db(row: dict):
             curs.execute("""INSERT INTO region(region_name)
                         VALUES (%s)
                         RETURNING region_id;""",
-                         (row["region_name"],))
+                         (region_name,))
             region_id = curs.fetchone()["region_id"]
+        dimension_cache["region"][region_name.lower()] = region_id
 
-    state_id = get_state_id(conn, row["state_name"])
+    state_id = get_state_id(conn, state_name)
 
     if state_id is None:
         logger.info("Uploading state data...")
         with conn.cursor() as curs:
-            curs.execute("""INSERT INTO state(state_name, region_id)
-                        VALUES (%s, %s)
+            curs.execute("""INSERT INTO state(state_name)
+                        VALUES (%s)
                         RETURNING state_id;""",
-                         (row["state_name"], region_id))
+                         (state_name,))
             state_id = curs.fetchone()["state_id"]
+        dimension_cache["state"][state_name.lower()] = state_id
 
     state_region_id = get_state_region_id(conn, state_id, region_id)
 
@@ -176,6 +220,24 @@ def upload_row_to_db(row: dict):
                         RETURNING state_region_interaction_id;""",
                          (state_id, region_id))
             state_region_id = curs.fetchone()["state_region_interaction_id"]
+        dimension_cache["state_region"][(state_id, region_id)] = state_region_id
+
+    return state_region_id
+
+
+def upload_row_to_db(row: dict) -> bool:
+    """
+    Upload row as a dictionary to the database.
+    Returns whether the earthquake was new or newer than the stored version.
+    """
+
+    logger.info("Getting database connection...")
+    conn = get_connection()
+
+    logger.debug("Uploading row: %s", row)
+
+    state_region_id = resolve_state_region_id(conn, row["state_name"],
+                                              row["region_name"])
 
     logger.info("Uploading earthquake data...")
     with conn.cursor() as curs:
@@ -186,7 +248,9 @@ def upload_row_to_db(row: dict):
                      magnitude_type, state_region_interaction_id)
                      VALUES (%s, %s, %s, %s, %s, %s,
                      %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s);""",
+                     %s, %s, %s, %s)
+                     """ + UPSERT_CONFLICT_SQL + """
+                     RETURNING earthquake_id;""",
                      (
                          row["magnitude"],
                          row["latitude"],
@@ -207,34 +271,144 @@ def upload_row_to_db(row: dict):
                          row["magnitude_type"],
                          state_region_id
                      ))
+        uploaded = curs.fetchone() is not None
         conn.commit()
-
-
-def upload_df_to_db(data: DataFrame):
-    """Upload DataFrame to database."""
+    return uploaded
+
+
+def get_dimension_ids(conn: Connection, data: DataFrame) -> dict[tuple[str, str], int]:
+    """Return state region interaction ids for every state and region pair in the data."""
+    logger.info("Getting dimension ids for batch...")
+    preload_dimension_cache(conn)
+
+    dimension_ids = {}
+    pairs = data[["state_name", "region_name"]].drop_duplicates()
+    for state_name, region_name in pairs.itertuples(index=False):
+        if not isinstance(state_name, str) or not isinstance(region_name, str):
+            logger.error("Invalid state or region: %s, %s",
+                         state_name, region_name)
+            continue
+        dimension_ids[(state_name, region_name)] = resolve_state_region_id(
+            conn, state_name, region_name)
+    return dimension_ids
+
+
+def get_copy_row(row: dict, state_region_id: int) -> tuple:
+    """Return row values in the column order used by the earthquake COPY."""
+    values = []
+    for col in EARTHQUAKE_COLUMNS:
+        value = row[col]
+        if isna(value):
+            value = None
+        elif col in INTEGER_COLUMNS:
+            value = int(value)
+        values.append(value)
+    values.append(state_region_id)
+    return tuple(values)
+
+
+def bulk_upload_df_to_db(data: DataFrame) -> list[str]:
+    """
+    Upload DataFrame to database over one connection with a single COPY
+    into a staging table, then upsert the staged rows into earthquake.
+    Falls back to row by row uploads if the COPY fails,
+    so one bad row cannot stop the rest of the batch being uploaded.
+    Returns urls of earthquakes that were new or updated.
+    """
+    logger.info("Getting database connection...")
+    conn = get_connection()
+    try:
+        dimension_ids = get_dimension_ids(conn, data)
+
+        copy_rows = []
+        failed = 0
+        for row in data.to_dict(orient="records"):
+            try:
+                state_region_id = dimension_ids[(row["state_name"],
+                                                 row["region_name"])]
+                copy_rows.append(get_copy_row(row, state_region_id))
+            except (KeyError, ValueError, TypeError) as e:
+                logger.error("Failed to prepare row: %s", e)
+                failed += 1
+
+        logger.info("Copying %s rows of earthquake data...", len(copy_rows))
+        columns = ", ".join(f'"{col}"' for col in EARTHQUAKE_COLUMNS)
+        columns += ", state_region_interaction_id"
+        with conn.cursor() as curs:
+            curs.execute(f"""CREATE TEMP TABLE earthquake_staging ON COMMIT DROP AS
+                         SELECT {columns} FROM earthquake WITH NO DATA;""")
+            with curs.copy(f"""COPY earthquake_staging({columns})
+                           FROM STDIN;""") as copy:
+                for copy_row in copy_rows:
+                    copy.write_row(copy_row)
+
+            logger.info("Upserting staged earthquake data...")
+            curs.execute(f"""INSERT INTO earthquake({columns})
+                         SELECT {columns} FROM earthquake_staging
+                         {UPSERT_CONFLICT_SQL}
+                         RETURNING "url";""")
+            uploaded = [r["url"] for r in curs.fetchall()]
+        conn.commit()
+        load_stats["failed"] += failed
+    except DatabaseError as e:
+        logger.error("Bulk upload failed, uploading row by row: %s", e)
+        conn.rollback()
+        invalidate_dimension_cache()
+        uploaded = upload_df_to_db(data)
+    finally:
+        conn.close()
+    return uploaded
+
+
+def upload_df_to_db(data: DataFrame, bulk: bool = False) -> list[str]:
+    """Upload DataFrame to database and return urls of new or updated earthquakes."""
+    if bulk:
+        return bulk_upload_df_to_db(data)
+
+    # Missing values from nullable and categorical columns are uploaded as NULL.
+    data = data.astype(object).where(data.notna(), None)
+    uploaded = []
     for _, row in data.iterrows():
         try:
-            upload_row_to_db(row.to_dict())
-        except (DatabaseError, KeyError, ValueError) as e:
+            if upload_row_to_db(row.to_dict()):
+                uploaded.append(row["url"])
+        except DatabaseError as e:
             logger.error("Failed to upload row: %s", e)
+            invalidate_dimension_cache()
+            load_stats["failed"] += 1
+        except (KeyError, ValueError) as e:
+            logger.error("Failed to upload row: %s", e)
+            load_stats["failed"] += 1
+    return uploaded
 
 
-def load(quakes: DataFrame) -> DataFrame:
-    """Return earthquakes that have been uploaded to the database."""
-    logger.info("Getting data already in database...")
-    old_quakes = get_current_db()
-    if not old_quakes.empty:
-        logger.debug("Found old earthquake data: \n%s", old_quakes.head())
-    else:
-        logger.debug("No old earthquake data found.")
+def get_load_stats() -> dict:
+    """Returns the number of rows that failed to upload since the counts were reset."""
+    return dict(load_stats)
+
+
+def prepare_quakes(quakes: DataFrame) -> DataFrame:
+    """
+    Return sanitised earthquakes ready for upload.
+    Only the latest version of each event is kept,
+    as a single upsert cannot update the same earthquake twice.
+    """
+    quakes = preprocess_df(quakes)
+    quakes = quakes.drop(columns=["earthquake_id", "location_source"])
+    quakes = quakes.sort_values("updated").drop_duplicates("url", keep="last")
+    return quakes.sort_index().reset_index(drop=True)
 
-    logger.info("Identifying new earthquake data...")
-    new_quakes = get_diff(quakes, old_quakes)
-    if not new_quakes.empty:
-        logger.debug("Found new earthquake data: \n%s", new_quakes.head())
 
-        logger.info("Uploading new data to database...")
-        upload_df_to_db(new_quakes)
+def load(quakes: DataFrame, bulk: bool = False) -> DataFrame:
+    """Return earthquakes that were new or updated in the database."""
+    logger.info("Preparing earthquake data...")
+    quakes = prepare_quakes(quakes)
+
+    logger.info("Uploading earthquake data to database...")
+    uploaded = upload_df_to_db(quakes, bulk)
+    new_quakes = quakes[quakes["url"].isin(uploaded)]
+    if not new_quakes.empty:
+        logger.debug("Uploaded new earthquake data: \n%s", new_quakes.head())
     else:
         logger.debug("No new earthquake data found.")
 
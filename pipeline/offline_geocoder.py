@@ -0,0 +1,142 @@
+"""
+Offline reverse geocoder that finds the country, and the state for the
+United States, from bundled boundary polygons without calling OpenCage.
+"""
+import json
+import logging
+from math import cos, radians, floor
+from pathlib import Path
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(
+    level="INFO",
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S"
+)
+
+BOUNDARY_DIR = Path(__file__).parent / "boundaries"
+GRID_SIZE = 1.0
+KM_PER_DEGREE = 111.195
+
+# Points closer than this to a boundary are left to OpenCage, as the
+# bundled polygons are simplified (country outlines far more than states).
+LAYER_MARGINS_KM = {"countries": 25.0, "us_states": 5.0}
+
+# Loaded boundary layers keyed by name, kept between warm lambda invocations.
+boundary_layers = {}
+
+
+def load_boundary_layer(name: str) -> dict:
+    """
+    Returns the polygons of a bundled boundary file as edge arrays,
+    with a uniform grid index over their bounding boxes.
+    """
+    if name in boundary_layers:
+        return boundary_layers[name]
+
+    logger.info("Loading %s boundaries...", name)
+    with open(BOUNDARY_DIR / f"{name}.geojson", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+
+    margin = LAYER_MARGINS_KM[name] / KM_PER_DEGREE
+    polygons = []
+    grid = {}
+    for feature in features:
+        for polygon in feature["geometry"]["coordinates"]:
+            starts = []
+            ends = []
+            for ring in polygon:
+                ring = np.array(ring, dtype=float)
+                starts.append(ring[:-1])
+                ends.append(ring[1:])
+            starts = np.concatenate(starts)
+            ends = np.concatenate(ends)
+
+            min_lon, min_lat = starts.min(axis=0)
+            max_lon, max_lat = starts.max(axis=0)
+            lon_margin = margin / max(cos(radians(max(abs(min_lat), abs(max_lat)))), 0.1)
+
+            index = len(polygons)
+            polygons.append({
+                "name": feature["properties"]["name"],
+                "x1": starts[:, 0], "y1": starts[:, 1],
+                "x2": ends[:, 0], "y2": ends[:, 1]
+            })
+            for i in range(floor((min_lon - lon_margin) / GRID_SIZE),
+                           floor((max_lon + lon_margin) / GRID_SIZE) + 1):
+                for j in range(floor((min_lat - margin) / GRID_SIZE),
+                               floor((max_lat + margin) / GRID_SIZE) + 1):
+                    grid.setdefault((i, j), []).append(index)
+
+    boundary_layers[name] = {"polygons": polygons, "grid": grid,
+                             "margin_km": LAYER_MARGINS_KM[name]}
+    return boundary_layers[name]
+
+
+def is_point_in_polygon(polygon: dict, latitude: float, longitude: float) -> bool:
+    """Returns whether the point is inside the polygon using ray casting."""
+    y1, y2 = polygon["y1"], polygon["y2"]
+    crosses = (y1 > latitude) != (y2 > latitude)
+    x1, x2 = polygon["x1"][crosses], polygon["x2"][crosses]
+    y1, y2 = y1[crosses], y2[crosses]
+    crossing_lon = x1 + (latitude - y1) * (x2 - x1) / (y2 - y1)
+    return bool(np.count_nonzero(longitude < crossing_lon) % 2)
+
+
+def get_distance_to_boundary(polygon: dict, latitude: float, longitude: float) -> float:
+    """Returns approximate distance in km from the point to the polygon's edges."""
+    scale = cos(radians(latitude))
+    x1, y1 = polygon["x1"], polygon["y1"]
+    dx = (polygon["x2"] - x1) * scale
+    dy = polygon["y2"] - y1
+    px = (longitude - x1) * scale
+    py = latitude - y1
+    length = dx * dx + dy * dy
+    t = np.clip((px * dx + py * dy) / np.where(length == 0, 1, length), 0, 1)
+    return float(np.hypot(px - t * dx, py - t * dy).min()) * KM_PER_DEGREE
+
+
+def find_boundary(name: str, latitude: float, longitude: float) -> tuple[str | None, bool]:
+    """
+    Returns the name of the boundary containing the point, or None,
+    and whether the answer is ambiguous because the point is near an edge.
+    """
+    layer = load_boundary_layer(name)
+    cell = (floor(longitude / GRID_SIZE), floor(latitude / GRID_SIZE))
+
+    found = None
+    for index in layer["grid"].get(cell, []):
+        polygon = layer["polygons"][index]
+        if get_distance_to_boundary(polygon, latitude, longitude) < layer["margin_km"]:
+            return None, True
+        if found is None and is_point_in_polygon(polygon, latitude, longitude):
+            found = polygon["name"]
+    return found, False
+
+
+def get_offline_address(latitude: float, longitude: float) -> list[str] | None:
+    """
+    Returns the state and country for the coordinates like get_address,
+    or None when the bundled boundaries cannot answer with confidence.
+    Points in no boundary are also None, as the 1:110m countries leave out
+    many small islands, such as Tonga, Samoa and Guam.
+    """
+    latitude = float(latitude)
+    longitude = (float(longitude) + 180) % 360 - 180
+
+    state, ambiguous = find_boundary("us_states", latitude, longitude)
+    if ambiguous:
+        return None
+    if state:
+        return [state, "United States"]
+
+    country, ambiguous = find_boundary("countries", latitude, longitude)
+    if ambiguous or country == "United States":
+        return None
+    if country:
+        return ["Unknown State", country]
+    return None
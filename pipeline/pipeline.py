@@ -1,17 +1,22 @@
 """Script for running full ETL pipeline as AWS lambda."""
 
 from argparse import ArgumentParser
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from logging import getLogger, basicConfig
 from os import environ as ENV
+from time import perf_counter
+import asyncio
 
-from pandas import DataFrame
+from pandas import DataFrame, isna
 from dotenv import load_dotenv
 
-from extract import extract
+from extract import extract, get_fetch_stats
 from transform import transform
-from load import load
+from load import load, get_connection, get_load_stats, load_stats
+from geocode import warm_geocode_cache, is_cache_empty
+from pipeline_state import get_watermark, save_watermark, get_watermark_from_ms
 from topic import get_topic_dictionaries
+from stream import stream_pipeline, add_stage_time, log_stage_timings
 
 
 logger = getLogger(__name__)
@@ -23,27 +28,108 @@ basicConfig(
 )
 
 
+def get_watermark_settings() -> dict:
+    """Return the watermark settings, which can be overridden in the environment."""
+    return {"overlap": float(ENV.get("WATERMARK_OVERLAP", 600))}
+
+
+def get_updated_after() -> datetime | None:
+    """
+    Return the stored watermark to extract from in incremental mode, if any,
+    moved back by an overlap for events USGS indexes after later updated ones.
+    Upserts only replace older versions, so extracting them again is harmless.
+    """
+    if ENV.get("EXTRACT_MODE") != "incremental":
+        return None
+    with get_connection() as conn:
+        updated_after = get_watermark(conn)
+    if updated_after is None:
+        logger.info("No watermark stored, extracting the whole time window.")
+        return None
+    updated_after -= timedelta(seconds=get_watermark_settings()["overlap"])
+    logger.info("Extracting events updated after %s.", updated_after)
+    return updated_after
+
+
+def advance_watermark(latest_update, end: datetime):
+    """
+    Store the latest updated time extracted in incremental mode,
+    unless an event could not be fetched or loaded, so it is extracted again next run.
+    It is never stored past the end of the time window, as events that happened after
+    the window were not extracted, but can have been updated before the latest update.
+    """
+    if ENV.get("EXTRACT_MODE") != "incremental":
+        return
+    if get_fetch_stats()["abandoned"] or isna(latest_update):
+        logger.warning("Not every event was fetched with an update time, "
+                       "keeping the old watermark.")
+        return
+    if get_load_stats()["failed"]:
+        logger.warning("%s events failed to load, keeping the old watermark.",
+                       get_load_stats()["failed"])
+        return
+    # Naive times are sent to USGS as they are, which it reads as UTC.
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    with get_connection() as conn:
+        save_watermark(conn, min(get_watermark_from_ms(latest_update), end))
+
+
+def warm_geocode_cache_if_empty():
+    """Fill an empty geocode cache from the database if it is enabled."""
+    if ENV.get("GEOCODE_CACHE_WARM") == "true" and is_cache_empty():
+        logger.info("Warming geocode cache...")
+        with get_connection() as conn:
+            warm_geocode_cache(conn)
+
+
 def run_pipeline(start: datetime = datetime.now() - timedelta(hours=4),
                  end: datetime = datetime.now()) -> DataFrame:
-    """Run ETL pipeline."""
+    """
+    Run ETL pipeline.
+    In incremental mode only events updated since the last run are extracted,
+    falling back to the whole time window when no watermark is stored.
+    In backfill mode long time windows are extracted in concurrent shards.
+    """
     logger.info(
         "Found environment: %s, %s, %s", ENV["DB_USER"], ENV["DB_HOST"], ENV["DB_NAME"])
 
+    timings = {}
+    updated_after = get_updated_after()
+    load_stats.update({"failed": 0})
+
     logger.info("Extracting data from API...")
-    raw = extract("USGS", start, end)
+    started = perf_counter()
+    raw = extract("USGS", start, end, updated_after,
+                  backfill=ENV.get("EXTRACT_MODE") == "backfill")
+    add_stage_time(timings, "extract", started, perf_counter())
     if raw is False or not raw or len(raw) == 0:
         logger.warning("No data returned from API.")
         return None
 
+    warm_geocode_cache_if_empty()
+
     logger.info("Transforming data...")
+    started = perf_counter()
     transformed = transform(raw)
+    add_stage_time(timings, "transform", started, perf_counter())
     if transformed.empty:
         logger.warning("Failed to transform data returned from API.")
         return None
     logger.info("Transformed data into: %s", transformed)
 
+    # Read before load, which converts the timestamps in place.
+    latest_update = transformed["updated"].max() \
+        if ENV.get("EXTRACT_MODE") == "incremental" else None
+
     logger.info("Loading data to RDS...")
-    uploaded = load(transformed)
+    started = perf_counter()
+    uploaded = load(transformed, bulk=ENV.get("LOAD_MODE") == "bulk")
+    add_stage_time(timings, "load", started, perf_counter())
+    log_stage_timings(timings, "Staged")
+
+    advance_watermark(latest_update, end)
+
     if uploaded.empty:
         logger.warning("No data uploaded to RDS.")
         return None
@@ -52,6 +138,37 @@ def run_pipeline(start: datetime = datetime.now() - timedelta(hours=4),
     return uploaded
 
 
+def run_streaming_pipeline(start: datetime = datetime.now() - timedelta(hours=4),
+                           end: datetime = datetime.now()) -> tuple[DataFrame, list[dict]]:
+    """
+    Run ETL pipeline with each stage working on events as soon as they arrive,
+    returning the uploaded earthquakes and the alerts for their topics.
+    """
+    logger.info(
+        "Found environment: %s, %s, %s", ENV["DB_USER"], ENV["DB_HOST"], ENV["DB_NAME"])
+
+    updated_after = get_updated_after()
+    load_stats.update({"failed": 0})
+    warm_geocode_cache_if_empty()
+
+    logger.info("Streaming data from API to RDS...")
+    uploaded, alerts, latest_updates, timings = asyncio.run(stream_pipeline(
+        start, end, updated_after,
+        backfill=ENV.get("EXTRACT_MODE") == "backfill",
+        bulk=ENV.get("LOAD_MODE") == "bulk"))
+    log_stage_timings(timings, "Streaming")
+
+    latest_updates = [update for update in latest_updates if not isna(update)]
+    if latest_updates:
+        advance_watermark(max(latest_updates), end)
+
+    if uploaded.empty:
+        logger.warning("No data uploaded to RDS.")
+    else:
+        logger.info("Loaded data into RDS: %s", uploaded)
+    return uploaded, alerts
+
+
 def lambda_handler(event, context):
     """
     Main Lambda Handler Function
@@ -65,17 +182,22 @@ def lambda_handler(event, context):
         logger.info("Getting time window from event...")
         start_time, end_time = get_time_window_from_event(event)
 
-        logger.info("Running ETL pipeline...")
-        data = run_pipeline(start_time,
-                            end_time)
-
         topics = None
         output = None
 
+        if ENV.get("PIPELINE_MODE") == "streaming":
+            logger.info("Running streaming ETL pipeline...")
+            data, topics = run_streaming_pipeline(start_time, end_time)
+        else:
+            logger.info("Running ETL pipeline...")
+            data = run_pipeline(start_time,
+                                end_time)
+
         if data is not None:
             if not data.empty:
-                logger.info("Creating alert dictionary...")
-                topics = get_topic_dictionaries(data)
+                if topics is None:
+                    logger.info("Creating alert dictionary...")
+                    topics = get_topic_dictionaries(data)
                 output_df = data.copy()
                 output_df['time'] = output_df['time'].dt.strftime(
                     r"%Y-%m-%d %H:%M")
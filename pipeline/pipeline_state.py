@@ -0,0 +1,54 @@
+"""
+Reads and writes the high-water mark of USGS `updated` times
+that incremental extraction resumes from.
+"""
+import logging
+from datetime import datetime, timezone
+
+from psycopg import Connection, DatabaseError
+
+
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(
+    level="INFO",
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S"
+)
+
+WATERMARK_KEY = "usgs_updated"
+
+
+def get_watermark(conn: Connection) -> datetime | None:
+    """Return the latest USGS updated time already extracted, if it is stored."""
+    try:
+        with conn.cursor() as curs:
+            curs.execute("""SELECT updated FROM pipeline_state
+                         WHERE state_key = %s;""",
+                         (WATERMARK_KEY,))
+            result = curs.fetchone()
+    except DatabaseError as e:
+        logger.warning("Could not read pipeline state: %s", e)
+        conn.rollback()
+        return None
+
+    if result is None:
+        return None
+    return result["updated"]
+
+
+def save_watermark(conn: Connection, updated: datetime):
+    """Store the latest USGS updated time extracted, never moving it backwards."""
+    logger.info("Saving watermark %s...", updated)
+    with conn.cursor() as curs:
+        curs.execute("""INSERT INTO pipeline_state (state_key, updated)
+                     VALUES (%s, %s)
+                     ON CONFLICT (state_key) DO UPDATE
+                     SET updated = GREATEST(pipeline_state.updated, EXCLUDED.updated);""",
+                     (WATERMARK_KEY, updated))
+    conn.commit()
+
+
+def get_watermark_from_ms(timestamp: int) -> datetime:
+    """Return a USGS millisecond timestamp as a UTC datetime."""
+    return datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
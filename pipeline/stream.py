@@ -0,0 +1,210 @@
+"""
+Streaming execution of the pipeline, where detail documents flow through
+transform, load and topic matching in batches as soon as they arrive.
+"""
+import logging
+from datetime import datetime
+from os import environ as ENV
+from time import perf_counter
+import asyncio
+
+from pandas import DataFrame, concat
+import requests
+from aiohttp.client_exceptions import ClientError
+
+from extract import (access_api, access_api_backfill, get_event_ids_from_json_list,
+                     create_usgs_urls_from_event_ids, get_fetch_settings,
+                     make_session, make_api_call, fetch_stats)
+from transform import (is_event_clean, make_row_for_dataframe, make_column_buffers,
+                       create_dataframe_expected_for_load, LOAD_COLUMNS)
+from load import load, load_stats
+from topic import get_subscription_topics, get_topic_dictionaries
+
+
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(
+    level="INFO",
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S"
+)
+
+
+def get_stream_settings() -> dict:
+    """Returns the streaming settings, which can be overridden in the environment."""
+    return {
+        "batch_size": int(ENV.get("STREAM_BATCH_SIZE", 50)),
+        "queue_size": int(ENV.get("STREAM_QUEUE_SIZE", 100)),
+        "transform_workers": int(ENV.get("STREAM_TRANSFORM_WORKERS", 1))
+    }
+
+
+def add_stage_time(timings: dict, stage: str, started: float, ended: float):
+    """Adds a period of work to a stage's busy time and active span."""
+    timing = timings.setdefault(stage, {"start": started, "end": ended, "busy": 0.0})
+    timing["start"] = min(timing["start"], started)
+    timing["end"] = max(timing["end"], ended)
+    timing["busy"] += ended - started
+
+
+def log_stage_timings(timings: dict, mode: str) -> float:
+    """
+    Logs when each stage was active relative to the first,
+    and returns the overlap as the sum of stage spans over the total time.
+    """
+    if not timings:
+        return 0.0
+    first = min(timing["start"] for timing in timings.values())
+    last = max(timing["end"] for timing in timings.values())
+    for stage, timing in timings.items():
+        logger.info("%s %s: active %.2fs to %.2fs, busy %.2fs", mode, stage,
+                    timing["start"] - first, timing["end"] - first, timing["busy"])
+    spans = sum(timing["end"] - timing["start"] for timing in timings.values())
+    overlap = spans / (last - first) if last > first else 1.0
+    logger.info("%s total %.2fs, stage overlap %.2fx", mode, last - first, overlap)
+    return overlap
+
+
+async def produce_details(start: datetime, end: datetime,
+                          updated_after: datetime | None, backfill: bool,
+                          detail_queue: asyncio.Queue, workers: int, timings: dict):
+    """
+    Fetches detail documents into the queue as they arrive,
+    waiting for space so fetching cannot run ahead of transform,
+    then sends each transform worker the end of the queue.
+    """
+    started = perf_counter()
+    settings = get_fetch_settings()
+    fetch_stats.update({"succeeded": 0, "retried": 0, "abandoned": 0})
+    semaphore = asyncio.Semaphore(settings["workers"])
+
+    async def fetch(url: str):
+        async with semaphore:
+            detail = await make_api_call(session, url, settings)
+            await detail_queue.put(detail)
+
+    try:
+        if backfill:
+            summary_json = await access_api_backfill(start, end, updated_after)
+        else:
+            summary_json = await asyncio.to_thread(access_api, start, end, updated_after)
+        urls = create_usgs_urls_from_event_ids(
+            get_event_ids_from_json_list(summary_json["features"]))
+
+        async with make_session(settings) as session:
+            await asyncio.gather(*[fetch(url) for url in urls])
+    except (requests.exceptions.RequestException, ClientError) as e:
+        logger.warning("No data returned or API error: %s", e)
+    finally:
+        add_stage_time(timings, "extract", started, perf_counter())
+    logger.info("Detail fetch stats: %s", fetch_stats)
+    # Not sent from a finally, where waiting on a full queue could not be cancelled.
+    for _ in range(workers):
+        await detail_queue.put(None)
+
+
+async def transform_details(detail_queue: asyncio.Queue, batch_queue: asyncio.Queue,
+                            batch_size: int, timings: dict):
+    """
+    Cleans and geocodes detail documents, sending on a DataFrame per batch.
+    An event that fails to transform is skipped and counted as failed to load,
+    so the watermark is not advanced past it.
+    """
+    buffers = make_column_buffers()
+    rows = 0
+    while (detail := await detail_queue.get()) is not None:
+        started = perf_counter()
+        if is_event_clean(detail):
+            try:
+                row = await asyncio.to_thread(make_row_for_dataframe, detail)
+            except Exception as e:
+                logger.error("Failed to transform event %s: %s", detail.get("id"), e)
+                load_stats["failed"] += 1
+            else:
+                for column, value in zip(LOAD_COLUMNS, row):
+                    buffers[column].append(value)
+                rows += 1
+        add_stage_time(timings, "transform", started, perf_counter())
+
+        if rows == batch_size:
+            await batch_queue.put(create_dataframe_expected_for_load(buffers))
+            buffers = make_column_buffers()
+            rows = 0
+
+    if rows:
+        await batch_queue.put(create_dataframe_expected_for_load(buffers))
+    await batch_queue.put(None)
+
+
+async def load_batches(batch_queue: asyncio.Queue, workers: int, bulk: bool,
+                       topics: list[dict], timings: dict) -> tuple[list, list, list]:
+    """
+    Loads each batch and matches its new earthquakes to topics.
+    Returns the uploaded batches, alerts and latest updated time of each batch.
+    """
+    uploaded_batches = []
+    alerts = []
+    latest_updates = []
+    finished = 0
+    while finished < workers:
+        batch = await batch_queue.get()
+        if batch is None:
+            finished += 1
+            continue
+
+        started = perf_counter()
+        latest_updates.append(batch["updated"].max())
+        uploaded = await asyncio.to_thread(load, batch, bulk)
+        add_stage_time(timings, "load", started, perf_counter())
+
+        if not uploaded.empty:
+            started = perf_counter()
+            uploaded_batches.append(uploaded)
+            alerts.extend(await asyncio.to_thread(
+                get_topic_dictionaries, uploaded, topics))
+            add_stage_time(timings, "topics", started, perf_counter())
+    return uploaded_batches, alerts, latest_updates
+
+
+async def stream_pipeline(start: datetime, end: datetime,
+                          updated_after: datetime | None = None,
+                          backfill: bool = False,
+                          bulk: bool = False) -> tuple[DataFrame, list[dict], list, dict]:
+    """
+    Runs extract, transform, load and topic matching concurrently over bounded queues.
+    Returns the uploaded earthquakes, their alerts,
+    the latest updated time of each batch and the stage timings.
+    If any stage fails the others are cancelled, rather than left waiting on its queue,
+    and its error is raised.
+    """
+    settings = get_stream_settings()
+    workers = settings["transform_workers"]
+    detail_queue = asyncio.Queue(maxsize=settings["queue_size"])
+    batch_queue = asyncio.Queue(maxsize=max(1, settings["queue_size"] // settings["batch_size"]))
+    timings = {}
+
+    topics_task = asyncio.create_task(asyncio.to_thread(get_subscription_topics))
+    producer = asyncio.create_task(produce_details(
+        start, end, updated_after, backfill, detail_queue, workers, timings))
+    transformers = [asyncio.create_task(transform_details(
+        detail_queue, batch_queue, settings["batch_size"], timings))
+        for _ in range(workers)]
+
+
+    async def load_when_topics_fetched():
+        return await load_batches(batch_queue, workers, bulk, await topics_task, timings)
+
+    loader = asyncio.create_task(load_when_topics_fetched())
+    done, pending = await asyncio.wait([producer, *transformers, loader],
+                                       return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
+    uploaded_batches, alerts, latest_updates = loader.result()
+
+    uploaded = concat(uploaded_batches, ignore_index=True) \
+        if uploaded_batches else DataFrame()
+    return uploaded, alerts, latest_updates, timings
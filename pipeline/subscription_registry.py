@@ -0,0 +1,54 @@
+"""
+Reads and writes the registry of subscription topics,
+so the pipeline does not have to list and parse every SNS topic.
+"""
+import logging
+from decimal import Decimal
+
+from psycopg import Connection
+
+
+logger = logging.getLogger(__name__)
+
+logging.basicConfig(
+    level="INFO",
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S"
+)
+
+
+def get_registered_topics(conn: Connection) -> list[dict]:
+    """Return every registered topic in the same form as topic.get_dict_from_topic."""
+    with conn.cursor() as curs:
+        curs.execute("""SELECT topic_arn, magnitude, latitude, longitude, radius
+                     FROM subscription_topic
+                     ORDER BY topic_arn;""")
+        results = curs.fetchall()
+    logger.info("Found %s registered topics.", len(results))
+    return [{
+        "topic_arn": result["topic_arn"],
+        "magnitude": float(result["magnitude"]),
+        "latitude": float(result["latitude"]),
+        "longitude": float(result["longitude"]),
+        "radius": int(result["radius"])
+    } for result in results]
+
+
+def save_registered_topics(conn: Connection, topics: list[dict]):
+    """Register topics from topic.get_dict_from_topic, updating any already registered."""
+    logger.info("Registering %s topics...", len(topics))
+    with conn.cursor() as curs:
+        curs.executemany("""INSERT INTO subscription_topic
+                         (topic_arn, magnitude, latitude, longitude, radius)
+                         VALUES (%s, %s, %s, %s, %s)
+                         ON CONFLICT (topic_arn) DO UPDATE
+                         SET magnitude = EXCLUDED.magnitude,
+                         latitude = EXCLUDED.latitude,
+                         longitude = EXCLUDED.longitude,
+                         radius = EXCLUDED.radius;""",
+                         [(t["topic_arn"],
+                           Decimal(str(t["magnitude"])),
+                           Decimal(str(t["latitude"])),
+                           Decimal(str(t["longitude"])),
+                           t["radius"]) for t in topics])
+    conn.commit()
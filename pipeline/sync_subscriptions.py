@@ -0,0 +1,47 @@
+"""
+Script for importing existing subscription topics from SNS
+into the subscription registry in the database in .env.
+"""
+
+from argparse import ArgumentParser
+from logging import getLogger, basicConfig
+
+from dotenv import load_dotenv
+
+from load import get_connection
+from subscription_registry import get_registered_topics, save_registered_topics
+from topic import get_client, get_topics
+
+
+logger = getLogger(__name__)
+
+basicConfig(
+    level="INFO",
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S"
+)
+
+
+def sync_subscriptions(dry_run: bool = False) -> int:
+    """Register every earthquake topic on SNS, returning how many were new."""
+    topics = get_topics(get_client())
+    with get_connection() as conn:
+        registered = {t["topic_arn"] for t in get_registered_topics(conn)}
+        new_topics = [t for t in topics if t["topic_arn"] not in registered]
+        logger.info("Found %s topics on SNS, %s not yet registered.",
+                    len(topics), len(new_topics))
+        if not dry_run:
+            save_registered_topics(conn, topics)
+    return len(new_topics)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = ArgumentParser(description="Import SNS subscription topics into the registry.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report how many topics would be registered")
+    args = parser.parse_args()
+
+    print(f"{sync_subscriptions(args.dry_run)} topics "
+          f"{'to register' if args.dry_run else 'registered'}.")
@@ -2,13 +2,64 @@
 
 """Unit tests for the functions in extract.py."""
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import asyncio
 
 from unittest.mock import patch
 
-from extract import (get_event_ids_from_json_list, create_usgs_urls_from_event_ids,
-                     make_many_api_calls, extract)
+from aiohttp import web
+
+from extract import (access_api, get_event_ids_from_json_list, create_usgs_urls_from_event_ids,
+                     make_many_api_calls, extract, get_retry_delay,
+                     get_fetch_settings, get_fetch_stats, split_time_window,
+                     merge_features, access_api_backfill)
+from benchmark_extract import make_sample_times, make_stand_in
+
+
+async def fetch_from_fake_usgs(responses: dict, urls: list[str],
+                               in_flight: dict | None = None) -> list[dict]:
+    """Serves queued (status, headers) responses per path and fetches the urls."""
+    if in_flight is None:
+        in_flight = {"now": 0, "max": 0}
+
+    async def handle(request):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        status, headers = responses[request.path].pop(0)
+        if status == 200:
+            return web.json_response({"id": request.path}, headers=headers)
+        return web.Response(status=status, headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/{event}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await make_many_api_calls(
+            [f"http://127.0.0.1:{port}{url}" for url in urls])
+    finally:
+        await runner.cleanup()
+
+
+@patch("extract.requests.get")
+class TestAccessAPI:
+
+    def test_access_api_window(self, mock_get):
+        access_api(datetime(2025, 6, 11), datetime(2025, 6, 12))
+        params = mock_get.call_args.kwargs["params"]
+        assert params["starttime"] == "2025-06-11T00:00:00"
+        assert "updatedafter" not in params
+
+    def test_access_api_updated_after(self, mock_get):
+        access_api(datetime(2025, 6, 11), datetime(2025, 6, 12),
+                   datetime(2025, 6, 11, 20, 59, 41, 157000, tzinfo=timezone.utc))
+        params = mock_get.call_args.kwargs["params"]
+        assert params["updatedafter"] == "2025-06-11T20:59:41.157"
 
 
 class TestGetEventIDsFromJSONList:
@@ -57,6 +108,109 @@ class TestMakeManyAPICalls:
         assert len(asyncio.run(make_many_api_calls(event_urls))) == len(event_urls)
 
 
+class TestGetRetryDelay:
+
+    def test_get_retry_delay_honours_retry_after_seconds(self):
+        assert get_retry_delay(0, "3", get_fetch_settings()) == 3
+
+    def test_get_retry_delay_caps_retry_after(self):
+        assert get_retry_delay(0, "3600", get_fetch_settings()) == 30
+
+    def test_get_retry_delay_backoff_grows_with_attempt(self, monkeypatch):
+        monkeypatch.setenv("FETCH_BACKOFF_BASE", "1")
+        with patch("extract.uniform", side_effect=lambda low, high: high):
+            assert [get_retry_delay(attempt, None, get_fetch_settings())
+                    for attempt in range(7)] == [1, 2, 4, 8, 16, 30, 30]
+
+
+class TestFetchEngine:
+
+    def test_fetch_retries_throttled_calls(self, monkeypatch):
+        monkeypatch.setenv("FETCH_BACKOFF_BASE", "0.01")
+        responses = {"/a": [(429, {"Retry-After": "0"}), (503, {}), (200, {})],
+                     "/b": [(200, {})]}
+        results = asyncio.run(fetch_from_fake_usgs(responses, ["/a", "/b"]))
+        assert results == [{"id": "/a"}, {"id": "/b"}]
+        assert get_fetch_stats() == {"succeeded": 2, "retried": 2, "abandoned": 0}
+
+    def test_fetch_abandons_after_max_retries(self, monkeypatch):
+        monkeypatch.setenv("FETCH_BACKOFF_BASE", "0.01")
+        monkeypatch.setenv("FETCH_MAX_RETRIES", "1")
+        responses = {"/a": [(500, {}), (500, {})]}
+        assert asyncio.run(fetch_from_fake_usgs(responses, ["/a"])) == [{}]
+        assert get_fetch_stats() == {"succeeded": 0, "retried": 1, "abandoned": 1}
+
+    def test_fetch_bounds_concurrent_calls(self, monkeypatch):
+        monkeypatch.setenv("FETCH_WORKERS", "3")
+        responses = {f"/{i}": [(200, {})] for i in range(12)}
+        in_flight = {"now": 0, "max": 0}
+        results = asyncio.run(fetch_from_fake_usgs(responses, list(responses), in_flight))
+        assert len(results) == 12
+        assert in_flight["max"] == 3
+
+    def test_fetch_does_not_retry_missing_events(self):
+        responses = {"/a": [(404, {})]}
+        assert asyncio.run(fetch_from_fake_usgs(responses, ["/a"])) == [{}]
+        assert get_fetch_stats() == {"succeeded": 0, "retried": 0, "abandoned": 1}
+
+
+class TestSplitTimeWindow:
+
+    def test_split_time_window_consecutive(self):
+        start = datetime(2025, 6, 1)
+        windows = split_time_window(start, datetime(2025, 6, 4), 3)
+        assert windows == [(start, datetime(2025, 6, 2)),
+                           (datetime(2025, 6, 2), datetime(2025, 6, 3)),
+                           (datetime(2025, 6, 3), datetime(2025, 6, 4))]
+
+    def test_split_time_window_one_shard(self):
+        start, end = datetime(2025, 6, 1), datetime(2025, 6, 4)
+        assert split_time_window(start, end, 1) == [(start, end)]
+
+
+class TestMergeFeatures:
+
+    def test_merge_features_keeps_latest_version(self):
+        old = {"id": "a", "properties": {"updated": 1}}
+        new = {"id": "a", "properties": {"updated": 2}}
+        other = {"id": "b", "properties": {"updated": 1}}
+        assert merge_features([[old, other], [new]]) == [new, other]
+
+
+class TestAccessAPIBackfill:
+
+    def backfill_from_stand_in(self, monkeypatch, size: int) -> dict:
+        end = datetime(2025, 6, 30)
+        start = end - timedelta(days=30)
+        times = make_sample_times(start, end, size)
+
+        async def backfill():
+            runner = web.AppRunner(make_stand_in(times, 0, 0))
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            monkeypatch.setenv("USGS_API_URL",
+                               f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+            try:
+                return await access_api_backfill(start, end)
+            finally:
+                await runner.cleanup()
+
+        return asyncio.run(backfill())
+
+    def test_access_api_backfill_shards(self, monkeypatch):
+        monkeypatch.setenv("BACKFILL_SHARD_SIZE", "100")
+        result = self.backfill_from_stand_in(monkeypatch, 1000)
+        assert len(result["features"]) == 1000
+        assert len({feature["id"] for feature in result["features"]}) == 1000
+
+    def test_access_api_backfill_pages_dense_shards(self, monkeypatch):
+        monkeypatch.setenv("BACKFILL_SHARD_SIZE", "1000")
+        monkeypatch.setenv("BACKFILL_PAGE_SIZE", "30")
+        result = self.backfill_from_stand_in(monkeypatch, 500)
+        assert len({feature["id"] for feature in result["features"]}) == 500
+
+
 @patch("extract.access_api")
 class TestExtract:
 
@@ -0,0 +1,92 @@
+# pylint: skip-file
+"""Unit tests for the functions in geocode.py."""
+
+from unittest.mock import MagicMock, patch
+
+from geocode import (get_grid_key, get_cached_address, cache_address,
+                     get_cache_stats, is_cache_empty, warm_geocode_cache)
+from transform import get_address
+
+
+class TestGetGridKey:
+    """A class that groups together tests for get_grid_key()."""
+
+    def test_get_grid_key_rounds_to_precision(self):
+        """Checks nearby coordinates share a grid cell."""
+        assert get_grid_key(33.6663333, -116.771, 2) == get_grid_key(
+            33.6670, -116.7705, 2)
+
+    def test_get_grid_key_accepts_strings(self):
+        """Checks coordinates given as strings by the API are converted."""
+        assert get_grid_key("33.6663333", "-116.771", 1) == (337, -1168)
+
+
+class TestCache:
+    """A class that groups together tests for reading and writing the cache."""
+
+    def test_get_cached_address_miss(self):
+        """Checks an empty cache misses and is counted."""
+        assert get_cached_address(10.0, 20.0) is None
+        assert get_cache_stats()["misses"] == 1
+
+    def test_get_cached_address_hit(self):
+        """Checks a cached address is returned for the same grid cell."""
+        cache_address(10.001, 20.001, ["California", "United States"])
+        assert get_cached_address(10.0, 20.0) == ["California", "United States"]
+        assert get_cache_stats() == {"hits": 1, "misses": 0, "hit_rate": 1.0}
+
+    def test_cache_address_evicts_least_recently_used(self, monkeypatch):
+        """Checks the oldest unused address is removed when the cache is full."""
+        monkeypatch.setenv("GEOCODE_CACHE_SIZE", "2")
+        cache_address(1.0, 1.0, ["Unknown", "Japan"])
+        cache_address(2.0, 2.0, ["Unknown", "Chile"])
+        get_cached_address(1.0, 1.0)
+        cache_address(3.0, 3.0, ["Unknown", "Peru"])
+        assert get_cached_address(2.0, 2.0) is None
+        assert get_cached_address(1.0, 1.0) == ["Unknown", "Japan"]
+        assert get_cached_address(3.0, 3.0) == ["Unknown", "Peru"]
+
+    def test_is_cache_empty(self):
+        """Checks the cache reports when it has addresses."""
+        assert is_cache_empty()
+        cache_address(1.0, 1.0, ["Unknown", "Japan"])
+        assert not is_cache_empty()
+
+
+class TestWarmGeocodeCache:
+    """A class that groups together tests for warm_geocode_cache()."""
+
+    def test_warm_geocode_cache(self, mock_conn):
+        """Checks stored earthquakes become cached addresses."""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [
+            {"latitude": 36.6, "longitude": -121.1,
+             "state_name": "California", "region_name": "West Coast"},
+            {"latitude": 35.7, "longitude": 139.7,
+             "state_name": "Not in the USA", "region_name": "Japan"}
+        ]
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        assert warm_geocode_cache(mock_conn) == 2
+        assert get_cached_address(36.6, -121.1) == ["California", "United States"]
+        assert get_cached_address(35.7, 139.7) == ["Unknown", "Japan"]
+
+
+class TestGetAddress:
+    """A class that groups together tests for get_address() with the cache."""
+
+    @patch("transform.get_geocoder")
+    def test_get_address_skips_opencage_when_cached(self, mock_geocoder):
+        """Checks repeated locations only call OpenCage once."""
+        mock_geocoder.return_value.reverse_geocode.return_value = [
+            {"components": {"country": "United States", "state": "Alaska"}}]
+        assert get_address(61.6048, -150.6809) == ["Alaska", "United States"]
+        assert get_address(61.6045, -150.6812) == ["Alaska", "United States"]
+        assert mock_geocoder.return_value.reverse_geocode.call_count == 1
+
+    @patch("transform.get_geocoder")
+    def test_get_address_does_not_cache_errors(self, mock_geocoder):
+        """Checks failed OpenCage lookups are retried next time."""
+        mock_geocoder.return_value.reverse_geocode.side_effect = Exception("quota")
+        assert get_address(10.0, 20.0) == ["Unknown", "No Country"]
+        assert get_address(10.0, 20.0) == ["Unknown", "No Country"]
+        assert mock_geocoder.return_value.reverse_geocode.call_count == 2
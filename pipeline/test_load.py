@@ -5,53 +5,49 @@ from unittest.mock import MagicMock, patch
 
 from pandas import DataFrame
 from pandas.testing import assert_frame_equal
+from psycopg import DatabaseError
 
-from load import (get_current_db, get_diff, upload_df_to_db)
+from load import (prepare_quakes, load, upload_df_to_db, upload_row_to_db,
+                  get_dimension_ids, get_copy_row, bulk_upload_df_to_db,
+                  dimension_cache, preload_dimension_cache, invalidate_dimension_cache,
+                  get_region_id, get_state_id, get_load_stats, load_stats)
 
 
-class TestGetCurrentDB:
-    """A class that groups together tests for get_current_db()."""
+class TestPrepareQuakes:
+    """A class that groups together tests for prepare_quakes()."""
 
-    def test_get_current_db_returns_dataframe(self, example_dict):
+    def test_prepare_quakes_returns_dataframe(self, example_df):
         """Checks the function returns a dataframe."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [example_dict]
-
-        with patch("load.get_connection") as mock_conn:
-            mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-            df = get_current_db()
-        assert isinstance(df, DataFrame)
-
-    def test_get_current_db_returns_expected_columns(self, mock_conn, example_dict):
-        """Checks the function has all expected columns."""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [example_dict]
-
-        with patch("load.get_connection") as mock_conn:
-            mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-            df = get_current_db()
-        expected_cols = {
-            "earthquake_id", "magnitude", "latitude", "longitude", "time", "updated", "depth",
-            "url", "felt", "tsunami", "cdi", "mmi", "nst", "sig", "net", "dmin",
-            "alert", "location_source", "magnitude_type", "region_id", "state_id", "state_name", "region_name"
-        }
-        assert set(df.columns) == expected_cols
+        assert isinstance(prepare_quakes(example_df), DataFrame)
 
+    def test_prepare_quakes_drops_duplicate_urls(self, example_df):
+        """Checks only the latest version of a repeated event is kept."""
+        repeated = example_df.copy()
+        repeated.loc[1, "url"] = "example.com"
+        repeated.loc[1, "updated"] = 1749753476
+        result = prepare_quakes(repeated)
+        assert len(result) == 1
+        assert result.loc[0, "magnitude"] == 4.0
 
-class TestGetDiff:
-    """A class that groups together tests for get_diff()."""
 
-    def test_get_diff_returns_dataframe(self, example_df, example_df2):
-        """Checks the function returns a dataframe."""
-        diff_df = get_diff(example_df, example_df2)
-        assert isinstance(diff_df, DataFrame)
+class TestLoad:
+    """A class that groups together tests for load()."""
 
-    def test_get_diff_returns_expected_diff(self, example_df, example_df2, example_diff):
-        """Checks the function returns expected difference between two dataframes."""
-        diff_df = get_diff(example_df, example_df2)
-        assert_frame_equal(diff_df.reset_index(drop=True),
+    def test_load_returns_uploaded_rows(self, example_df, example_diff):
+        """Checks the function returns only the rows the database accepted."""
+        with patch("load.upload_df_to_db") as mock_upload:
+            mock_upload.return_value = ["another.com"]
+            result = load(example_df)
+        assert_frame_equal(result.reset_index(drop=True),
                            example_diff.reset_index(drop=True))
 
+    def test_load_returns_empty_when_nothing_changed(self, example_df):
+        """Checks the function returns an empty dataframe with no new rows."""
+        with patch("load.upload_df_to_db") as mock_upload:
+            mock_upload.return_value = []
+            result = load(example_df)
+        assert result.empty
+
 
 class TestUploadDFToDB:
     """A class that groups together tests for upload_df_to_db."""
@@ -64,3 +60,236 @@ class TestUploadDFToDB:
             assert mock_upload.call_count == len(example_df)
             for _, row in example_df.iterrows():
                 mock_upload.assert_any_call(row.to_dict())
+
+    def test_upload_df_to_db_returns_changed_urls(self, example_df):
+        """Check that only rows the upsert wrote are returned."""
+        with patch("load.upload_row_to_db") as mock_upload:
+            mock_upload.side_effect = [False, True]
+            assert upload_df_to_db(example_df) == ["another.com"]
+
+    def test_upload_df_to_db_database_error_invalidates_cache(self, example_df):
+        """Check a failed row drops cached ids its rolled back inserts may have added."""
+        dimension_cache.update({"region": {"west coast": 1},
+                                "state": {}, "state_region": {}})
+        with patch("load.upload_row_to_db") as mock_upload:
+            mock_upload.side_effect = [DatabaseError("failed"), True]
+            assert upload_df_to_db(example_df) == ["another.com"]
+        assert not dimension_cache
+
+    def test_upload_df_to_db_counts_failed_rows(self, example_df):
+        """Check rows that fail to upload are counted, so the watermark is held back."""
+        load_stats.update({"failed": 0})
+        with patch("load.upload_row_to_db") as mock_upload:
+            mock_upload.side_effect = [DatabaseError("failed"), True]
+            upload_df_to_db(example_df)
+        assert get_load_stats() == {"failed": 1}
+
+    def test_upload_df_to_db_bulk_calls_bulk_upload(self, example_df):
+        """Check that bulk mode does not upload row by row."""
+        with patch("load.upload_row_to_db") as mock_upload, \
+                patch("load.bulk_upload_df_to_db") as mock_bulk:
+            upload_df_to_db(example_df, bulk=True)
+            mock_bulk.assert_called_once_with(example_df)
+            mock_upload.assert_not_called()
+
+
+class TestUploadRowToDB:
+    """A class that groups together tests for upload_row_to_db."""
+
+    def test_upload_row_to_db_upserts_on_url(self, example_df):
+        """Check the earthquake insert is an upsert keyed on url."""
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = {"region_id": 1, "state_id": 1,
+                                             "state_region_interaction_id": 1,
+                                             "earthquake_id": 1}
+        with patch("load.get_connection", return_value=mock_conn):
+            assert upload_row_to_db(example_df.to_dict(orient="records")[0])
+        query = mock_cursor.execute.call_args[0][0]
+        assert 'ON CONFLICT ("url")' in query
+        assert "earthquake.updated < EXCLUDED.updated" in query
+
+    def test_upload_row_to_db_unchanged(self, example_df):
+        """Check an event that was not newer is reported as not uploaded."""
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.side_effect = [{"region_id": 1}, {"state_id": 1},
+                                            {"state_region_interaction_id": 1},
+                                            None]
+        with patch("load.get_connection", return_value=mock_conn):
+            assert not upload_row_to_db(example_df.to_dict(orient="records")[0])
+
+
+class TestGetDimensionIDs:
+    """A class that groups together tests for get_dimension_ids."""
+
+    def test_get_dimension_ids_existing(self, mock_conn, example_df):
+        """Check that known states and regions are found without inserts."""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.side_effect = [
+            [{"region_id": 1, "region_name": "West Coast"}],
+            [{"state_id": 1, "state_name": "California"},
+             {"state_id": 5, "state_name": "Nevada"}],
+            [{"state_region_interaction_id": 1, "state_id": 1, "region_id": 1},
+             {"state_region_interaction_id": 7, "state_id": 5, "region_id": 1}]
+        ]
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        ids = get_dimension_ids(mock_conn, example_df)
+        assert ids == {("California", "West Coast"): 1,
+                       ("Nevada", "West Coast"): 7}
+        assert mock_cursor.execute.call_count == 3
+
+    def test_get_dimension_ids_is_case_insensitive(self, mock_conn, example_df):
+        """Check that names are matched regardless of case like ILIKE."""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.side_effect = [
+            [{"region_id": 1, "region_name": "west coast"}],
+            [{"state_id": 1, "state_name": "CALIFORNIA"},
+             {"state_id": 5, "state_name": "nevada"}],
+            [{"state_region_interaction_id": 1, "state_id": 1, "region_id": 1},
+             {"state_region_interaction_id": 7, "state_id": 5, "region_id": 1}]
+        ]
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        ids = get_dimension_ids(mock_conn, example_df)
+        assert ids[("Nevada", "West Coast")] == 7
+
+    def test_get_dimension_ids_inserts_missing(self, mock_conn, example_df):
+        """Check that each missing dimension is inserted once."""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.side_effect = [[], [], []]
+        mock_cursor.fetchone.side_effect = [
+            None, {"region_id": 1},
+            None, {"state_id": 1},
+            None, {"state_region_interaction_id": 1},
+            None, {"state_id": 2},
+            None, {"state_region_interaction_id": 2}
+        ]
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        ids = get_dimension_ids(mock_conn, example_df)
+        assert ids == {("California", "West Coast"): 1,
+                       ("Nevada", "West Coast"): 2}
+        assert mock_cursor.execute.call_count == 13
+        assert dimension_cache["region"] == {"west coast": 1}
+
+    def test_get_dimension_ids_uses_cache(self, mock_conn, example_df):
+        """Check a warm cache answers the batch without any queries."""
+        dimension_cache.update({
+            "region": {"west coast": 1},
+            "state": {"california": 1, "nevada": 5},
+            "state_region": {(1, 1): 1, (5, 1): 7}
+        })
+        ids = get_dimension_ids(mock_conn, example_df)
+        assert ids == {("California", "West Coast"): 1,
+                       ("Nevada", "West Coast"): 7}
+        mock_conn.cursor.assert_not_called()
+
+
+class TestDimensionCache:
+    """A class that groups together tests for the dimension cache."""
+
+    def test_preload_dimension_cache_only_loads_once(self, mock_conn):
+        """Check the tables are only read while the cache is empty."""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = []
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        preload_dimension_cache(mock_conn)
+        preload_dimension_cache(mock_conn)
+        assert mock_cursor.execute.call_count == 3
+
+    def test_invalidate_dimension_cache(self, mock_conn):
+        """Check invalidating empties the cache."""
+        dimension_cache.update({"region": {"west coast": 1},
+                                "state": {}, "state_region": {}})
+        invalidate_dimension_cache()
+        assert not dimension_cache
+
+    def test_get_region_id_is_case_insensitive(self, mock_conn):
+        """Check cached names match regardless of case like ILIKE."""
+        dimension_cache.update({"region": {"west coast": 1},
+                                "state": {}, "state_region": {}})
+        assert get_region_id(mock_conn, "WEST Coast") == 1
+        mock_conn.cursor.assert_not_called()
+
+    def test_get_state_id_miss_updates_cache(self, mock_conn):
+        """Check a state missing from the cache is looked up and remembered."""
+        dimension_cache.update({"region": {}, "state": {}, "state_region": {}})
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = {"state_id": 4,
+                                             "state_name": "Idaho"}
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        assert get_state_id(mock_conn, "Idaho") == 4
+        assert dimension_cache["state"] == {"idaho": 4}
+
+
+class TestGetCopyRow:
+    """A class that groups together tests for get_copy_row."""
+
+    def test_get_copy_row_order(self, example_df):
+        """Check values are returned in column order with the dimension id last."""
+        row = example_df.to_dict(orient="records")[0]
+        result = get_copy_row(row, 3)
+        assert result[0] == 2.5
+        assert result[6] == "example.com"
+        assert result[-1] == 3
+
+    def test_get_copy_row_nulls(self, example_df):
+        """Check missing values become None and counts become ints."""
+        row = example_df.to_dict(orient="records")[0]
+        row["cdi"] = float("nan")
+        row["nst"] = 4.0
+        result = get_copy_row(row, 3)
+        assert result[9] is None
+        assert result[11] == 4
+        assert isinstance(result[11], int)
+
+
+class TestBulkUploadDFToDB:
+    """A class that groups together tests for bulk_upload_df_to_db."""
+
+    def test_bulk_upload_df_to_db_copies_rows(self, example_df):
+        """Check every row is written to a single COPY and committed once."""
+        mock_conn = MagicMock()
+        mock_copy = mock_conn.cursor.return_value.__enter__.return_value \
+            .copy.return_value.__enter__.return_value
+        with patch("load.get_connection", return_value=mock_conn), \
+                patch("load.get_dimension_ids") as mock_ids:
+            mock_ids.return_value = {("California", "West Coast"): 1,
+                                     ("Nevada", "West Coast"): 2}
+            bulk_upload_df_to_db(example_df)
+        assert mock_copy.write_row.call_count == len(example_df)
+        mock_conn.commit.assert_called_once()
+
+    def test_bulk_upload_df_to_db_returns_upserted_urls(self, example_df):
+        """Check the urls returned by the upsert are passed back."""
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [{"url": "another.com"}]
+        with patch("load.get_connection", return_value=mock_conn), \
+                patch("load.get_dimension_ids") as mock_ids:
+            mock_ids.return_value = {("California", "West Coast"): 1,
+                                     ("Nevada", "West Coast"): 2}
+            assert bulk_upload_df_to_db(example_df) == ["another.com"]
+
+    def test_bulk_upload_df_to_db_skips_bad_rows(self, example_df):
+        """Check rows without a dimension id are not copied."""
+        mock_conn = MagicMock()
+        mock_copy = mock_conn.cursor.return_value.__enter__.return_value \
+            .copy.return_value.__enter__.return_value
+        with patch("load.get_connection", return_value=mock_conn), \
+                patch("load.get_dimension_ids") as mock_ids:
+            mock_ids.return_value = {("California", "West Coast"): 1}
+            load_stats.update({"failed": 0})
+            bulk_upload_df_to_db(example_df)
+        assert mock_copy.write_row.call_count == 1
+        assert get_load_stats() == {"failed": 1}
+
+    def test_bulk_upload_df_to_db_falls_back(self, example_df):
+        """Check a failed COPY is rolled back and retried row by row."""
+        mock_conn = MagicMock()
+        with patch("load.get_connection", return_value=mock_conn), \
+                patch("load.get_dimension_ids") as mock_ids, \
+                patch("load.upload_row_to_db") as mock_upload:
+            mock_ids.side_effect = DatabaseError("copy failed")
+            bulk_upload_df_to_db(example_df)
+        mock_conn.rollback.assert_called_once()
+        assert mock_upload.call_count == len(example_df)
@@ -0,0 +1,119 @@
+# pylint: skip-file
+"""Unit tests for the functions in offline_geocoder.py."""
+
+from unittest.mock import patch
+
+import numpy as np
+
+from offline_geocoder import (is_point_in_polygon, get_distance_to_boundary,
+                              find_boundary, get_offline_address)
+from transform import get_address
+
+
+def make_square(size: float) -> dict:
+    """Returns a square polygon with its bottom left corner at 0, 0."""
+    ring = np.array([[0, 0], [size, 0], [size, size], [0, size], [0, 0]],
+                    dtype=float)
+    return {"name": "Square", "x1": ring[:-1, 0], "y1": ring[:-1, 1],
+            "x2": ring[1:, 0], "y2": ring[1:, 1]}
+
+
+class TestIsPointInPolygon:
+    """A class that groups together tests for is_point_in_polygon()."""
+
+    def test_is_point_in_polygon_inside(self):
+        """Checks a point in the middle of a square is inside."""
+        assert is_point_in_polygon(make_square(2), 1, 1)
+
+    def test_is_point_in_polygon_outside(self):
+        """Checks points either side of a square are outside."""
+        assert not is_point_in_polygon(make_square(2), 1, 3)
+        assert not is_point_in_polygon(make_square(2), 1, -1)
+
+
+class TestGetDistanceToBoundary:
+    """A class that groups together tests for get_distance_to_boundary()."""
+
+    def test_get_distance_to_boundary_nearest_edge(self):
+        """Checks the distance is to the nearest edge in km."""
+        distance = get_distance_to_boundary(make_square(2), 0.5, 1)
+        assert round(distance, 1) == 55.6
+
+
+class TestFindBoundary:
+    """A class that groups together tests for find_boundary()."""
+
+    def test_find_boundary_inside_state(self):
+        """Checks a point well inside a state is found."""
+        assert find_boundary("us_states", 39.5, -105.5) == ("Colorado", False)
+
+    def test_find_boundary_near_border_is_ambiguous(self):
+        """Checks a point on a state border is not answered."""
+        assert find_boundary("us_states", 41.0, -104.5) == (None, True)
+
+    def test_find_boundary_outside_all(self):
+        """Checks a point in the open ocean has no boundary."""
+        assert find_boundary("countries", 0, -140) == (None, False)
+
+
+class TestGetOfflineAddress:
+    """A class that groups together tests for get_offline_address()."""
+
+    def test_get_offline_address_us_state(self):
+        """Checks US points give the state like OpenCage."""
+        assert get_offline_address(36.5, -118.5) == ["California", "United States"]
+
+    def test_get_offline_address_puerto_rico(self):
+        """Checks Puerto Rico is given as a state of the United States."""
+        assert get_offline_address(18.2, -66.5) == ["Puerto Rico", "United States"]
+
+    def test_get_offline_address_country(self):
+        """Checks points outside the US give the country."""
+        assert get_offline_address(36.2, 138.25) == ["Unknown State", "Japan"]
+
+    def test_get_offline_address_ocean(self):
+        """Checks points in no boundary are left to OpenCage."""
+        assert get_offline_address(0, -140) is None
+
+    def test_get_offline_address_small_island(self):
+        """Checks islands missing from the boundaries, like Tonga, are left to OpenCage."""
+        assert get_offline_address(-21.14, -175.2) is None
+
+    def test_get_offline_address_wraps_longitude(self):
+        """Checks longitudes beyond 180 degrees are wrapped."""
+        assert get_offline_address(36.2, 138.25 - 360) == ["Unknown State", "Japan"]
+
+    def test_get_offline_address_near_border(self):
+        """Checks points near a border are left to OpenCage."""
+        assert get_offline_address(49.0, -100.0) is None
+
+
+class TestGetAddressStrategy:
+    """A class that groups together tests for choosing the geocoder in get_address()."""
+
+    @patch("transform.get_geocoder")
+    def test_get_address_uses_offline_geocoder(self, mock_get_geocoder, monkeypatch):
+        """Checks OpenCage is not called when the offline geocoder answers."""
+        monkeypatch.setenv("GEOCODER", "offline")
+        assert get_address(36.5, -118.5) == ["California", "United States"]
+        mock_get_geocoder.assert_not_called()
+
+    @patch("transform.get_geocoder")
+    def test_get_address_falls_back_to_opencage(self, mock_get_geocoder, monkeypatch):
+        """Checks ambiguous points are looked up with OpenCage."""
+        monkeypatch.setenv("GEOCODER", "offline")
+        mock_get_geocoder.return_value.reverse_geocode.return_value = [
+            {"components": {"state": "North Dakota", "country": "United States"}}]
+        assert get_address(49.0, -100.0) == ["North Dakota", "United States"]
+        mock_get_geocoder.return_value.reverse_geocode.assert_called_once()
+
+    @patch("transform.get_offline_address")
+    @patch("transform.get_geocoder")
+    def test_get_address_offline_disabled_by_default(self, mock_get_geocoder,
+                                                     mock_get_offline_address,
+                                                     monkeypatch):
+        """Checks the offline geocoder is only used when enabled."""
+        monkeypatch.delenv("GEOCODER", raising=False)
+        mock_get_geocoder.return_value.reverse_geocode.return_value = []
+        get_address(36.5, -118.5)
+        mock_get_offline_address.assert_not_called()
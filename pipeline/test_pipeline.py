@@ -1,12 +1,14 @@
 # pylint: skip-file
 """Unit tests for the functions in pipeline.py."""
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from os import environ as ENV
 from unittest.mock import patch
 
 from pandas import DataFrame
 
+from load import load_stats
+
 from pipeline import (run_pipeline,
                       get_time_window_from_cli,
                       get_time_window_from_event,
@@ -37,6 +39,124 @@ class TestRunPipeline:
         assert isinstance(result, DataFrame)
         assert not result.empty
 
+    @patch("pipeline.get_fetch_stats")
+    @patch("pipeline.save_watermark")
+    @patch("pipeline.get_watermark")
+    @patch("pipeline.get_connection")
+    @patch("pipeline.extract")
+    @patch("pipeline.transform")
+    @patch("pipeline.load")
+    def test_run_pipeline_incremental(self, mock_load, mock_transform, mock_extract,
+                                      mock_get_connection, mock_get_watermark,
+                                      mock_save_watermark, mock_get_fetch_stats,
+                                      monkeypatch):
+        """Checks incremental runs extract from the watermark and advance it."""
+        monkeypatch.setenv("EXTRACT_MODE", "incremental")
+        now = datetime.now()
+        watermark = datetime(2025, 6, 11, tzinfo=timezone.utc)
+        dummy_df = DataFrame({"updated": [1749675581157, 1749675500000]})
+        mock_get_watermark.return_value = watermark
+        mock_get_fetch_stats.return_value = {"succeeded": 2, "retried": 0, "abandoned": 0}
+        mock_extract.return_value = [{"dummy": "data"}]
+        mock_transform.return_value = dummy_df
+        mock_load.return_value = dummy_df
+
+        run_pipeline(start=now - timedelta(hours=4), end=now)
+
+        assert mock_extract.call_args[0][3] == watermark - timedelta(minutes=10)
+        assert mock_save_watermark.call_args[0][1] == datetime(
+            2025, 6, 11, 20, 59, 41, 157000, tzinfo=timezone.utc)
+
+    @patch("pipeline.get_fetch_stats")
+    @patch("pipeline.save_watermark")
+    @patch("pipeline.get_watermark")
+    @patch("pipeline.get_connection")
+    @patch("pipeline.extract")
+    @patch("pipeline.transform")
+    @patch("pipeline.load")
+    def test_run_pipeline_incremental_caps_watermark_at_window_end(
+            self, mock_load, mock_transform, mock_extract, mock_get_connection,
+            mock_get_watermark, mock_save_watermark, mock_get_fetch_stats, monkeypatch):
+        """
+        Checks a lagged window does not store a watermark past its end,
+        so an event after the window updated before its latest update is extracted next run.
+        """
+        monkeypatch.setenv("EXTRACT_MODE", "incremental")
+        monkeypatch.setenv("WATERMARK_OVERLAP", "0")
+        end = datetime(2025, 6, 11, 20, 0)
+        # Updated at 20:59:41, an hour after the window ended.
+        dummy_df = DataFrame({"updated": [1749675581157]})
+        mock_get_watermark.return_value = None
+        mock_get_fetch_stats.return_value = {"succeeded": 1, "retried": 0, "abandoned": 0}
+        mock_extract.return_value = [{"dummy": "data"}]
+        mock_transform.return_value = dummy_df
+        mock_load.return_value = dummy_df
+
+        run_pipeline(start=end - timedelta(hours=1), end=end)
+
+        saved = mock_save_watermark.call_args[0][1]
+        assert saved == datetime(2025, 6, 11, 20, 0, tzinfo=timezone.utc)
+
+        # An event from just after the first window, updated at 20:30.
+        mock_get_watermark.return_value = saved
+        run_pipeline(start=end, end=end + timedelta(hours=1))
+
+        assert mock_extract.call_args[0][3] < datetime(2025, 6, 11, 20, 30, tzinfo=timezone.utc)
+
+    @patch("pipeline.get_fetch_stats")
+    @patch("pipeline.save_watermark")
+    @patch("pipeline.get_watermark")
+    @patch("pipeline.get_connection")
+    @patch("pipeline.extract")
+    @patch("pipeline.transform")
+    @patch("pipeline.load")
+    def test_run_pipeline_incremental_keeps_watermark_after_abandoned_fetch(
+            self, mock_load, mock_transform, mock_extract, mock_get_connection,
+            mock_get_watermark, mock_save_watermark, mock_get_fetch_stats, monkeypatch):
+        """Checks events that could not be fetched are tried again next run."""
+        monkeypatch.setenv("EXTRACT_MODE", "incremental")
+        now = datetime.now()
+        dummy_df = DataFrame({"updated": [1749675581157]})
+        mock_get_watermark.return_value = None
+        mock_get_fetch_stats.return_value = {"succeeded": 1, "retried": 4, "abandoned": 1}
+        mock_extract.return_value = [{"dummy": "data"}]
+        mock_transform.return_value = dummy_df
+        mock_load.return_value = dummy_df
+
+        run_pipeline(start=now - timedelta(hours=4), end=now)
+
+        assert mock_extract.call_args[0][3] is None
+        mock_save_watermark.assert_not_called()
+
+    @patch("pipeline.get_fetch_stats")
+    @patch("pipeline.save_watermark")
+    @patch("pipeline.get_watermark")
+    @patch("pipeline.get_connection")
+    @patch("pipeline.extract")
+    @patch("pipeline.transform")
+    @patch("pipeline.load")
+    def test_run_pipeline_incremental_keeps_watermark_after_failed_load(
+            self, mock_load, mock_transform, mock_extract, mock_get_connection,
+            mock_get_watermark, mock_save_watermark, mock_get_fetch_stats, monkeypatch):
+        """Checks events that could not be loaded are tried again next run."""
+        monkeypatch.setenv("EXTRACT_MODE", "incremental")
+        now = datetime.now()
+        dummy_df = DataFrame({"updated": [1749675581157, 1749675500000]})
+
+        def fail_one_row(quakes, bulk):
+            load_stats["failed"] += 1
+            return quakes.iloc[[1]]
+
+        mock_get_watermark.return_value = None
+        mock_get_fetch_stats.return_value = {"succeeded": 2, "retried": 0, "abandoned": 0}
+        mock_extract.return_value = [{"dummy": "data"}]
+        mock_transform.return_value = dummy_df
+        mock_load.side_effect = fail_one_row
+
+        run_pipeline(start=now - timedelta(hours=4), end=now)
+
+        mock_save_watermark.assert_not_called()
+
 
 class TestLambdaHandler:
     """A class that groups together tests for lambda_handler()."""
@@ -75,6 +195,31 @@ class TestLambdaHandler:
         assert result["message"]["topic"] == "Earthquake Alert"
 
 
+class TestLambdaHandlerStreaming:
+    """A class that groups together tests for lambda_handler() in streaming mode."""
+
+    @patch("pipeline.get_time_window_from_event")
+    @patch("pipeline.run_streaming_pipeline")
+    @patch("pipeline.get_topic_dictionaries")
+    def test_lambda_handler_streaming(self, mock_get_topic_dictionaries,
+                                      mock_run_streaming_pipeline,
+                                      mock_get_time_window_from_event, monkeypatch):
+        """Checks alerts matched while streaming are returned without matching again."""
+        monkeypatch.setenv("PIPELINE_MODE", "streaming")
+        start = datetime.now() - timedelta(hours=1)
+        end = datetime.now()
+        mock_get_time_window_from_event.return_value = (start, end)
+        mock_run_streaming_pipeline.return_value = (DataFrame({
+            "url": ["https://quake1"], "time": [start], "updated": [end]}),
+            [{"topic_arn": "arn"}])
+
+        result = lambda_handler({"start": 60, "end": 0}, None)
+
+        assert result["earthquakes"] == ["https://quake1"]
+        assert result["message"] == [{"topic_arn": "arn"}]
+        mock_get_topic_dictionaries.assert_not_called()
+
+
 class TestGetTimeWindowFromCLI:
     """A class that groups together tests for get_time_window_from_cli()."""
 
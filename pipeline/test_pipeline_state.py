@@ -0,0 +1,53 @@
+# pylint: skip-file
+"""Unit tests for the functions in pipeline_state.py."""
+
+from datetime import datetime, timezone
+
+from psycopg import DatabaseError
+
+from pipeline_state import get_watermark, save_watermark, get_watermark_from_ms
+
+
+class TestGetWatermark:
+    """A class that groups together tests for get_watermark()."""
+
+    def test_get_watermark_stored(self, mock_conn):
+        """Checks the stored watermark is returned."""
+        updated = datetime(2025, 6, 11, tzinfo=timezone.utc)
+        mock_conn.cursor.return_value.__enter__.return_value.fetchone.return_value = {
+            "updated": updated}
+        assert get_watermark(mock_conn) == updated
+
+    def test_get_watermark_missing(self, mock_conn):
+        """Checks no watermark is returned on the first run."""
+        mock_conn.cursor.return_value.__enter__.return_value.fetchone.return_value = None
+        assert get_watermark(mock_conn) is None
+
+    def test_get_watermark_lost_table(self, mock_conn):
+        """Checks a missing state table falls back to no watermark."""
+        mock_conn.cursor.return_value.__enter__.return_value.execute.side_effect = \
+            DatabaseError("relation \"pipeline_state\" does not exist")
+        assert get_watermark(mock_conn) is None
+        mock_conn.rollback.assert_called_once()
+
+
+class TestSaveWatermark:
+    """A class that groups together tests for save_watermark()."""
+
+    def test_save_watermark_commits(self, mock_conn):
+        """Checks the watermark is upserted and committed."""
+        updated = datetime(2025, 6, 11, tzinfo=timezone.utc)
+        save_watermark(mock_conn, updated)
+        query, params = mock_conn.cursor.return_value.__enter__.return_value.execute.call_args[0]
+        assert "GREATEST" in query
+        assert params == ("usgs_updated", updated)
+        mock_conn.commit.assert_called_once()
+
+
+class TestGetWatermarkFromMS:
+    """A class that groups together tests for get_watermark_from_ms()."""
+
+    def test_get_watermark_from_ms(self):
+        """Checks USGS millisecond timestamps keep their milliseconds in UTC."""
+        assert get_watermark_from_ms(1749675581157) == datetime(
+            2025, 6, 11, 20, 59, 41, 157000, tzinfo=timezone.utc)
@@ -0,0 +1,138 @@
+# pylint: skip-file
+"""Unit tests for the functions in stream.py."""
+
+import asyncio
+from copy import deepcopy
+from datetime import datetime, timedelta
+from unittest.mock import patch, AsyncMock
+
+from pytest import raises
+
+from load import load_stats
+from stream import add_stage_time, log_stage_timings, stream_pipeline
+
+
+class TestStageTimings:
+    """A class that groups together tests for recording stage timings."""
+
+    def test_add_stage_time_spans_and_busy(self):
+        """Checks repeated work widens the span and adds to busy time."""
+        timings = {}
+        add_stage_time(timings, "load", 1.0, 2.0)
+        add_stage_time(timings, "load", 4.0, 4.5)
+        assert timings == {"load": {"start": 1.0, "end": 4.5, "busy": 1.5}}
+
+    def test_log_stage_timings_staged_has_no_overlap(self):
+        """Checks back to back stages overlap once."""
+        timings = {"extract": {"start": 0, "end": 1, "busy": 1},
+                   "load": {"start": 1, "end": 3, "busy": 2}}
+        assert log_stage_timings(timings, "Staged") == 1.0
+
+    def test_log_stage_timings_streaming_overlap(self):
+        """Checks concurrent stages give an overlap above one."""
+        timings = {"extract": {"start": 0, "end": 2, "busy": 2},
+                   "load": {"start": 0, "end": 2, "busy": 1}}
+        assert log_stage_timings(timings, "Streaming") == 2.0
+
+
+class TestStreamPipeline:
+    """A class that groups together tests for stream_pipeline()."""
+
+    @patch("stream.get_subscription_topics")
+    @patch("stream.load")
+    @patch("stream.make_api_call", new_callable=AsyncMock)
+    @patch("stream.access_api")
+    @patch("transform.get_address")
+    def test_stream_pipeline_batches(self, mock_get_address, mock_access_api,
+                                     mock_make_api_call, mock_load, mock_get_topics,
+                                     example_detailed_event, monkeypatch):
+        """Checks every event is loaded in batches and matched to topics per batch."""
+        monkeypatch.setenv("STREAM_BATCH_SIZE", "2")
+        monkeypatch.setenv("STREAM_QUEUE_SIZE", "2")
+        mock_get_address.return_value = ["California", "United States"]
+        mock_access_api.return_value = {"features": [{"id": f"ci{i}"} for i in range(5)]}
+        details = []
+        for i in range(5):
+            detail = deepcopy(example_detailed_event)
+            detail["properties"]["url"] = f"example.com/{i}"
+            details.append(detail)
+        mock_make_api_call.side_effect = details
+        mock_load.side_effect = lambda batch, bulk: batch
+        mock_get_topics.return_value = []
+
+        with patch("stream.get_topic_dictionaries",
+                   side_effect=lambda data, topics: [{"url": url} for url in data["url"]]):
+            uploaded, alerts, latest_updates, timings = asyncio.run(stream_pipeline(
+                datetime.now() - timedelta(hours=1), datetime.now()))
+
+        assert [len(call.args[0]) for call in mock_load.call_args_list] == [2, 2, 1]
+        assert sorted(uploaded["url"]) == [f"example.com/{i}" for i in range(5)]
+        assert len(alerts) == 5
+        assert len(latest_updates) == 3
+        assert set(timings) == {"extract", "transform", "load", "topics"}
+
+    @patch("stream.get_subscription_topics")
+    @patch("stream.load")
+    @patch("stream.make_api_call", new_callable=AsyncMock)
+    @patch("stream.access_api")
+    @patch("transform.get_address")
+    def test_stream_pipeline_skips_failed_event(self, mock_get_address, mock_access_api,
+                                                mock_make_api_call, mock_load, mock_get_topics,
+                                                example_detailed_event, monkeypatch):
+        """Checks an event that fails to transform is skipped and counted, without hanging."""
+        monkeypatch.setenv("STREAM_BATCH_SIZE", "2")
+        monkeypatch.setenv("STREAM_QUEUE_SIZE", "2")
+        mock_get_address.side_effect = [["California", "United States"]] * 3 \
+            + [KeyError("Atlantis")] + [["California", "United States"]] * 16
+        mock_access_api.return_value = {"features": [{"id": f"ci{i}"} for i in range(20)]}
+        details = []
+        for i in range(20):
+            detail = deepcopy(example_detailed_event)
+            detail["properties"]["url"] = f"example.com/{i}"
+            details.append(detail)
+        mock_make_api_call.side_effect = details
+        mock_load.side_effect = lambda batch, bulk: batch
+        mock_get_topics.return_value = []
+        load_stats.update({"failed": 0})
+
+        with patch("stream.get_topic_dictionaries", return_value=[]):
+            uploaded, _, _, _ = asyncio.run(asyncio.wait_for(stream_pipeline(
+                datetime.now() - timedelta(hours=1), datetime.now()), 10))
+
+        assert len(uploaded) == 19
+        assert load_stats["failed"] == 1
+
+    @patch("stream.get_subscription_topics")
+    @patch("stream.load")
+    @patch("stream.make_api_call", new_callable=AsyncMock)
+    @patch("stream.access_api")
+    @patch("transform.get_address")
+    def test_stream_pipeline_raises_failed_stage(self, mock_get_address, mock_access_api,
+                                                 mock_make_api_call, mock_load, mock_get_topics,
+                                                 example_detailed_event, monkeypatch):
+        """Checks a stage that fails cancels the others and raises rather than hanging."""
+        monkeypatch.setenv("STREAM_BATCH_SIZE", "2")
+        monkeypatch.setenv("STREAM_QUEUE_SIZE", "2")
+        mock_get_address.return_value = ["California", "United States"]
+        mock_access_api.return_value = {"features": [{"id": f"ci{i}"} for i in range(20)]}
+        mock_make_api_call.side_effect = [deepcopy(example_detailed_event) for _ in range(20)]
+        mock_load.side_effect = RuntimeError("database gone")
+        mock_get_topics.return_value = []
+
+        with raises(RuntimeError, match="database gone"):
+            asyncio.run(asyncio.wait_for(stream_pipeline(
+                datetime.now() - timedelta(hours=1), datetime.now()), 10))
+
+    @patch("stream.get_subscription_topics")
+    @patch("stream.load")
+    @patch("stream.access_api")
+    def test_stream_pipeline_no_events(self, mock_access_api, mock_load,
+                                       mock_get_topics):
+        """Checks an empty window finishes without loading anything."""
+        mock_access_api.return_value = {"features": []}
+        mock_get_topics.return_value = []
+        uploaded, alerts, _, _ = asyncio.run(stream_pipeline(
+            datetime.now() - timedelta(hours=1), datetime.now()))
+        assert uploaded.empty
+        assert alerts == []
+        mock_load.assert_not_called()
@@ -0,0 +1,74 @@
+# pylint: skip-file
+"""Unit tests for the functions in subscription_registry.py."""
+
+from decimal import Decimal
+from unittest.mock import patch
+
+from subscription_registry import get_registered_topics, save_registered_topics
+from sync_subscriptions import sync_subscriptions
+from topic import get_dict_from_topic
+
+
+class TestGetRegisteredTopics:
+    """A class that groups together tests for get_registered_topics()."""
+
+    def test_get_registered_topics_matches_topic_names(self, mock_conn):
+        """Checks registered topics are read as the same values their names give."""
+        mock_conn.cursor.return_value.__enter__.return_value.fetchall.return_value = [{
+            "topic_arn": "arn:aws:sns:eu-west-2:0:c17-quake-65-p12345-m67890-100",
+            "magnitude": Decimal("6.5"), "latitude": Decimal("1.2345"),
+            "longitude": Decimal("-6.7890"), "radius": 100}]
+        assert get_registered_topics(mock_conn) == [get_dict_from_topic(
+            "c17-quake-65-p12345-m67890-100",
+            "arn:aws:sns:eu-west-2:0:c17-quake-65-p12345-m67890-100")]
+
+    def test_get_registered_topics_empty(self, mock_conn):
+        """Checks an empty registry gives no topics."""
+        mock_conn.cursor.return_value.__enter__.return_value.fetchall.return_value = []
+        assert get_registered_topics(mock_conn) == []
+
+
+class TestSaveRegisteredTopics:
+    """A class that groups together tests for save_registered_topics()."""
+
+    def test_save_registered_topics_commits(self, mock_conn):
+        """Checks every topic is upserted with exact decimals and committed."""
+        topic = get_dict_from_topic("c17-quake-65-p12345-m67890-100", "arn:test")
+        save_registered_topics(mock_conn, [topic])
+        curs = mock_conn.cursor.return_value.__enter__.return_value
+        assert curs.executemany.call_args.args[1] == [
+            ("arn:test", Decimal("6.5"), Decimal("1.2345"), Decimal("-6.789"), 100)]
+        mock_conn.commit.assert_called_once()
+
+
+class TestSyncSubscriptions:
+    """A class that groups together tests for sync_subscriptions()."""
+
+    @patch("sync_subscriptions.get_client")
+    @patch("sync_subscriptions.get_topics")
+    @patch("sync_subscriptions.get_connection")
+    @patch("sync_subscriptions.get_registered_topics")
+    @patch("sync_subscriptions.save_registered_topics")
+    def test_sync_subscriptions_registers_topics(self, mock_save, mock_get_registered,
+                                                 mock_get_connection, mock_get_topics,
+                                                 mock_get_client):
+        """Checks every SNS topic is saved and only unregistered ones are counted."""
+        mock_get_topics.return_value = [{"topic_arn": "arn:a"}, {"topic_arn": "arn:b"}]
+        mock_get_registered.return_value = [{"topic_arn": "arn:a"}]
+        assert sync_subscriptions() == 1
+        mock_save.assert_called_once()
+        assert mock_save.call_args.args[1] == mock_get_topics.return_value
+
+    @patch("sync_subscriptions.get_client")
+    @patch("sync_subscriptions.get_topics")
+    @patch("sync_subscriptions.get_connection")
+    @patch("sync_subscriptions.get_registered_topics")
+    @patch("sync_subscriptions.save_registered_topics")
+    def test_sync_subscriptions_dry_run(self, mock_save, mock_get_registered,
+                                        mock_get_connection, mock_get_topics,
+                                        mock_get_client):
+        """Checks a dry run saves nothing."""
+        mock_get_topics.return_value = [{"topic_arn": "arn:a"}]
+        mock_get_registered.return_value = []
+        assert sync_subscriptions(dry_run=True) == 1
+        mock_save.assert_not_called()
@@ -5,6 +5,9 @@ from unittest.mock import MagicMock, patch
 from pandas import DataFrame
 from math import isclose
 from datetime import datetime
+from random import Random
+
+from psycopg import DatabaseError
 
 from topic import (
     get_topic_dictionaries,
@@ -12,10 +15,28 @@ from topic import (
     get_dict_from_topic,
     get_applicable_topics,
     get_topics,
-    is_point_in_circle
+    is_point_in_circle,
+    get_circle_bounds,
+    build_topic_index,
+    get_topic_index,
+    get_indexed_topics,
+    get_batch_topics,
+    get_topic_arrays,
+    get_subscription_topics
 )
 
 
+def make_topic(i, magnitude, latitude, longitude, radius):
+    return {"topic_arn": f"arn:test:{i}", "magnitude": magnitude,
+            "latitude": latitude, "longitude": longitude, "radius": radius}
+
+
+def make_row(magnitude, latitude, longitude):
+    return {"magnitude": magnitude, "latitude": latitude, "longitude": longitude,
+            "state_name": "Unknown State", "region_name": "Unknown",
+            "time": datetime(2023, 1, 1, 12, 0), "tsunami": False}
+
+
 class TestGetHaversineDistance:
     def test_get_haversine_distance(self):
         dist = get_haversine_distance(51.5074, -0.1278, 48.8566, 2.3522)
@@ -90,6 +111,61 @@ class TestGetTopics:
         assert isinstance(result, list)
         assert result[0]["topic_arn"] == "arn:test"
 
+    def test_get_topics_next_page(self):
+        sns_mock = MagicMock()
+        sns_mock.list_topics.side_effect = [
+            {"Topics": [{"TopicArn": "arn:aws:sns:eu-west-2:0:c17-quake-65-p12345-m67890-100"}],
+             "NextToken": "page-2"},
+            {"Topics": [{"TopicArn": "arn:aws:sns:eu-west-2:0:other-topic"},
+                        {"TopicArn": "arn:aws:sns:eu-west-2:0:c17-quake-30-m10000-p20000-50"}]}
+        ]
+        result = get_topics(sns_mock)
+        sns_mock.list_topics.assert_called_with(NextToken="page-2")
+        assert [topic["radius"] for topic in result] == [100, 50]
+
+
+class TestGetSubscriptionTopics:
+    @patch("topic.get_client")
+    @patch("topic.get_topics")
+    def test_lists_sns_by_default(self, mock_get_topics, mock_get_client):
+        mock_get_topics.return_value = [make_topic(0, 1.0, 0.0, 0.0, 10)]
+        assert get_subscription_topics() == mock_get_topics.return_value
+
+    @patch("topic.get_topics")
+    @patch("topic.get_connection")
+    @patch("topic.get_registered_topics")
+    def test_registry_is_reused(self, mock_get_registered, mock_get_connection,
+                                mock_get_topics, monkeypatch):
+        monkeypatch.setenv("TOPIC_SOURCE", "registry")
+        mock_get_registered.return_value = [make_topic(0, 1.0, 0.0, 0.0, 10)]
+        first = get_subscription_topics()
+        assert get_subscription_topics() is first
+        assert first == mock_get_registered.return_value
+        mock_get_registered.assert_called_once()
+        mock_get_topics.assert_not_called()
+
+    @patch("topic.get_connection")
+    @patch("topic.get_registered_topics")
+    def test_registry_is_reloaded_when_stale(self, mock_get_registered,
+                                             mock_get_connection, monkeypatch):
+        monkeypatch.setenv("TOPIC_SOURCE", "registry")
+        monkeypatch.setenv("TOPIC_REGISTRY_TTL", "0")
+        mock_get_registered.return_value = []
+        get_subscription_topics()
+        get_subscription_topics()
+        assert mock_get_registered.call_count == 2
+
+    @patch("topic.get_client")
+    @patch("topic.get_topics")
+    @patch("topic.get_connection")
+    @patch("topic.get_registered_topics")
+    def test_registry_falls_back_to_sns(self, mock_get_registered, mock_get_connection,
+                                        mock_get_topics, mock_get_client, monkeypatch):
+        monkeypatch.setenv("TOPIC_SOURCE", "registry")
+        mock_get_registered.side_effect = DatabaseError("relation does not exist")
+        mock_get_topics.return_value = [make_topic(0, 1.0, 0.0, 0.0, 10)]
+        assert get_subscription_topics() == mock_get_topics.return_value
+
 
 class TestGetTopicDictionaries:
     @patch("topic.get_client")
@@ -127,3 +203,125 @@ class TestGetTopicDictionaries:
         assert isinstance(result, list)
         assert len(result) == 1
         assert result[0]["state_name"] == "Tokyo"
+
+
+class TestGetCircleBounds:
+    def test_get_circle_bounds_contains_circle(self):
+        min_lat, max_lat, min_lon, max_lon = get_circle_bounds(60.0, 10.0, 500)
+        assert min_lat < 60.0 - 4.49 and max_lat > 60.0 + 4.49
+        assert get_haversine_distance(60.0, 10.0, 60.0, max_lon) > 500
+        assert get_haversine_distance(60.0, 10.0, 60.0, min_lon) > 500
+
+    def test_get_circle_bounds_reaching_pole(self):
+        assert get_circle_bounds(88.0, 10.0, 500)[2:] == (None, None)
+
+
+class TestIndexedTopics:
+    def test_matches_brute_force(self):
+        rng = Random(11)
+        topics = [make_topic(i, rng.randint(0, 70) / 10,
+                             rng.uniform(-90, 90), rng.uniform(-180, 180),
+                             rng.choice([10, 100, 500, 2000, 8000, 25000]))
+                  for i in range(200)]
+        index = build_topic_index(topics, {"cell_size": 0.5, "levels": 4, "max_cells": 16})
+        for _ in range(100):
+            row = make_row(rng.randint(0, 80) / 10,
+                           rng.uniform(-90, 90), rng.uniform(-180, 180))
+            assert get_indexed_topics(index, topics, row) == \
+                get_applicable_topics(topics, row)
+
+    def test_matches_across_antimeridian(self):
+        topics = [make_topic(0, 1.0, -17.7, 179.9, 200)]
+        index = build_topic_index(topics, {"cell_size": 0.5, "levels": 5, "max_cells": 64})
+        result = get_indexed_topics(index, topics, make_row(5.0, -17.5, -179.5))
+        assert [alert["topic_arn"] for alert in result] == ["arn:test:0"]
+
+    def test_matches_across_pole(self):
+        topics = [make_topic(0, 1.0, 89.0, 0.0, 300)]
+        index = build_topic_index(topics, {"cell_size": 0.5, "levels": 5, "max_cells": 64})
+        result = get_indexed_topics(index, topics, make_row(5.0, 89.0, 180.0))
+        assert [alert["topic_arn"] for alert in result] == ["arn:test:0"]
+
+    def test_skips_smaller_magnitudes(self):
+        topics = [make_topic(0, 4.0, 35.0, 139.0, 500),
+                  make_topic(1, 6.0, 35.0, 139.0, 500)]
+        index = build_topic_index(topics, {"cell_size": 0.5, "levels": 5, "max_cells": 64})
+        result = get_indexed_topics(index, topics, make_row(5.0, 35.01, 139.01))
+        assert [alert["topic_arn"] for alert in result] == ["arn:test:0"]
+
+    def test_no_match_for_missing_values(self):
+        topics = [make_topic(0, 1.0, 35.0, 139.0, 500)]
+        index = build_topic_index(topics)
+        assert get_indexed_topics(index, topics, make_row(float("nan"), 35.0, 139.0)) == []
+
+    def test_wide_topics_are_checked_everywhere(self):
+        topics = [make_topic(0, 1.0, 0.0, 0.0, 21000)]
+        index = build_topic_index(topics, {"cell_size": 0.5, "levels": 2, "max_cells": 64})
+        assert index["buckets"][0][1]["wide"] == [0]
+        assert len(get_indexed_topics(index, topics, make_row(5.0, -45.0, 120.0))) == 1
+
+    def test_get_topic_index_reuses_index(self):
+        topics = [make_topic(0, 1.0, 35.0, 139.0, 500)]
+        assert get_topic_index(topics) is get_topic_index(topics)
+        assert get_topic_index(topics) is not get_topic_index(list(topics))
+
+    def test_get_topic_dictionaries_with_index(self, monkeypatch):
+        topics = [make_topic(0, 4.0, 35.0, 139.0, 500),
+                  make_topic(1, 1.0, -33.9, 151.2, 100)]
+        data = DataFrame([make_row(5.0, 35.01, 139.01), make_row(2.0, -33.8, 151.3),
+                          make_row(7.0, 0.0, 0.0)])
+        brute = get_topic_dictionaries(data, topics)
+        monkeypatch.setenv("TOPIC_MATCHER", "index")
+        assert get_topic_dictionaries(data, topics) == brute
+        assert len(brute) == 2
+
+
+class TestBatchTopics:
+    def test_matches_brute_force(self):
+        rng = Random(12)
+        topics = [make_topic(i, rng.randint(0, 70) / 10,
+                             rng.uniform(-90, 90), rng.uniform(-180, 180),
+                             rng.choice([0, 10, 100, 500, 2000, 8000, 25000]))
+                  for i in range(200)]
+        data = DataFrame([make_row(rng.choice([rng.randint(0, 80) / 10, float("nan")]),
+                                   rng.uniform(-90, 90), rng.uniform(-180, 180))
+                          for _ in range(100)])
+        brute = []
+        for _, row in data.iterrows():
+            brute.extend(get_applicable_topics(topics, row.to_dict()))
+        for chunk_pairs in [1, 1000, 1_000_000]:
+            assert get_batch_topics(data, topics, {"chunk_pairs": chunk_pairs}) == brute
+
+    def test_matches_on_radius(self):
+        rng = Random(13)
+        rows, topics = [], []
+        for i in range(50):
+            row = make_row(5.0, rng.uniform(-89, 89), rng.uniform(-180, 180))
+            latitude, longitude = rng.uniform(-89, 89), rng.uniform(-180, 180)
+            radius = get_haversine_distance(row["latitude"], row["longitude"],
+                                            latitude, longitude)
+            rows.append(row)
+            topics.append(make_topic(i, 1.0, latitude, longitude, radius))
+        data = DataFrame(rows)
+        brute = []
+        for _, row in data.iterrows():
+            brute.extend(get_applicable_topics(topics, row.to_dict()))
+        assert len(brute) >= 50
+        assert get_batch_topics(data, topics) == brute
+
+    def test_no_topics(self):
+        assert get_batch_topics(DataFrame([make_row(5.0, 0.0, 0.0)]), []) == []
+
+    def test_get_topic_arrays_reuses_arrays(self):
+        topics = [make_topic(0, 1.0, 35.0, 139.0, 500)]
+        assert get_topic_arrays(topics) is get_topic_arrays(topics)
+
+    def test_get_topic_dictionaries_with_batch(self, monkeypatch):
+        topics = [make_topic(0, 4.0, 35.0, 139.0, 500),
+                  make_topic(1, 1.0, -33.9, 151.2, 100)]
+        data = DataFrame([make_row(5.0, 35.01, 139.01), make_row(2.0, -33.8, 151.3),
+                          make_row(7.0, 0.0, 0.0)])
+        brute = get_topic_dictionaries(data, topics)
+        monkeypatch.setenv("TOPIC_MATCHER", "batch")
+        assert get_topic_dictionaries(data, topics) == brute
+        assert len(brute) == 2
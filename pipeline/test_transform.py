@@ -2,8 +2,11 @@
 
 """Unit tests for the functions in extract.py."""
 
+from unittest.mock import patch
+
 from transform import (is_event_clean, make_row_for_dataframe, clean_earthquake_data,
-                       grab_state, get_region_from_state, create_dataframe_expected_for_load)
+                       grab_state, get_region_from_state, create_dataframe_expected_for_load,
+                       transform)
 
 
 class TestIsEventClean:
@@ -110,3 +113,41 @@ class TestCreateDataFrameExpectedForLoad:
                    "net", "dmin", "alert", "location_source",
                    "magnitude_type", "state_name", "region_name"
                 }.issubset(create_dataframe_expected_for_load().columns)
+
+    def test_create_dataframe_expected_for_load_dtypes(self):
+        df = create_dataframe_expected_for_load({
+            "earthquake_id": [["ci1"], ["ci2"]], "magnitude": [0.53, None],
+            "latitude": ["33.6663333", "10"], "longitude": ["-116.771", "20"],
+            "time": [1749655031680, 1749655031681],
+            "updated": [1749675581157, 1749675581158], "depth": ["15.81", "1"],
+            "url": ["a.com", "b.com"], "felt": [None, 3], "tsunami": [0, 1],
+            "cdi": [None, 2.5], "mmi": [None, None], "nst": [15, None],
+            "sig": [4, 10], "net": ["ci", "ci"], "dmin": [0.06854, None],
+            "alert": [None, "green"], "location_source": [["ci"], ["ci"]],
+            "magnitude_type": ["ml", "md"], "state_name": ["California", "Nevada"],
+            "region_name": ["West Coast", "Southwest"]})
+        assert df["latitude"].dtype == "float64"
+        assert df["latitude"][0] == 33.6663333
+        assert df["time"].dtype == "Int64"
+        assert df["nst"].isna().tolist() == [False, True]
+        assert df["tsunami"].tolist() == [False, True]
+        assert df["net"].dtype == "category"
+        assert df["alert"].cat.categories.tolist() == ["green"]
+        assert df["earthquake_id"][0] == ["ci1"]
+
+
+class TestTransform:
+
+    def test_transform_builds_one_row_per_clean_event(self, example_detailed_event):
+        with patch("transform.get_address",
+                   return_value=["California", "United States"]):
+            df = transform([example_detailed_event, {"bad": "event"},
+                            example_detailed_event])
+        assert len(df) == 2
+        assert df["state_name"].tolist() == ["California", "California"]
+        assert df["magnitude_type"].dtype == "category"
+
+    def test_transform_no_events(self):
+        df = transform([])
+        assert df.empty
+        assert list(df.columns) == list(create_dataframe_expected_for_load().columns)
@@ -3,11 +3,18 @@
 from datetime import datetime
 from pytz import timezone
 from logging import getLogger, basicConfig
-from math import radians, cos, sin, sqrt, atan2
+from time import monotonic
+from math import radians, degrees, cos, sin, asin, sqrt, atan2, floor, isfinite
+from os import environ as ENV
 from re import search
 
 from pandas import DataFrame
 from boto3 import client
+from psycopg import DatabaseError
+import numpy as np
+
+from load import get_connection
+from subscription_registry import get_registered_topics
 
 logger = getLogger(__name__)
 
@@ -17,6 +24,19 @@ basicConfig(
     datefmt="%Y-%m-%dT%H:%M:%S"
 )
 
+EARTH_RADIUS_KM = 6371.0
+# Padding around each circle's cell range, so rounding never loses a match.
+INDEX_MARGIN_DEGREES = 0.01
+# Batched separations this close to a radius are checked again with the scalar distance.
+BATCH_RELATIVE_TOLERANCE = 1e-9
+BATCH_ABSOLUTE_TOLERANCE = 1e-12
+
+# The last index and arrays built, reused while the same topics are matched again.
+topic_index_cache = {}
+topic_array_cache = {}
+# Registered topics, kept across warm invocations until they are too old.
+registry_cache = {}
+
 
 def get_client() -> client:
     """Return AWS SNS client"""
@@ -29,7 +49,7 @@ def get_haversine_distance(lat1, lon1, lat2, lon2):
     on the Earth (specified in decimal degrees).
     Returns distance in kilometers.
     """
-    r = 6371.0
+    r = EARTH_RADIUS_KM
 
     phi1 = radians(lat1)
     phi2 = radians(lat2)
@@ -55,6 +75,24 @@ def is_point_in_circle(point_lat, point_lon, center_lat, center_lon, radius_km):
     return distance <= radius_km
 
 
+def get_alert_values(row: dict) -> dict:
+    """Returns the values sent to every topic alerted about this row of data."""
+    return {
+        "magnitude": row["magnitude"],
+        "state_name": row["state_name"],
+        "region_name": row["region_name"],
+        "time": row['time'].strftime(r"%Y-%m-%d %H:%M"),
+        "tsunami": row["tsunami"],
+        "latitude": row["latitude"],
+        "longitude": row["longitude"]
+    }
+
+
+def make_alert(topic: dict, values: dict) -> dict:
+    """Returns the alert sent to a topic with the values from get_alert_values."""
+    return {"topic_arn": topic["topic_arn"], **values}
+
+
 def get_applicable_topics(topics: list[dict], row: dict) -> list[dict]:
     """Returns any topics that apply to this row of data."""
     subscribed_topics = []
@@ -71,19 +109,225 @@ def get_applicable_topics(topics: list[dict], row: dict) -> list[dict]:
             if is_point_in_circle(target_lat, target_long, centre_lat,
                                   centre_long, centre_radius):
                 logger.info("Found topic with matching location...")
-                subscribed_topics.append({
-                    "topic_arn": t["topic_arn"],
-                    "magnitude": target_mag,
-                    "state_name": row["state_name"],
-                    "region_name": row["region_name"],
-                    "time": row['time'].strftime(r"%Y-%m-%d %H:%M"),
-                    "tsunami": row["tsunami"],
-                    "latitude": target_lat,
-                    "longitude": target_long
-                })
+                subscribed_topics.append(make_alert(t, get_alert_values(row)))
     return subscribed_topics
 
 
+def get_index_settings() -> dict:
+    """Returns the topic index settings, which can be overridden in the environment."""
+    return {
+        "cell_size": float(ENV.get("TOPIC_INDEX_CELL_SIZE", 0.5)),
+        "levels": int(ENV.get("TOPIC_INDEX_LEVELS", 5)),
+        "max_cells": int(ENV.get("TOPIC_INDEX_MAX_CELLS", 64))
+    }
+
+
+def get_circle_bounds(lat: float, lon: float,
+                      radius: float) -> tuple[float, float, float | None, float | None]:
+    """
+    Return the latitude and longitude ranges containing a circle,
+    without a longitude range when the circle reaches a pole.
+    """
+    angle = radius / EARTH_RADIUS_KM
+    d_lat = degrees(angle) + INDEX_MARGIN_DEGREES
+    min_lat, max_lat = lat - d_lat, lat + d_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90), min(max_lat, 90), None, None
+    d_lon = degrees(asin(sin(angle) / cos(radians(lat)))) + INDEX_MARGIN_DEGREES
+    return min_lat, max_lat, lon - d_lon, lon + d_lon
+
+
+def get_index_levels(settings: dict) -> list[tuple[int, int]]:
+    """Return the rows and columns of each grid, each four times coarser than the last."""
+    levels = []
+    for level in range(settings["levels"]):
+        cell_size = settings["cell_size"] * 4 ** level
+        levels.append((max(1, round(180 / cell_size)), max(1, round(360 / cell_size))))
+    return levels
+
+
+def get_cell_row(lat: float, rows: int) -> int:
+    """Return the grid row of a latitude."""
+    return min(rows - 1, max(0, floor((lat + 90) * rows / 180)))
+
+
+def get_cell_column(lon: float, columns: int) -> int:
+    """Return the grid column of a longitude, wrapping around the antimeridian."""
+    return floor((lon + 180) * columns / 360) % columns
+
+
+def get_grid_cells(bounds: tuple, rows: int, columns: int) -> list[tuple[int, int]]:
+    """Return the cells of a grid that overlap the bounds from get_circle_bounds."""
+    min_lat, max_lat, min_lon, max_lon = bounds
+    cell_rows = range(get_cell_row(min_lat, rows), get_cell_row(max_lat, rows) + 1)
+    if min_lon is None:
+        cell_columns = range(columns)
+    else:
+        first = floor((min_lon + 180) * columns / 360)
+        last = floor((max_lon + 180) * columns / 360)
+        cell_columns = range(columns) if last - first + 1 >= columns \
+            else [column % columns for column in range(first, last + 1)]
+    return [(row, column) for row in cell_rows for column in cell_columns]
+
+
+def get_circle_cells(lat: float, lon: float, radius: float,
+                     levels: list[tuple[int, int]], max_cells: int) -> list[tuple] | None:
+    """
+    Return the cells a circle could reach on the finest grid
+    where it spans at most two rows and max_cells cells,
+    or None when no grid is coarse enough.
+    """
+    if not -90 <= lat <= 90:
+        return None
+    bounds = get_circle_bounds(lat, lon, radius)
+    for level, (rows, columns) in enumerate(levels):
+        if (bounds[1] - bounds[0]) * rows > 360 and level < len(levels) - 1:
+            continue
+        cells = get_grid_cells(bounds, rows, columns)
+        if len(cells) <= max_cells:
+            return [(level, row, column) for row, column in cells]
+    return None
+
+
+def build_topic_index(topics: list[dict], settings: dict | None = None) -> dict:
+    """
+    Return the positions of topics grouped by minimum magnitude,
+    each group holding the topics whose circle could reach each cell
+    of a grid sized to the circle.
+    Topics reaching too many cells are kept aside to check against every earthquake.
+    """
+    settings = settings or get_index_settings()
+    levels = get_index_levels(settings)
+    buckets = {}
+    for position, t in enumerate(topics):
+        bucket = buckets.setdefault(t["magnitude"], {"cells": {}, "wide": []})
+        cells = get_circle_cells(t["latitude"], t["longitude"], t["radius"],
+                                 levels, settings["max_cells"])
+        if cells is None:
+            bucket["wide"].append(position)
+            continue
+        for cell in cells:
+            bucket["cells"].setdefault(cell, []).append(position)
+    logger.info("Indexed %s topics in %s magnitude buckets.", len(topics), len(buckets))
+    return {"levels": levels,
+            "buckets": sorted(buckets.items(), key=lambda bucket: bucket[0])}
+
+
+def get_topic_index(topics: list[dict]) -> dict:
+    """Return the index of these topics, only building it when the topics change."""
+    if topic_index_cache.get("topics") is not topics:
+        topic_index_cache["index"] = build_topic_index(topics)
+        topic_index_cache["topics"] = topics
+    return topic_index_cache["index"]
+
+
+def get_indexed_topics(index: dict, topics: list[dict], row: dict) -> list[dict]:
+    """
+    Returns the same topics as get_applicable_topics, only checking
+    those in magnitude buckets the row reaches and in the row's grid cells.
+    """
+    target_mag = row["magnitude"]
+    target_lat = row["latitude"]
+    target_long = row["longitude"]
+    if not (isfinite(target_mag) and isfinite(target_lat) and isfinite(target_long)):
+        return []
+    cells = [(level, get_cell_row(target_lat, rows), get_cell_column(target_long, columns))
+             for level, (rows, columns) in enumerate(index["levels"])]
+    positions = []
+    for min_mag, bucket in index["buckets"]:
+        if not target_mag >= min_mag:
+            break
+        candidates = bucket["wide"].copy()
+        for cell in cells:
+            candidates.extend(bucket["cells"].get(cell, []))
+        for position in candidates:
+            t = topics[position]
+            if get_haversine_distance(target_lat, target_long, t["latitude"],
+                                      t["longitude"]) <= t["radius"]:
+                positions.append(position)
+    if not positions:
+        return []
+    values = get_alert_values(row)
+    return [make_alert(topics[position], values) for position in sorted(positions)]
+
+
+def get_batch_settings() -> dict:
+    """Returns the batch matcher settings, which can be overridden in the environment."""
+    return {"chunk_pairs": int(ENV.get("TOPIC_BATCH_PAIRS", 1_000_000))}
+
+
+def get_unit_vectors(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Return points on the unit sphere for latitudes and longitudes in degrees."""
+    phi = np.radians(lats)
+    lam = np.radians(lons)
+    return np.stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)], axis=1)
+
+
+def get_topic_arrays(topics: list[dict]) -> dict:
+    """
+    Return the topics as arrays, only building them when the topics change.
+    Each radius is kept as the haversine of its central angle,
+    so it can be compared with separations without any trigonometry.
+    """
+    if topic_array_cache.get("topics") is not topics:
+        radii = np.array([t["radius"] for t in topics], dtype=float)
+        angles = radii / EARTH_RADIUS_KM
+        topic_array_cache["arrays"] = {
+            "magnitude": np.array([t["magnitude"] for t in topics], dtype=float),
+            "vectors": get_unit_vectors(
+                np.array([t["latitude"] for t in topics], dtype=float),
+                np.array([t["longitude"] for t in topics], dtype=float)),
+            "threshold": np.where(radii < 0, -1.0,
+                                  np.where(angles >= np.pi, 1.0, np.sin(angles / 2) ** 2))
+        }
+        topic_array_cache["topics"] = topics
+    return topic_array_cache["arrays"]
+
+
+def get_batch_topics(data: DataFrame, topics: list[dict],
+                     settings: dict | None = None) -> list[dict]:
+    """
+    Returns the same alerts as checking every row with get_applicable_topics,
+    comparing chunks of rows with every topic at once.
+    The haversine of the angle between a row and a topic centre is (1 - cos) / 2,
+    with the cosine taken from the dot product of their unit vectors.
+    Pairs too close to a radius for that to be certain are checked again
+    with get_haversine_distance.
+    """
+    settings = settings or get_batch_settings()
+    if data.empty or not topics:
+        return []
+    arrays = get_topic_arrays(topics)
+    mags = data["magnitude"].to_numpy(dtype=float, na_value=np.nan)
+    lats = data["latitude"].to_numpy(dtype=float, na_value=np.nan)
+    lons = data["longitude"].to_numpy(dtype=float, na_value=np.nan)
+    vectors = get_unit_vectors(lats, lons)
+    threshold = arrays["threshold"]
+    tolerance = BATCH_RELATIVE_TOLERANCE * np.abs(threshold) + BATCH_ABSOLUTE_TOLERANCE
+    chunk = max(1, settings["chunk_pairs"] // len(topics))
+
+    alerts = []
+    for first in range(0, len(data), chunk):
+        last = first + chunk
+        with np.errstate(invalid="ignore"):
+            separations = (1 - vectors[first:last] @ arrays["vectors"].T) / 2
+            reached = mags[first:last, np.newaxis] >= arrays["magnitude"]
+            matches = reached & (separations <= threshold)
+            borderline = reached & (np.abs(separations - threshold) <= tolerance)
+        for row, position in zip(*(indices.tolist() for indices in np.nonzero(borderline))):
+            t = topics[position]
+            matches[row, position] = get_haversine_distance(
+                lats[first + row], lons[first + row],
+                t["latitude"], t["longitude"]) <= t["radius"]
+
+        values = {}
+        for row, position in zip(*(indices.tolist() for indices in np.nonzero(matches))):
+            if row not in values:
+                values[row] = get_alert_values(data.iloc[first + row].to_dict())
+            alerts.append(make_alert(topics[position], values[row]))
+    return alerts
+
+
 def get_topics(sns_client: client) -> list[dict]:
     """Return list of topic arns and names on SNS filtered for earthquake project."""
     arns = []
@@ -93,7 +337,7 @@ def get_topics(sns_client: client) -> list[dict]:
     arns = response.get('Topics')
     logger.info("Found SNS Topics: %s", arns)
     while next_token:
-        response = sns_client.list_topics(next_token)
+        response = sns_client.list_topics(NextToken=next_token)
         next_token = response.get('NextToken', None)
         arns.extend(response.get('Topics'))
     for topic in arns:
@@ -106,6 +350,30 @@ def get_topics(sns_client: client) -> list[dict]:
     return topics
 
 
+def get_registry_ttl() -> float:
+    """Return the seconds registered topics are reused for before loading them again."""
+    return float(ENV.get("TOPIC_REGISTRY_TTL", 300))
+
+
+def get_subscription_topics() -> list[dict]:
+    """
+    Return the subscription topics to match earthquakes against.
+    With TOPIC_SOURCE=registry they are loaded from the database in one query
+    and reused while they are fresh, falling back to listing SNS if that fails.
+    """
+    if ENV.get("TOPIC_SOURCE") == "registry":
+        if registry_cache and monotonic() - registry_cache["loaded"] < get_registry_ttl():
+            return registry_cache["topics"]
+        try:
+            with get_connection() as conn:
+                topics = get_registered_topics(conn)
+            registry_cache.update({"topics": topics, "loaded": monotonic()})
+            return topics
+        except DatabaseError as e:
+            logger.warning("Could not read subscription registry, listing SNS topics: %s", e)
+    return get_topics(get_client())
+
+
 def get_dict_from_topic(name: str, arn: str) -> list[dict]:
     """Return dictionary from topic with seperated information."""
     parts = name.split("-")
@@ -120,14 +388,27 @@ def get_dict_from_topic(name: str, arn: str) -> list[dict]:
     }
 
 
-def get_topic_dictionaries(data: DataFrame) -> list[dict]:
-    """Return topic strings and value list for sending alerts."""
+def get_topic_dictionaries(data: DataFrame, topics: list[dict] | None = None) -> list[dict]:
+    """
+    Return topic strings and value list for sending alerts,
+    finding the subscription topics unless they are given.
+    With TOPIC_MATCHER=index only topics near each earthquake are checked,
+    and with TOPIC_MATCHER=batch every earthquake is checked at once in arrays.
+    """
     output_topics = []
-    sns_client = get_client()
-    topics = get_topics(sns_client)
+    if topics is None:
+        topics = get_subscription_topics()
     logger.info("Extracted info from topics: %s", topics)
+    if ENV.get("TOPIC_MATCHER") == "batch":
+        output_topics = get_batch_topics(data, topics)
+        logger.info("Found subscriber topics: %s", output_topics)
+        return output_topics
+    index = get_topic_index(topics) if ENV.get("TOPIC_MATCHER") == "index" else None
     for _, row in data.iterrows():
-        target_topics = get_applicable_topics(topics, row.to_dict())
+        if index is None:
+            target_topics = get_applicable_topics(topics, row.to_dict())
+        else:
+            target_topics = get_indexed_topics(index, topics, row.to_dict())
         logger.info("Found subscriber topics: %s", target_topics)
         if target_topics:
             output_topics.extend(target_topics)
@@ -3,6 +3,7 @@ Transforms a dataframe into a format appropriate for loading into the database.
 """
 import logging
 from datetime import datetime, timedelta
+from functools import cache
 from os import environ as ENV
 
 import pandas as pd
@@ -10,6 +11,8 @@ from dotenv import load_dotenv
 from opencage.geocoder import OpenCageGeocode
 
 from extract import extract
+from geocode import get_cached_address, cache_address, get_cache_stats
+from offline_geocoder import get_offline_address
 
 
 logger = logging.getLogger(__name__)
@@ -20,6 +23,19 @@ logging.basicConfig(
     datefmt="%Y-%m-%dT%H:%M:%S"
 )
 
+LOAD_COLUMNS = ["earthquake_id", "magnitude", "latitude", "longitude", "time",
+                "updated", "depth", "url", "felt", "tsunami", "cdi", "mmi",
+                "nst", "sig", "net", "dmin", "alert", "location_source",
+                "magnitude_type", "state_name", "region_name"]
+
+# Columns not listed here are left as objects.
+COLUMN_DTYPES = {"magnitude": "float64", "latitude": "float64",
+                 "longitude": "float64", "time": "Int64", "updated": "Int64",
+                 "depth": "float64", "felt": "Int64", "tsunami": "boolean",
+                 "cdi": "float64", "mmi": "float64", "nst": "Int64",
+                 "sig": "Int64", "net": "category", "dmin": "float64",
+                 "alert": "category", "magnitude_type": "category"}
+
 
 def is_event_in_correct_format(potential_event: dict) -> bool:
     """Checks that a potential event is a dictionary with the expected keys."""
@@ -69,28 +85,49 @@ def clean_earthquake_data(earthquake_data: list[dict]) -> list[dict]:
     return clean_events
 
 
+@cache
+def get_geocoder() -> OpenCageGeocode:
+    """Returns an OpenCage client that is reused between lookups."""
+    return OpenCageGeocode(key=ENV["GEO_API_KEY"])
+
+
 def get_address(latitude: float, longitude: float) -> list[str]:
-    """Uses OpenCage to convert coordinates into an address."""
+    """
+    Converts coordinates into an address,
+    trying the offline geocoder (if enabled) and
+    the geocode cache before using OpenCage.
+    """
+    if ENV.get("GEOCODER") == "offline":
+        address = get_offline_address(latitude, longitude)
+        if address:
+            return address
+
+    address = get_cached_address(latitude, longitude)
+    if address:
+        return address
+
     logger.info("Finding address for %s, %s using OpenCage.",
                 latitude, longitude)
     try:
-        geocoder = OpenCageGeocode(key=ENV["GEO_API_KEY"])
-        results = geocoder.reverse_geocode(
+        results = get_geocoder().reverse_geocode(
             latitude, longitude, no_annotations=1, limit=1)
         if results and len(results):
             components = results[0]["components"]
             country = components.get("country", "No Country")
             state = components.get("state", "Unknown State")
-            return [state, country]
+            address = [state, country]
         else:
             logger.warning("No results from OpenCage for %s, %s",
                            latitude, longitude)
-            return ["Unknown", "No Country"]
+            address = ["Unknown", "No Country"]
     except Exception as e:
         logger.error("OpenCage error for coords (%s, %s): %s",
                      latitude, longitude, e)
         return ["Unknown", "No Country"]
 
+    cache_address(latitude, longitude, address)
+    return address
+
 
 def grab_state(address: list[str]) -> str:
     """Finds a state in an address."""
@@ -233,16 +270,30 @@ def make_row_for_dataframe(event: dict) -> list:
     return df_row
 
 
-def create_dataframe_expected_for_load() -> pd.DataFrame:
+def make_column_buffers() -> dict[str, list]:
+    """Returns an empty list for each column expected by the load script."""
+    return {column: [] for column in LOAD_COLUMNS}
+
+
+def create_dataframe_expected_for_load(
+        buffers: dict[str, list] | None = None) -> pd.DataFrame:
     """
-    Creates a dataframe with the columns expected for the load script.
+    Creates a dataframe with the columns expected for the load script,
+    built in one go from column buffers with the dtype of each column.
     """
-    return pd.DataFrame(columns=["earthquake_id", "magnitude", "latitude",
-                        "longitude", "time", "updated", "depth", "url",
-                                 "felt", "tsunami", "cdi", "mmi", "nst", "sig",
-                                 "net", "dmin", "alert", "location_source",
-                                 "magnitude_type", "state_name", "region_name"
-                                 ])
+    if buffers is None:
+        buffers = make_column_buffers()
+
+    columns = {}
+    for column in LOAD_COLUMNS:
+        values = buffers[column]
+        dtype = COLUMN_DTYPES.get(column, "object")
+        if dtype in ("float64", "Int64"):
+            columns[column] = pd.to_numeric(
+                pd.Series(values, dtype="object"), errors="coerce").astype(dtype)
+        else:
+            columns[column] = pd.Series(values, dtype=dtype)
+    return pd.DataFrame(columns)
 
 
 def transform(data_from_extract: list[dict]) -> pd.DataFrame:
@@ -250,12 +301,15 @@ def transform(data_from_extract: list[dict]) -> pd.DataFrame:
 
     earthquakes = clean_earthquake_data(data_from_extract)
 
-    df = create_dataframe_expected_for_load()
-
-    for i in range(len(earthquakes)):
+    buffers = make_column_buffers()
+    for earthquake in earthquakes:
+        row = make_row_for_dataframe(earthquake)
+        for column, value in zip(LOAD_COLUMNS, row):
+            buffers[column].append(value)
 
-        df.loc[i] = make_row_for_dataframe(earthquakes[i])
+    df = create_dataframe_expected_for_load(buffers)
 
+    logger.info("Geocode cache stats: %s", get_cache_stats())
     return df
 
 